@@ -1,11 +1,12 @@
 from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
 import json
 import sys
 import os
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from lib.feishu import get_feishu_token, get_all_batches
+from lib.batch_cache import get_batch_list_cache, not_modified, cache_headers
 
 
 class handler(BaseHTTPRequestHandler):
@@ -13,46 +14,34 @@ class handler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match, If-Modified-Since')
         self.end_headers()
 
     def do_GET(self):
         try:
-            token = get_feishu_token()
-            batches = get_all_batches(token)
-
-            pending = []
-            completed = []
-
-            for b in batches:
-                batch_info = {
-                    "batch": b["batch"],
-                    "record_id": b["record_id"],
-                    "coze_run": b["coze_run"],
-                    "result": b["coze_result"] or ""
-                }
-
-                if b["coze_run"] and not b["coze_result"]:
-                    batch_info["status"] = "pending"
-                    pending.append(batch_info)
-                elif b["coze_result"]:
-                    batch_info["status"] = "completed"
-                    completed.append(batch_info)
-                else:
-                    batch_info["status"] = "idle"
-                    pending.append(batch_info)
+            # ?refresh=1 跳过缓存（处理完批次后面板立即刷新时使用）
+            force = parse_qs(urlsplit(self.path).query).get("refresh", ["0"])[0] == "1"
+            entry = get_batch_list_cache().get(force=force)
+
+            if not force and not_modified(entry, self.headers.get('If-None-Match'),
+                                          self.headers.get('If-Modified-Since')):
+                self.send_response(304)
+                for name, value in cache_headers(entry).items():
+                    self.send_header(name, value)
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.send_header('Access-Control-Expose-Headers', 'ETag, Last-Modified')
+                self.end_headers()
+                return
 
             self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(entry["body"])))
+            for name, value in cache_headers(entry).items():
+                self.send_header(name, value)
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Access-Control-Expose-Headers', 'ETag, Last-Modified')
             self.end_headers()
-            response = {
-                "success": True,
-                "pending": pending,
-                "completed": completed,
-                "total": len(batches)
-            }
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            self.wfile.write(entry["body"])
 
         except Exception as e:
             self.send_response(500)
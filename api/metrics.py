@@ -0,0 +1,20 @@
+from http.server import BaseHTTPRequestHandler
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from lib import metrics
+# 导入各模块以注册其指标和采集回调
+from lib import feishu, yunwu
+
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', metrics.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
@@ -1,16 +1,157 @@
 from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
 import json
 import sys
 import os
+import threading
+import time
 from datetime import datetime
+from typing import Callable, Dict
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from lib.feishu import (
-    get_feishu_token, get_products_by_batch,
-    write_to_output_table, update_batch_result
-)
-from lib.yunwu import generate_product_title
+from lib.feishu import get_feishu_token, update_batch_result, ProductStream
+from lib.engine import generate_titles, clamp_concurrency
+from lib.cache import cache_stats
+from lib.yunwu import concurrency_stats
+from lib.config import TITLE_BATCH_SIZE
+from lib.writer import StreamingWriter
+from lib.journal import resume_stream, record_generated, record_written, finish_batch, item_key
+from lib.batch_cache import get_batch_list_cache
+from lib.sse import EventStream, SSE_HEADERS
+from lib.metrics import record_batch
+from lib.concurrency import flow
+from lib.progress import get_progress_reporter
+from lib import trace
+
+
+def process_batch(data: Dict, emit: Callable[[str, Dict], None]) -> Dict:
+    """处理一个批次，过程中以 emit(事件名, 内容) 报告进度，返回汇总结果
+
+    事件: start（开始，含待生成数）、product（每个产品完成时按完成顺序推送结果和累计吞吐）、written（每次写入表2后）
+    设置 TRACE_DIR 时为该批次写出 trace 文件，路径在结果的 trace 字段中。
+    """
+    # 本地多个请求同时处理不同批次时，按批次公平分配云雾API并发名额
+    with trace.trace_batch(data.get("batch")) as recorder, flow(data.get("batch") or "default"):
+        result = _process_batch(data, emit)
+    if recorder is not None and recorder.path:
+        result["trace"] = recorder.path
+    return result
+
+
+def _process_batch(data: Dict, emit: Callable[[str, Dict], None]) -> Dict:
+    batch_num = data.get("batch")
+    record_id = data.get("record_id")
+
+    token = get_feishu_token()
+    # 逐页拉取产品：第一页返回即开始生成，后台同时预取下一页
+    products = ProductStream(token, batch_num)
+    with trace.span("fetch_products"):
+        product_count = products.total
+
+    if not product_count:
+        return {
+            "success": False,
+            "message": "没有找到该批次的产品",
+            "batch": batch_num
+        }
+
+    concurrency = clamp_concurrency(data.get("concurrency"))
+    try:
+        batch_size = max(1, int(data.get("batch_size") or TITLE_BATCH_SIZE))
+    except (TypeError, ValueError):
+        batch_size = TITLE_BATCH_SIZE
+
+    # 按断点日志跳过上次已写入的产品（上次调用超时后重新调用即可继续）
+    with trace.span("resume"):
+        plan, pending_products = resume_stream(batch_num, products)
+    results = list(plan["generated"])
+    pending = max(0, product_count - plan["written"] - len(plan["generated"]))
+    written = [plan["written"]]
+    started = time.perf_counter()
+    emit("start", {
+        "batch": batch_num,
+        "total": product_count,
+        "pending": pending,
+        "resumed": plan["written"] + len(plan["generated"]),
+        "concurrency": concurrency,
+        "batch_size": batch_size
+    })
+
+    def on_written(records):
+        record_written(batch_num, records)
+        written[0] += len(records)
+        emit("written", {"count": len(records), "written": written[0], "total": product_count})
+
+    writer = StreamingWriter(token, on_written=on_written)
+    for record in plan["generated"]:
+        writer.add(record["asin"], record["product_name"], record["item"])
+    # 处理中定时把进度写入表3
+    reporter = get_progress_reporter()
+    reporter.start(record_id, product_count, plan["written"] + len(plan["generated"]))
+    done = [0]
+    lock = threading.Lock()
+
+    def on_complete(outcome):
+        # 每个产品完成时（于工作线程中）立即推送并交给写入线程，不等排在前面的慢产品
+        log = {
+            "index": outcome["index"],
+            "asin": outcome["asin"],
+            "status": outcome["status"],
+            "latency": outcome["latency"]
+        }
+        if outcome["title"]:
+            log["title_length"] = len(outcome["title"])
+            record_generated(batch_num, item_key(outcome), outcome["title"])
+            writer.add(outcome["asin"], outcome["title"], item_key(outcome))
+        else:
+            log["error"] = outcome["error"][:100]
+        reporter.advance(record_id)
+        # 加锁推送，保证事件中的 done 递增
+        with lock:
+            if outcome["title"]:
+                results.append({
+                    "asin": outcome["asin"],
+                    "product_name": outcome["title"]
+                })
+            done[0] += 1
+            elapsed = time.perf_counter() - started
+            log.update({"done": done[0], "pending": pending, "rate": round(done[0] / elapsed, 2) if elapsed else 0.0})
+            emit("product", log)
+
+    # 生成的同时在后台写入表2，函数超时前已生成的标题不会丢失
+    try:
+        with trace.span("generate", products=pending, concurrency=concurrency):
+            generate_titles(pending_products, concurrency=concurrency, batch_size=batch_size, on_complete=on_complete)
+    finally:
+        with trace.span("writer.close"):
+            success_count = plan["written"] + writer.close()
+        reporter.finish(record_id)
+    record_batch(batch_num, product_count, time.perf_counter() - started)
+    if success_count == product_count:
+        finish_batch(batch_num)
+
+    if record_id:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        result_text = f"已处理 {success_count}/{product_count} | {timestamp}"
+        with trace.span("update_result"):
+            update_batch_result(token, record_id, result_text)
+        get_batch_list_cache().invalidate()
+
+    return {
+        "success": True,
+        "batch": batch_num,
+        "total": product_count,
+        "processed": plan["written"] + len(results),
+        "resumed": plan["written"] + len(plan["generated"]),
+        "written": success_count,
+        "unwritten": len(writer.unwritten),
+        "elapsed": round(time.perf_counter() - started, 2),
+        "concurrency": concurrency,
+        "batch_size": batch_size,
+        "cache": cache_stats(),
+        "yunwu": concurrency_stats()
+    }
 
 
 class handler(BaseHTTPRequestHandler):
@@ -18,7 +159,7 @@ class handler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Accept')
         self.end_headers()
 
     def do_POST(self):
@@ -27,10 +168,7 @@ class handler(BaseHTTPRequestHandler):
             body = self.rfile.read(content_length).decode('utf-8')
             data = json.loads(body) if body else {}
 
-            batch_num = data.get("batch")
-            record_id = data.get("record_id")
-
-            if not batch_num:
+            if not data.get("batch"):
                 self.send_response(400)
                 self.send_header('Content-Type', 'application/json')
                 self.send_header('Access-Control-Allow-Origin', '*')
@@ -38,76 +176,22 @@ class handler(BaseHTTPRequestHandler):
                 self.wfile.write(json.dumps({"error": "Missing batch parameter"}).encode('utf-8'))
                 return
 
-            token = get_feishu_token()
-            products = get_products_by_batch(token, batch_num)
-
-            if not products:
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                response = {
-                    "success": False,
-                    "message": "没有找到该批次的产品",
-                    "batch": batch_num
-                }
-                self.wfile.write(json.dumps(response).encode('utf-8'))
+            # Accept: text/event-stream 或 ?stream=1 时以 SSE 逐条推送进度
+            stream = 'text/event-stream' in self.headers.get('Accept', '') or \
+                parse_qs(urlsplit(self.path).query).get("stream", ["0"])[0] == "1"
+            if stream:
+                self._stream(data)
                 return
 
-            results = []
             logs = []
-
-            for i, product in enumerate(products):
-                asin = product.get('asin', 'Unknown')
-                try:
-                    new_title = generate_product_title(product)
-                    if new_title:
-                        results.append({
-                            "asin": asin,
-                            "product_name": new_title
-                        })
-                        logs.append({
-                            "index": i + 1,
-                            "asin": asin,
-                            "status": "success",
-                            "title_length": len(new_title)
-                        })
-                    else:
-                        logs.append({
-                            "index": i + 1,
-                            "asin": asin,
-                            "status": "failed",
-                            "error": "生成失败"
-                        })
-                except Exception as e:
-                    logs.append({
-                        "index": i + 1,
-                        "asin": asin,
-                        "status": "error",
-                        "error": str(e)[:100]
-                    })
-
-            success_count = 0
-            if results:
-                success_count = write_to_output_table(token, results)
-
-            if record_id:
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                result_text = f"已处理 {success_count}/{len(products)} | {timestamp}"
-                update_batch_result(token, record_id, result_text)
+            response = process_batch(data, lambda event, payload: logs.append(payload) if event == "product" else None)
+            if response["success"]:
+                response["logs"] = sorted(logs, key=lambda log: log["index"])
 
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
-            response = {
-                "success": True,
-                "batch": batch_num,
-                "total": len(products),
-                "processed": len(results),
-                "written": success_count,
-                "logs": logs
-            }
             self.wfile.write(json.dumps(response).encode('utf-8'))
 
         except Exception as e:
@@ -117,3 +201,18 @@ class handler(BaseHTTPRequestHandler):
             self.end_headers()
             response = {"success": False, "error": str(e)}
             self.wfile.write(json.dumps(response).encode('utf-8'))
+
+    def _stream(self, data: Dict):
+        """以 SSE 推送进度，最后发送 done（汇总结果）或 error 事件"""
+        self.send_response(200)
+        for name, value in SSE_HEADERS.items():
+            self.send_header(name, value)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        events = EventStream(self.wfile)
+        try:
+            events.send("done", process_batch(data, events.send))
+        except Exception as e:
+            events.send("error", {"success": False, "error": str(e)})
+        finally:
+            events.close()
@@ -5,7 +5,7 @@ import os
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from lib.feishu import get_feishu_token, update_batch_result
+from lib.feishu import get_feishu_token, update_batch_result, WEBHOOK_ACCEPTED_TEXT
 
 
 class handler(BaseHTTPRequestHandler):
@@ -44,7 +44,8 @@ class handler(BaseHTTPRequestHandler):
             if record_id:
                 try:
                     token = get_feishu_token()
-                    update_batch_result(token, record_id, "处理中...")
+                    # 占位文本不是进度（没有心跳），不会被当作中断的批次重新触发
+                    update_batch_result(token, record_id, WEBHOOK_ACCEPTED_TEXT)
                 except Exception:
                     pass
 
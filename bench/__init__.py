@@ -0,0 +1 @@
+# Benchmarks against local mock Feishu / Yunwu servers
@@ -0,0 +1,63 @@
+"""
+多产品合并请求基准测试
+用 bench/title_corpus.json 构造产品，比较不同合并数 K 下的请求数和提示词总长度（不访问云雾接口）
+
+使用方法:
+    python3 -m bench.bench_batch_prompt
+    python3 -m bench.bench_batch_prompt --products 1000 --sizes 1,5,10,20
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from lib.yunwu import build_title_prompt, build_batch_prompt, batch_limit, _batch_ids
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "title_corpus.json")
+
+
+def load_products(path: str, count: int):
+    """用语料循环构造 count 个产品"""
+    with open(path, encoding="utf-8") as f:
+        corpus = json.load(f)
+    return [
+        {
+            "asin": f"B0BENCH{i:05d}",
+            "original_title": corpus[i % len(corpus)]["title"],
+            "bullets": corpus[i % len(corpus)].get("bullets", ""),
+            "name_format": "Product Type + Key Feature + Specification + Use Case",
+            "weight": "0.5 kg",
+            "size": "10 x 8 x 5 cm",
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS_PATH, help="语料文件（[{title, bullets}, ...]）")
+    parser.add_argument("--products", type=int, default=1000, help="产品数")
+    parser.add_argument("--sizes", default="1,5,10,20", help="逗号分隔的合并数 K")
+    args = parser.parse_args()
+
+    products = load_products(args.corpus, args.products)
+    baseline = None
+    print(f"{'K':>4} {'请求数':>8} {'提示词总字符':>14} {'每产品字符':>10} {'相对 K=1':>10}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        size = batch_limit(size)
+        requests = 0
+        chars = 0
+        for start in range(0, len(products), size):
+            chunk = products[start:start + size]
+            prompt = build_title_prompt(chunk[0]) if size == 1 else build_batch_prompt(chunk, _batch_ids(chunk))
+            requests += 1
+            chars += len(prompt)
+        baseline = baseline or chars
+        print(f"{size:>4} {requests:>8} {chars:>14,} {chars / len(products):>10.0f} {baseline / chars:>9.2f}x")
+    print(flush=True)
+
+
+if __name__ == "__main__":
+    main()
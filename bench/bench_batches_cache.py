@@ -0,0 +1,122 @@
+"""
+/api/batches 缓存基准测试
+多个面板同时轮询批次列表，对比"每次请求都读飞书"与"进程内缓存 + ETag 条件请求"
+访问飞书的次数和返回给浏览器的流量（时间按比例缩短：面板轮询间隔 --poll 秒，缓存有效期为其一半）
+
+使用方法:
+    python3 -m bench.bench_batches_cache
+    python3 -m bench.bench_batches_cache --viewers 1,10,50 --duration 6 --poll 0.3
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench.mock_servers import start_mock_feishu
+
+
+def _make_row(i: int) -> dict:
+    return {
+        "Batch#": f"B{i:05d}",
+        "COZE RUN": i % 3 != 0,
+        "COZE result": f"已处理 100/100 | 2025-12-01 10:{i % 60:02d}:00" if i % 5 else "",
+    }
+
+
+def _start_api(handler_class) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _viewer(port: int, duration: float, poll: float, use_etag: bool, totals: dict, lock: threading.Lock):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    etag = None
+    deadline = time.monotonic() + duration
+    time.sleep(random.uniform(0, poll))     # 各面板打开时间错开
+    while time.monotonic() < deadline:
+        headers = {"If-None-Match": etag} if use_etag and etag else {}
+        conn.request("GET", "/api/batches", headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        if response.status == 200:
+            etag = response.getheader("ETag")
+        with lock:
+            totals["requests"] += 1
+            totals["bytes"] += len(body)
+            totals["not_modified"] += response.status == 304
+        time.sleep(poll)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--viewers", default="1,10,50", help="同时打开的面板数，逗号分隔")
+    parser.add_argument("--rows", type=int, default=100, help="表3批次行数")
+    parser.add_argument("--duration", type=float, default=6.0, help="每组测试时长（秒）")
+    parser.add_argument("--poll", type=float, default=0.3, help="面板轮询间隔（秒，对应真实的 30 秒）")
+    args = parser.parse_args()
+
+    feishu = start_mock_feishu(latency=0.02)
+    os.environ["FEISHU_API_BASE"] = f"{feishu.base_url}/open-apis"
+    os.environ["BATCHES_CACHE_TTL"] = str(args.poll / 2)
+    os.environ["BATCHES_STALE_TTL"] = str(args.poll * 2)
+
+    from lib.config import TABLE_PROGRESS
+    from lib.batch_cache import BatchListCache
+    import lib.batch_cache as batch_cache
+    from api.batches import handler as cached_handler
+
+    feishu.bitable.add_records(TABLE_PROGRESS, [_make_row(i) for i in range(args.rows)])
+
+    class LegacyHandler(cached_handler):
+        """旧实现：每个请求都获取令牌并读取表3"""
+        def do_GET(self):
+            body = json.dumps(batch_cache._load_batch_list()).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    class CachedHandler(cached_handler):
+        def log_message(self, format, *args):
+            pass
+
+    print(f"表3 {args.rows} 行, 面板每 {args.poll:g}s 轮询一次, 每组 {args.duration:g}s", flush=True)
+    print(f"\n{'方式':<12}{'面板数':>6}{'面板请求':>10}{'飞书请求':>10}{'304占比':>9}{'返回流量KB':>12}")
+    for viewers in [int(v) for v in args.viewers.split(",")]:
+        for name, handler_class, use_etag in (("无缓存(旧)", LegacyHandler, False),
+                                              ("缓存+ETag(新)", CachedHandler, True)):
+            batch_cache._cache = BatchListCache()
+            api = _start_api(handler_class)
+            feishu.reset_stats()
+            totals = {"requests": 0, "bytes": 0, "not_modified": 0}
+            lock = threading.Lock()
+            threads = [threading.Thread(target=_viewer, args=(api.server_port, args.duration, args.poll,
+                                                              use_etag, totals, lock))
+                       for _ in range(viewers)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            api.shutdown()
+            share = totals["not_modified"] / max(totals["requests"], 1)
+            print(f"{name:<12}{viewers:>6}{totals['requests']:>10}{feishu.stats['requests']:>10}"
+                  f"{share:>9.0%}{totals['bytes'] / 1024:>12.1f}", flush=True)
+    feishu.shutdown()
+
+
+if __name__ == "__main__":
+    main()
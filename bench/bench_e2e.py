@@ -0,0 +1,202 @@
+"""
+端到端基准测试
+启动本地模拟飞书（鉴权 + 多维表格）和云雾（chat/completions）服务器，把 lib/config.py 指向它们，
+对 100 / 1k / 10k 个产品的批次分别运行 server.process_single_batch（thread / async 引擎）和 /api/process，
+报告每秒处理产品数、单个产品延迟的 p50/p95/p99 和峰值内存（RSS）。
+
+每个用例在独立子进程中运行，峰值 RSS 只包含该用例（模拟服务器运行在父进程中）。
+
+使用方法:
+    python3 -m bench.bench_e2e
+    python3 -m bench.bench_e2e --sizes 100,1000 --engines thread,async --targets server,api --concurrency 32
+    python3 -m bench.bench_e2e --yunwu-latency 1.5 --yunwu-jitter 0.4 --yunwu-error-rate 0.02 --yunwu-rate-limit 20
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench.bench_batch_prompt import load_products, CORPUS_PATH
+from bench.mock_servers import start_mock_feishu, start_mock_yunwu
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _input_row(product: dict, batch: str) -> dict:
+    return {
+        "Batch #": batch,
+        "ASIN": product["asin"],
+        "商品标题": product["original_title"],
+        "产品卖点": product["bullets"],
+        "name format": product["name_format"],
+        "重量_1": product["weight"],
+        "体积_1": product["size"],
+    }
+
+
+# ==================== 子进程：运行单个用例 ====================
+
+def _run_server_case(case: dict) -> dict:
+    """调用 server.process_single_batch，通过 _log_outcome 收集每个产品的延迟"""
+    import server
+    from lib.feishu import get_feishu_token
+
+    latencies, statuses = [], {}
+
+    def collect(outcome, total=None, batch=None):
+        latencies.append(outcome["latency"])
+        statuses[outcome["status"]] = statuses.get(outcome["status"], 0) + 1
+
+    server._log_outcome = collect
+    server._options.update(concurrency=case["concurrency"], engine=case["engine"], batch_size=case["batch_size"])
+    token = get_feishu_token()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        server.process_single_batch(token, case["batch"], case["record_id"])
+    return {"seconds": time.perf_counter() - start, "latencies": latencies, "statuses": statuses}
+
+
+def _run_api_case(case: dict) -> dict:
+    """在本进程中启动 /api/process，以 SSE 方式调用并从 product 事件收集延迟"""
+    from http.server import ThreadingHTTPServer
+    from api.process import handler
+
+    class QuietHandler(handler):
+        def log_message(self, format, *args):
+            pass
+
+    api = ThreadingHTTPServer(("127.0.0.1", 0), QuietHandler)
+    threading.Thread(target=api.serve_forever, daemon=True).start()
+
+    latencies, statuses = [], {}
+    body = json.dumps({"batch": case["batch"], "record_id": case["record_id"],
+                       "concurrency": case["concurrency"], "batch_size": case["batch_size"]})
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection("127.0.0.1", api.server_port, timeout=3600)
+    conn.request("POST", "/api/process", body=body,
+                 headers={"Content-Type": "application/json", "Accept": "text/event-stream"})
+    response = conn.getresponse()
+    event = None
+    for raw in response:
+        line = raw.decode('utf-8').rstrip("\n")
+        if line.startswith("event: "):
+            event = line[7:]
+        elif line.startswith("data: ") and event == "product":
+            data = json.loads(line[6:])
+            latencies.append(data["latency"])
+            statuses[data["status"]] = statuses.get(data["status"], 0) + 1
+    seconds = time.perf_counter() - start
+    api.shutdown()
+    return {"seconds": seconds, "latencies": latencies, "statuses": statuses}
+
+
+def run_case(case: dict):
+    result = _run_api_case(case) if case["target"] == "api" else _run_server_case(case)
+    latencies = result.pop("latencies")
+    count = len(latencies)
+    result.update({
+        "products": count,
+        "rate": count / result["seconds"] if result["seconds"] else 0.0,
+        "p50": _percentile(latencies, 0.50),
+        "p95": _percentile(latencies, 0.95),
+        "p99": _percentile(latencies, 0.99),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,   # Linux 下单位为 KB
+    })
+    print(json.dumps(result), flush=True)
+
+
+# ==================== 父进程：启动模拟服务器并逐个运行用例 ====================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000", help="逗号分隔的批次产品数")
+    parser.add_argument("--engines", default="thread,async", help="server 目标使用的引擎: thread,async")
+    parser.add_argument("--targets", default="server,api", help="被测入口: server(process_single_batch),api(/api/process)")
+    parser.add_argument("--concurrency", type=int, default=32, help="标题生成并发数")
+    parser.add_argument("--batch-size", type=int, default=1, help="每次请求合并的产品数（仅 thread 引擎）")
+    parser.add_argument("--yunwu-latency", type=float, default=0.2, help="云雾请求延迟中位数（秒）")
+    parser.add_argument("--yunwu-jitter", type=float, default=0.5, help="云雾延迟对数正态 sigma")
+    parser.add_argument("--yunwu-error-rate", type=float, default=0.01, help="云雾返回 500 的比例")
+    parser.add_argument("--yunwu-rate-limit", type=float, default=0, help="云雾服务端每秒请求上限，超过返回 429（0 不限）")
+    parser.add_argument("--off-rate", type=float, default=0.1, help="首次生成长度不合规的比例")
+    parser.add_argument("--yunwu-qps", type=float, default=0, help="客户端 YUNWU_RATE_LIMIT（0 不限）")
+    parser.add_argument("--feishu-latency", type=float, default=0.05, help="飞书请求延迟中位数（秒）")
+    parser.add_argument("--feishu-jitter", type=float, default=0.3, help="飞书延迟对数正态 sigma")
+    parser.add_argument("--feishu-error-rate", type=float, default=0.0, help="飞书返回 500 的比例")
+    parser.add_argument("--feishu-rate-limit", type=float, default=0, help="飞书服务端每秒请求上限（0 不限）")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        run_case(json.loads(args.case))
+        return
+
+    feishu = start_mock_feishu(latency=args.feishu_latency, jitter=args.feishu_jitter,
+                               error_rate=args.feishu_error_rate, rate_limit=args.feishu_rate_limit)
+    yunwu = start_mock_yunwu(latency=args.yunwu_latency, jitter=args.yunwu_jitter,
+                             error_rate=args.yunwu_error_rate, rate_limit=args.yunwu_rate_limit,
+                             off_rate=args.off_rate)
+    env = dict(os.environ,
+               FEISHU_API_BASE=f"{feishu.base_url}/open-apis",
+               YUNWU_API_BASE=f"{yunwu.base_url}/v1",
+               YUNWU_RATE_LIMIT=str(args.yunwu_qps),
+               TITLE_CACHE_PATH="",         # 关闭缓存和断点日志，每个用例都完整生成
+               BATCH_JOURNAL_PATH="")
+    os.environ.update(env)
+    from lib.config import TABLE_INPUT, TABLE_PROGRESS
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    engines = args.engines.split(",")
+    targets = args.targets.split(",")
+    cases = []
+    for size in sizes:
+        for target in targets:
+            for engine in (engines if target == "server" else ["thread"]):
+                cases.append({"target": target, "engine": engine, "size": size})
+
+    print(f"模拟云雾: 延迟 {args.yunwu_latency * 1000:.0f}ms (sigma {args.yunwu_jitter}), 错误率 {args.yunwu_error_rate:.0%}, "
+          f"不合规 {args.off_rate:.0%}, 限流 {args.yunwu_rate_limit or '无'}; "
+          f"模拟飞书: 延迟 {args.feishu_latency * 1000:.0f}ms, 错误率 {args.feishu_error_rate:.0%}; "
+          f"并发 {args.concurrency}, 合并 {args.batch_size}", flush=True)
+    print(f"\n{'入口':<8}{'引擎':<8}{'产品数':>8}{'用时(s)':>9}{'产品/秒':>9}{'p50(s)':>8}{'p95(s)':>8}{'p99(s)':>8}"
+          f"{'峰值RSS(MB)':>13}{'失败':>6}", flush=True)
+
+    for i, case in enumerate(cases):
+        batch = f"E2E-{i}-{case['size']}"
+        feishu.bitable.add_records(TABLE_INPUT, [_input_row(p, batch) for p in load_products(CORPUS_PATH, case["size"])])
+        record_id = feishu.bitable.add_records(TABLE_PROGRESS, [{"Batch#": batch, "COZE RUN": True}])[0]["record_id"]
+        case.update(batch=batch, record_id=record_id, concurrency=args.concurrency, batch_size=args.batch_size)
+
+        completed = subprocess.run([sys.executable, "-m", "bench.bench_e2e", "--case", json.dumps(case)],
+                                   cwd=os.path.join(os.path.dirname(__file__), '..'), env=env,
+                                   capture_output=True, text=True)
+        lines = completed.stdout.strip().splitlines()
+        if completed.returncode != 0 or not lines:
+            print(f"{case['target']:<8}{case['engine']:<8}{case['size']:>8}  运行失败: "
+                  f"{completed.stderr.strip().splitlines()[-1:] or completed.returncode}", flush=True)
+            continue
+        r = json.loads(lines[-1])
+        failed = r["products"] - r["statuses"].get("success", 0)
+        print(f"{case['target']:<8}{case['engine']:<8}{r['products']:>8}{r['seconds']:>9.1f}{r['rate']:>9.1f}"
+              f"{r['p50']:>8.2f}{r['p95']:>8.2f}{r['p99']:>8.2f}{r['peak_rss_mb']:>13.1f}{failed:>6}", flush=True)
+
+    feishu.shutdown()
+    yunwu.shutdown()
+
+
+if __name__ == "__main__":
+    main()
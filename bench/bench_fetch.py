@@ -0,0 +1,110 @@
+"""
+批次产品拉取基准测试
+对比"全表分页 + 本地过滤"与"服务端过滤 + 字段投影"两种方式的请求数、流量和耗时
+
+使用方法:
+    python3 -m bench.bench_fetch
+    python3 -m bench.bench_fetch --rows 50000 --batch-size 100 --latency 0.03 --bandwidth 5
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench.mock_servers import start_mock_feishu
+
+# 表1中生成标题用不到、但全量读取时会一并返回的字段
+_EXTRA_FIELDS = {
+    "主图": [{"file_token": "boxcnMockImageToken", "name": "main.jpg", "size": 183422, "type": "image/jpeg",
+             "url": "https://open.feishu.cn/open-apis/drive/v1/medias/boxcnMockImageToken/download"}],
+    "类目路径": "Office Products > Office Electronics > Printers > Label Makers",
+    "竞品链接": {"link": "https://www.amazon.com/dp/B0MOCKLINK", "text": "竞品"},
+    "售价": 39.99,
+    "备注": "采集自前台页面，含 A+ 内容与评论摘要。" * 8,
+    "评论摘要": "Customers like the print quality and the app, some mention the label roll fit. " * 6,
+}
+
+
+def _make_row(i: int, batch: str) -> dict:
+    return {
+        "Batch #": batch,
+        "ASIN": {"text": f"B0{i:08d}", "link": f"https://www.amazon.com/dp/B0{i:08d}"},
+        "商品标题": f"Bluetooth Label Maker Machine with Tape {i}, Portable Thermal Label Printer for Office Home",
+        "产品卖点": "Wireless Connection: prints from phone via app. " * 25,
+        "name format": "Product Type + Core Feature + Use Case + Compatibility",
+        "重量_1": "0.5 lb",
+        "体积_1": "5.9 x 3.1 x 2.0 inches",
+        **_EXTRA_FIELDS,
+    }
+
+
+def legacy_get_products_by_batch(base: str, token: str, batch_num: str) -> list:
+    """旧实现：逐页读取整张表的全部字段，再在本地按批次过滤"""
+    from lib.feishu import http_request, parse_product
+    from lib.config import FEISHU_APP_TOKEN, TABLE_INPUT
+
+    base_url = f"{base}/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_INPUT}/records"
+    headers = {"Authorization": f"Bearer {token}"}
+    products, page_token = [], None
+    while True:
+        url = f"{base_url}?page_size=100"
+        if page_token:
+            url += f"&page_token={page_token}"
+        result = http_request(url, headers=headers)
+        for item in result.get("data", {}).get("items", []):
+            if item.get("fields", {}).get("Batch #") == batch_num:
+                products.append(parse_product(item))
+        if not result.get("data", {}).get("has_more"):
+            break
+        page_token = result.get("data", {}).get("page_token")
+    return products
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000, help="表1总行数")
+    parser.add_argument("--batch-size", type=int, default=100, help="目标批次的产品数")
+    parser.add_argument("--latency", type=float, default=0.03, help="模拟每个请求的服务端延迟（秒）")
+    parser.add_argument("--bandwidth", type=float, default=5.0, help="模拟下行带宽（MB/s），0 表示不限")
+    args = parser.parse_args()
+
+    server = start_mock_feishu(latency=args.latency, bandwidth=args.bandwidth * 1024 * 1024)
+    os.environ["FEISHU_API_BASE"] = f"{server.base_url}/open-apis"
+
+    from lib.config import FEISHU_API_BASE, TABLE_INPUT
+    from lib.feishu import get_products_by_batch
+
+    # 目标批次放在表尾，其余行均匀分布在其他批次
+    target = "BENCH-TARGET"
+    other_rows = args.rows - args.batch_size
+    rows = [_make_row(i, f"B{i // 100:05d}") for i in range(other_rows)]
+    rows += [_make_row(other_rows + i, target) for i in range(args.batch_size)]
+    server.bitable.add_records(TABLE_INPUT, rows)
+    print(f"模拟表1: {args.rows} 行, 目标批次 {args.batch_size} 个产品, "
+          f"延迟 {args.latency * 1000:.0f}ms/请求, 带宽 {args.bandwidth or '不限'} MB/s", flush=True)
+
+    results = {}
+    for name, fetch in (
+        ("全表扫描(旧)", lambda: legacy_get_products_by_batch(FEISHU_API_BASE, "t-mock", target)),
+        ("服务端过滤(新)", lambda: get_products_by_batch("t-mock", target)),
+    ):
+        server.reset_stats()
+        start = time.perf_counter()
+        products = fetch()
+        elapsed = time.perf_counter() - start
+        results[name] = (len(products), server.stats["requests"], server.stats["bytes_sent"], elapsed)
+
+    print(f"\n{'方式':<14}{'产品数':>8}{'请求数':>8}{'传输量(MB)':>12}{'耗时(s)':>10}")
+    for name, (count, requests, size, elapsed) in results.items():
+        print(f"{name:<14}{count:>8}{requests:>8}{size / 1024 / 1024:>12.2f}{elapsed:>10.2f}")
+
+    (_, old_req, old_bytes, old_time), (_, new_req, new_bytes, new_time) = results.values()
+    print(f"\n请求数减少 {old_req / max(new_req, 1):.0f}x, 传输量减少 {old_bytes / max(new_bytes, 1):.0f}x, "
+          f"耗时减少 {old_time / max(new_time, 1e-9):.0f}x", flush=True)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
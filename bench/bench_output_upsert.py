@@ -0,0 +1,80 @@
+"""
+表2 写入方式基准测试
+在本地模拟飞书服务器上把同一批次的标题重复写入表2 若干次（模拟重新处理同一批次），对比：
+- append: 总是 batch_create（原行为，每次重跑都为每个 ASIN 追加一行）
+- upsert: 按 ASIN 索引，已有记录 batch_update，只新建没有的
+报告每种方式的写入请求数、表2最终行数、重复 ASIN 行数，以及之后全表扫描一次表2所需的请求数。
+最后在 upsert 方式下删除部分表2记录，验证索引失效后能重新扫描并补建。
+
+使用方法:
+    python3 -m bench.bench_output_upsert
+    python3 -m bench.bench_output_upsert --existing 20000 --products 1000 --runs 3
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench.mock_servers import start_mock_feishu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--existing", type=int, default=20000, help="表2中已有的其他产品行数")
+    parser.add_argument("--products", type=int, default=1000, help="批次产品数")
+    parser.add_argument("--runs", type=int, default=3, help="同一批次重复写入次数")
+    parser.add_argument("--latency", type=float, default=0.005, help="模拟飞书请求延迟（秒）")
+    args = parser.parse_args()
+
+    server = start_mock_feishu(latency=args.latency)
+    os.environ["FEISHU_API_BASE"] = f"{server.base_url}/open-apis"
+    os.environ["FEISHU_RATE_LIMIT"] = "0"
+    from lib import feishu
+    from lib.config import TABLE_OUTPUT
+    from lib.output_index import get_output_index
+
+    token = feishu.get_feishu_token()
+    records = [{"asin": f"B0UPSERT{i:05d}", "product_name": f"Title {i}"} for i in range(args.products)]
+
+    print(f"表2已有 {args.existing} 行其他产品 | 批次 {args.products} 个产品 | 重复写入 {args.runs} 次")
+    print(f"\n{'方式':<8}{'写入请求':>10}{'用时(s)':>9}{'表2行数':>10}{'重复行':>8}{'全表扫描请求':>14}")
+    for mode in ("append", "upsert"):
+        server.bitable.tables[TABLE_OUTPUT] = []
+        server.bitable.add_records(TABLE_OUTPUT, [{"ASIN": f"B0OTHER{i:06d}", "Product_Name": "x"}
+                                                  for i in range(args.existing)])
+        get_output_index().invalidate()
+        feishu.OUTPUT_WRITE_MODE = mode
+
+        server.reset_stats()
+        start = time.perf_counter()
+        written = 0
+        for _ in range(args.runs):
+            written += feishu.write_to_output_table(token, records)
+        seconds = time.perf_counter() - start
+        write_requests = server.stats["requests"]
+
+        rows = server.bitable.records(TABLE_OUTPUT)
+        asins = [r["fields"].get("ASIN") for r in rows]
+        duplicates = len(asins) - len(set(asins))
+        server.reset_stats()
+        feishu.scan_output_index(token)
+        print(f"{mode:<8}{write_requests:>10}{seconds:>9.2f}{len(rows):>10}{duplicates:>8}{server.stats['requests']:>14}",
+              flush=True)
+
+    # 删除部分记录后再写入：batch_update 返回记录不存在，重新扫描索引后补建
+    deleted = [r["record_id"] for r in server.bitable.records(TABLE_OUTPUT)
+               if str(r["fields"].get("ASIN", "")).startswith("B0UPSERT")][:10]
+    server.bitable.delete_records(TABLE_OUTPUT, deleted)
+    written = feishu.write_to_output_table(token, records)
+    asins = [r["fields"].get("ASIN") for r in server.bitable.records(TABLE_OUTPUT)]
+    missing = sum(1 for r in records if r["asin"] not in set(asins))
+    print(f"\n删除 {len(deleted)} 条后再写入: 写入 {written}/{len(records)} | 缺失 {missing} | "
+          f"重复 {len(asins) - len(set(asins))} | 索引 {get_output_index().stats()}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+表3 进度上报基准测试
+在本地模拟飞书服务器上同时"处理"多个批次（每个产品完成时间按固定速度模拟），对比：
+- 逐个产品 PUT 更新 COZE result（update_batch_result）
+- ProgressReporter 定时合并，多个批次一次 batch_update
+报告飞书请求数、每秒请求数，以及结束前表3中看到的最后进度。
+
+使用方法:
+    python3 -m bench.bench_progress
+    python3 -m bench.bench_progress --batches 5 --products 500 --rate 50 --interval 2
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench.mock_servers import start_mock_feishu
+
+
+def simulate(record_ids, products: int, rate: float, on_product):
+    """每个批次一个线程，按 rate 个/秒完成产品"""
+    def run(record_id):
+        for i in range(products):
+            time.sleep(1 / rate)
+            on_product(record_id, i + 1)
+
+    threads = [threading.Thread(target=run, args=(record_id,)) for record_id in record_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batches", type=int, default=3, help="同时处理的批次数")
+    parser.add_argument("--products", type=int, default=300, help="每个批次的产品数")
+    parser.add_argument("--rate", type=float, default=50, help="每个批次每秒完成的产品数")
+    parser.add_argument("--interval", type=float, default=1.0, help="ProgressReporter 更新间隔（秒）")
+    parser.add_argument("--latency", type=float, default=0.02, help="模拟飞书请求延迟（秒）")
+    args = parser.parse_args()
+
+    server = start_mock_feishu(latency=args.latency)
+    os.environ["FEISHU_API_BASE"] = f"{server.base_url}/open-apis"
+    from lib.config import TABLE_PROGRESS
+    from lib.feishu import get_feishu_token, update_batch_result
+    from lib.progress import ProgressReporter
+
+    token = get_feishu_token()
+    rows = server.bitable.add_records(TABLE_PROGRESS, [{"Batch#": f"P-{i}", "COZE RUN": True}
+                                                         for i in range(args.batches)])
+    record_ids = [r["record_id"] for r in rows]
+
+    def last_texts():
+        texts = {r["record_id"]: r["fields"].get("COZE result") for r in server.bitable.records(TABLE_PROGRESS)}
+        return [texts[record_id] for record_id in record_ids]
+
+    print(f"{args.batches} 个批次 × {args.products} 个产品，每批次 {args.rate:.0f} 个/秒，飞书延迟 {args.latency * 1000:.0f}ms")
+    print(f"\n{'方式':<24}{'用时(s)':>9}{'飞书请求':>10}{'请求/秒':>9}")
+
+    # 逐个产品 PUT
+    server.reset_stats()
+    start = time.perf_counter()
+    simulate(record_ids, args.products, args.rate,
+             lambda record_id, done: update_batch_result(token, record_id, f"处理中 {done}/{args.products}"))
+    seconds = time.perf_counter() - start
+    requests = server.stats["requests"]
+    print(f"{'逐个产品 PUT':<24}{seconds:>9.1f}{requests:>10}{requests / seconds:>9.1f}", flush=True)
+
+    # 合并上报
+    reporter = ProgressReporter(interval=args.interval)
+    server.reset_stats()
+    start = time.perf_counter()
+    for record_id in record_ids:
+        reporter.start(record_id, args.products)
+    simulate(record_ids, args.products, args.rate, lambda record_id, done: reporter.advance(record_id))
+    seconds = time.perf_counter() - start
+    requests = server.stats["requests"]
+    seen = last_texts()
+    for record_id in record_ids:
+        reporter.finish(record_id)
+    label = f"ProgressReporter {args.interval:g}s"
+    print(f"{label:<24}{seconds:>9.1f}{requests:>10}{requests / seconds:>9.1f}", flush=True)
+    print(f"\n结束时表3显示: {seen[0]}")
+    print(f"上报器统计: {reporter.stats()}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
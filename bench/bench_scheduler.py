@@ -0,0 +1,104 @@
+"""
+多批次调度基准测试
+模拟大小悬殊的批次先后被触发，对比：
+- 逐个处理（parallel=1，原 process_batches 的行为）
+- 并行 + 加权公平（fair）
+- 并行 + 剩余最少优先（sjf）
+所有策略共用同一个固定大小的并发预算，大模型调用用 sleep 模拟（对数正态延迟），
+经过真实的 BatchScheduler、generate_titles 和 AIMDController 调度路径。
+报告每个批次从触发到完成的时间（平均、p95、最大）以及小批次的平均完成时间。
+
+使用方法:
+    python3 -m bench.bench_scheduler
+    python3 -m bench.bench_scheduler --batches 2000,20,300,50,800,10 --gap 0.05 --budget 16 --latency 0.05
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from lib.concurrency import AIMDController, OK
+from lib.engine import generate_titles
+from lib.scheduler import BatchScheduler
+
+
+def _percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run(sizes, gap: float, budget: int, latency: float, jitter: float, parallel: int, policy: str, seed: int):
+    """按 gap 间隔依次触发批次，返回 {批次号: 触发到完成的秒数}"""
+    controller = AIMDController(budget, min_limit=budget, max_limit=budget, policy=policy)
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    def fake_generate(product):
+        with rng_lock:
+            delay = latency * math.exp(rng.gauss(0, jitter))
+        controller.acquire()
+        try:
+            time.sleep(delay)
+        finally:
+            controller.release(OK, delay)
+        return "title"
+
+    triggered, finished = {}, {}
+
+    def process(batch_info):
+        products = [{"asin": f"{batch_info['batch']}-{i}"} for i in range(batch_info["size"])]
+        generate_titles(products, concurrency=budget, generate=fake_generate, batch_size=1)
+        finished[batch_info["batch"]] = time.perf_counter()
+        return True
+
+    scheduler = BatchScheduler(process, parallel=parallel, policy=policy,
+                               size_of=lambda batch_info: batch_info["size"])
+    for i, size in enumerate(sizes):
+        batch = f"B{i + 1}-{size}"
+        triggered[batch] = time.perf_counter()
+        scheduler.submit([{"batch": batch, "record_id": None, "size": size}])
+        time.sleep(gap)
+    scheduler.wait()
+    return {batch: finished[batch] - triggered[batch] for batch in triggered}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batches", default="2000,20,300,50,800,10", help="逗号分隔的批次产品数（按触发顺序）")
+    parser.add_argument("--gap", type=float, default=0.05, help="相邻批次触发间隔（秒）")
+    parser.add_argument("--budget", type=int, default=16, help="全局并发预算（同时进行的大模型请求数）")
+    parser.add_argument("--latency", type=float, default=0.05, help="单次大模型调用延迟中位数（秒）")
+    parser.add_argument("--jitter", type=float, default=0.3, help="延迟对数正态 sigma")
+    parser.add_argument("--parallel", type=int, default=6, help="并行策略下同时处理的批次数")
+    parser.add_argument("--small", type=int, default=100, help="不超过该产品数的批次计为小批次")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.batches.split(",")]
+    strategies = [("逐个处理", 1, "fair"), ("并行+fair", args.parallel, "fair"), ("并行+sjf", args.parallel, "sjf")]
+
+    print(f"批次: {sizes} | 触发间隔 {args.gap}s | 并发预算 {args.budget} | "
+          f"延迟 {args.latency * 1000:.0f}ms (sigma {args.jitter})")
+    print(f"\n{'策略':<12}{'平均(s)':>9}{'p95(s)':>9}{'最大(s)':>9}{'小批次平均(s)':>15}")
+    details = []
+    for name, parallel, policy in strategies:
+        times = run(sizes, args.gap, args.budget, args.latency, args.jitter, parallel, policy, args.seed)
+        values = list(times.values())
+        small = [t for batch, t in times.items() if int(batch.split("-")[1]) <= args.small]
+        print(f"{name:<12}{sum(values) / len(values):>9.2f}{_percentile(values, 0.95):>9.2f}{max(values):>9.2f}"
+              f"{(sum(small) / len(small) if small else 0):>15.2f}", flush=True)
+        details.append((name, times))
+
+    print("\n各批次完成时间(s):")
+    print(f"{'批次':<12}" + "".join(f"{name:>12}" for name, _ in details))
+    for batch in details[0][1]:
+        print(f"{batch:<12}" + "".join(f"{times[batch]:>12.2f}" for _, times in details))
+
+
+if __name__ == "__main__":
+    main()
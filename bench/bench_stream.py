@@ -0,0 +1,131 @@
+"""
+批次产品流式拉取基准测试
+在本地模拟飞书服务器上放一个大批次，对比：
+- 列表: get_products_by_batch 取完全部产品后再生成标题（原行为）
+- 流式: ProductStream 逐页产出产品，后台预取下一页，取到即提交生成
+大模型调用用 sleep 模拟，经过真实的 generate_titles 调度路径。
+每种方式在独立子进程中运行，报告首个标题用时、总用时、Python 堆峰值（tracemalloc）和进程 RSS 峰值，
+最后对比 Product（__slots__）与原来的产品字典的内存占用。
+
+使用方法:
+    python3 -m bench.bench_stream
+    python3 -m bench.bench_stream --products 10000 --latency 0.2 --bandwidth 5 --llm-latency 0.01 --concurrency 16
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench.bench_fetch import _make_row
+
+BATCH = "BENCH-STREAM"
+
+
+def worker(mode: str, llm_latency: float, concurrency: int):
+    """子进程：按 mode 拉取并生成，输出 JSON 结果"""
+    os.environ["BATCH_JOURNAL_PATH"] = ""
+    from lib.engine import generate_titles
+    from lib.feishu import ProductStream, get_feishu_token, get_products_by_batch
+
+    def fake_generate(product):
+        time.sleep(llm_latency)
+        return "title"
+
+    token = get_feishu_token()
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = []
+
+    def on_result(outcome):
+        if not first:
+            first.append(time.perf_counter() - start)
+
+    if mode == "list":
+        products = get_products_by_batch(token, BATCH)
+    else:
+        products = ProductStream(token, BATCH)
+    outcomes = generate_titles(products, concurrency=concurrency, generate=fake_generate, batch_size=1,
+                               on_result=on_result)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(json.dumps({
+        "titles": sum(1 for o in outcomes if o["title"]),
+        "first": first[0] if first else None,
+        "seconds": seconds,
+        "peak": peak,
+        "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }))
+
+
+def measure_records(count: int):
+    """构造 count 个产品字典 / Product 的堆内存占用（字节）"""
+    from lib.feishu import Product, field_text
+
+    rows = [_make_row(i, BATCH) for i in range(min(count, 1000))]
+    fields = [(field_text(r["ASIN"]), r["商品标题"], r["产品卖点"], r["name format"], r["重量_1"], r["体积_1"])
+              for r in rows]
+    sizes = {}
+    for name, build in (
+        ("dict", lambda i, f: {"record_id": f"rec{i}", "asin": f[0], "original_title": f[1], "bullets": f[2],
+                               "name_format": f[3], "weight": f[4], "size": f[5]}),
+        ("Product", lambda i, f: Product(f"rec{i}", *f)),
+    ):
+        tracemalloc.start()
+        items = [build(i, fields[i % len(fields)]) for i in range(count)]
+        sizes[name] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del items
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10000, help="批次产品数")
+    parser.add_argument("--page-size", type=int, default=500, help="每页产品数（INPUT_PAGE_SIZE）")
+    parser.add_argument("--latency", type=float, default=0.2, help="模拟飞书每页请求延迟（秒）")
+    parser.add_argument("--bandwidth", type=float, default=5.0, help="模拟下行带宽（MB/s），0 表示不限")
+    parser.add_argument("--llm-latency", type=float, default=0.01, help="单次大模型调用延迟（秒）")
+    parser.add_argument("--concurrency", type=int, default=16, help="标题生成并发数")
+    parser.add_argument("--worker", choices=("list", "stream"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.llm_latency, args.concurrency)
+        return
+
+    from bench.mock_servers import start_mock_feishu
+    from lib.config import TABLE_INPUT
+
+    server = start_mock_feishu(latency=args.latency, bandwidth=args.bandwidth * 1024 * 1024)
+    server.bitable.add_records(TABLE_INPUT, [_make_row(i, BATCH) for i in range(args.products)])
+    env = dict(os.environ, FEISHU_API_BASE=f"{server.base_url}/open-apis", INPUT_PAGE_SIZE=str(args.page_size))
+
+    print(f"批次 {args.products} 个产品 | 每页 {args.page_size} | 飞书延迟 {args.latency * 1000:.0f}ms "
+          f"带宽 {args.bandwidth}MB/s | 大模型 {args.llm_latency * 1000:.0f}ms × 并发 {args.concurrency}")
+    print(f"\n{'方式':<8}{'标题数':>8}{'首个标题(s)':>13}{'总用时(s)':>11}{'堆峰值(MB)':>12}{'RSS峰值(MB)':>13}")
+    for mode, label in (("list", "列表"), ("stream", "流式")):
+        output = subprocess.run(
+            [sys.executable, "-m", "bench.bench_stream", "--worker", mode,
+             "--llm-latency", str(args.llm_latency), "--concurrency", str(args.concurrency)],
+            env=env, cwd=os.path.join(os.path.dirname(__file__), '..'), capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{label:<8}{result['titles']:>8}{result['first']:>13.2f}{result['seconds']:>11.2f}"
+              f"{result['peak'] / 1024 / 1024:>12.1f}{result['rss'] / 1024:>13.1f}", flush=True)
+    server.shutdown()
+
+    sizes = measure_records(args.products)
+    print(f"\n{args.products} 个产品对象（字段字符串共享，只计对象本身）: "
+          f"dict {sizes['dict'] / 1024:.0f}KB | Product {sizes['Product'] / 1024:.0f}KB "
+          f"({sizes['Product'] / sizes['dict']:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+本地标题长度修正基准测试
+用 bench/title_corpus.json 中长度不合规的标题统计 fit_title 的修正成功率和单次耗时，
+并按修正方式分别计数（短语边界截断、完整卖点扩写等）；另外统计允许从短语中间截断时
+还能多修正多少条（单词边界截断、半个卖点短语），这些默认不做，交给大模型。
+最后检查候选标题解析不会把 "2.4G"、"3.5mm" 这类开头当作编号去掉（不一致时退出码为 1）
+
+使用方法:
+    python3 -m bench.bench_title_fit
+    python3 -m bench.bench_title_fit --verbose
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from lib.titles import (
+    fit_title, fit_title_detail, find_banned_terms, is_valid_length,
+    FIT_VALID, FIT_SHORTENED, FIT_PHRASE_CUT, FIT_WORD_CUT, FIT_EXPANDED, FIT_PARTIAL,
+)
+from lib.yunwu import _parse_candidates
+
+# 候选解析回归用例: (模型输出, 候选数, 候选模式, 期望的候选标题)
+_PARSE_CASES = [
+    ("2.4G Wireless Mouse for Laptop", 1, "n", ["2.4G Wireless Mouse for Laptop"]),
+    ("3.5mm Audio Cable, Braided", 1, "lines", ["3.5mm Audio Cable, Braided"]),
+    ("1. 2.4G Wireless Mouse\n2) 3.5mm Audio Cable\n- 12V Car Charger", 3, "lines",
+     ["2.4G Wireless Mouse", "3.5mm Audio Cable", "12V Car Charger"]),
+    ("2.4G Wireless Mouse\n5.1 Channel Soundbar", 2, "lines", ["2.4G Wireless Mouse", "5.1 Channel Soundbar"]),
+]
+
+_METHOD_NAMES = {
+    FIT_VALID: "删除禁用词后合规", FIT_SHORTENED: "删词/缩写单位", FIT_PHRASE_CUT: "短语边界截断",
+    FIT_EXPANDED: "完整卖点扩写", FIT_WORD_CUT: "单词边界截断", FIT_PARTIAL: "半个卖点短语扩写",
+}
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "title_corpus.json")
+
+
+def check_candidate_parsing() -> int:
+    """运行候选解析回归用例，返回不一致的条数"""
+    failures = 0
+    for content, n, mode, expected in _PARSE_CASES:
+        parsed = _parse_candidates({"choices": [{"message": {"content": content}}]}, n, mode)
+        if parsed != expected:
+            failures += 1
+            print(f"    ✗ n={n} {mode}: {content!r} -> {parsed}", flush=True)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS_PATH, help="语料文件（[{title, bullets}, ...]）")
+    parser.add_argument("--repeat", type=int, default=200, help="计时重复次数")
+    parser.add_argument("--verbose", action="store_true", help="逐条输出修正结果")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    groups = {"过长": [0, 0], "过短": [0, 0]}
+    methods = {name: 0 for name in _METHOD_NAMES}
+    for item in corpus:
+        fitted, method = fit_title_detail(item["title"], item.get("bullets", ""))
+        ok = fitted is not None and is_valid_length(fitted) and not find_banned_terms(fitted)
+        if not fitted:
+            # 默认不修正的标题：允许从短语中间截断时能否修正
+            _, method = fit_title_detail(item["title"], item.get("bullets", ""), allow_word_cut=True)
+        if method:
+            methods[method] += 1
+        group = groups["过长" if len(item["title"]) > 110 else "过短"]
+        group[0] += 1
+        group[1] += ok
+        if args.verbose:
+            label = _METHOD_NAMES.get(method, "交给大模型") if fitted else "交给大模型"
+            print(f"[{len(item['title']):3d} -> {len(fitted) if fitted else '---':>3}] {label:<10} {fitted or item['title']}")
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for item in corpus:
+            fit_title(item["title"], item.get("bullets", ""))
+    per_call = (time.perf_counter() - start) / (args.repeat * len(corpus))
+
+    total = sum(g[0] for g in groups.values())
+    fitted = sum(g[1] for g in groups.values())
+    print(f"\n语料 {total} 条，本地修正成功 {fitted} 条 ({fitted / total:.0%})")
+    for name, (count, ok) in groups.items():
+        if count:
+            print(f"    {name}: {ok}/{count} ({ok / count:.0%})")
+    print("修正方式: " + " | ".join(f"{_METHOD_NAMES[m]} {methods[m]}"
+                                   for m in (FIT_VALID, FIT_SHORTENED, FIT_PHRASE_CUT, FIT_EXPANDED)))
+    print("未修正、交给大模型（允许从短语中间截断时可修正）: "
+          + " | ".join(f"{_METHOD_NAMES[m]} {methods[m]}" for m in (FIT_WORD_CUT, FIT_PARTIAL))
+          + f" | 其余 {total - fitted - methods[FIT_WORD_CUT] - methods[FIT_PARTIAL]}")
+    print(f"平均耗时 {per_call * 1e6:.0f} μs/条", flush=True)
+
+    failures = check_candidate_parsing()
+    print(f"候选解析: {len(_PARSE_CASES) - failures}/{len(_PARSE_CASES)} 条一致", flush=True)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
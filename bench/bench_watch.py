@@ -0,0 +1,127 @@
+"""
+监控模式基准测试
+在模拟时钟上运行若干小时的 --watch 循环，对比"固定间隔全表读取"与"增量查询 + 空闲退避"
+每小时的请求数、流量，以及从批次被触发到被发现的延迟
+
+使用方法:
+    python3 -m bench.bench_watch
+    python3 -m bench.bench_watch --hours 4 --rows 100 --triggers 8 --interval 60 --max-interval 600
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench.mock_servers import start_mock_feishu
+
+
+def _make_row(i: int) -> dict:
+    done = f"已处理 {100 - i % 7}/100 | 2025-12-0{i % 9 + 1} 10:00:00"
+    return {
+        "Batch#": f"B{i:05d}",
+        "COZE RUN": True,
+        "COZE result": done,
+        "产品数": 100,
+        "负责人": [{"id": "ou_mock", "name": "运营", "email": "ops@example.com"}],
+        "备注": "本批次为新品上架，标题需突出核心卖点和适用场景。" * 3,
+    }
+
+
+def legacy_get_triggered_batches(base: str, token: str) -> list:
+    """旧实现：每次读取表3第一页的全部字段，在本地判断是否触发"""
+    from lib.feishu import http_request
+    from lib.config import FEISHU_APP_TOKEN, TABLE_PROGRESS
+
+    url = f"{base}/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_PROGRESS}/records?page_size=100"
+    result = http_request(url, headers={"Authorization": "Bearer t-mock"})
+    batches = []
+    for item in result.get("data", {}).get("items", []):
+        fields = item.get("fields", {})
+        coze_result = fields.get("COZE result")
+        if fields.get("COZE RUN") == True and (coze_result is None or coze_result.strip() == ""):
+            batches.append({"batch": fields.get("Batch#"), "record_id": item.get("record_id")})
+    return batches
+
+
+def simulate(server, triggers, duration, poll, next_interval):
+    """在模拟时钟上运行监控循环，返回 (检查次数, 发现延迟列表)"""
+    from lib.config import TABLE_PROGRESS
+
+    pending = list(triggers)            # [(触发时间, record_id)]
+    triggered_at = {}
+    latencies = []
+    polls = 0
+    now = 0.0
+    while now < duration:
+        while pending and pending[0][0] <= now:
+            at, record_id = pending.pop(0)
+            server.bitable.update_record(TABLE_PROGRESS, record_id, {"COZE result": None})
+            triggered_at[record_id] = at
+        polls += 1
+        for b in poll(now):
+            if b["record_id"] in triggered_at:
+                latencies.append(now - triggered_at.pop(b["record_id"]))
+            # 处理完成后写回结果（直接改内存数据，不计入请求数）
+            server.bitable.update_record(TABLE_PROGRESS, b["record_id"], {"COZE result": "已处理 100/100"})
+        now += next_interval()
+    return polls, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=4, help="模拟运行时长（小时）")
+    parser.add_argument("--rows", type=int, default=100, help="表3批次行数（旧实现只读第一页，不超过 100 时结果可比）")
+    parser.add_argument("--triggers", type=int, default=8, help="模拟期间被触发的批次数")
+    parser.add_argument("--interval", type=float, default=60, help="基础检查间隔（秒）")
+    parser.add_argument("--max-interval", type=float, default=600, help="空闲时检查间隔上限（秒）")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    server = start_mock_feishu()
+    os.environ["FEISHU_API_BASE"] = f"{server.base_url}/open-apis"
+
+    from lib.config import FEISHU_API_BASE, TABLE_PROGRESS
+    from lib.watch import ProgressWatcher
+
+    duration = args.hours * 3600
+    print(f"模拟表3: {args.rows} 行, {args.hours:g} 小时内触发 {args.triggers} 个批次, "
+          f"基础间隔 {args.interval:g}s, 空闲上限 {args.max_interval:g}s", flush=True)
+
+    results = {}
+    for name in ("固定间隔全表(旧)", "增量+退避(新)"):
+        server.bitable.tables.clear()
+        records = server.bitable.add_records(TABLE_PROGRESS, [_make_row(i) for i in range(args.rows)])
+        rng = random.Random(args.seed)      # 两种方式使用相同的触发序列
+        triggers = sorted((rng.uniform(0, duration), r["record_id"])
+                          for r in rng.sample(records, min(args.triggers, len(records))))
+        server.reset_stats()
+
+        if name.startswith("固定"):
+            polls, latencies = simulate(server, triggers, duration,
+                                        lambda now: legacy_get_triggered_batches(FEISHU_API_BASE, "t-mock"),
+                                        lambda: args.interval)
+        else:
+            clock = [0.0]
+            watcher = ProgressWatcher(args.interval, max_interval=args.max_interval, clock=lambda: clock[0])
+
+            def poll(now):
+                clock[0] = now
+                return watcher.poll("t-mock")
+            polls, latencies = simulate(server, triggers, duration, poll, lambda: watcher.interval)
+        results[name] = (polls, server.stats["requests"], server.stats["bytes_sent"], latencies)
+
+    print(f"\n{'方式':<16}{'请求/小时':>10}{'流量KB/小时':>13}{'发现数':>8}{'平均延迟(s)':>13}{'最大延迟(s)':>13}")
+    for name, (polls, requests, size, latencies) in results.items():
+        avg = sum(latencies) / len(latencies) if latencies else 0.0
+        print(f"{name:<16}{requests / args.hours:>10.1f}{size / 1024 / args.hours:>13.1f}{len(latencies):>8}"
+              f"{avg:>13.1f}{max(latencies, default=0.0):>13.1f}")
+
+    (_, old_req, old_bytes, _), (_, new_req, new_bytes, _) = results.values()
+    print(f"\n请求数减少 {old_req / max(new_req, 1):.1f}x, 流量减少 {old_bytes / max(new_bytes, 1):.0f}x", flush=True)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
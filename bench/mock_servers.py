@@ -0,0 +1,410 @@
+"""
+本地模拟服务器
+模拟飞书多维表格/鉴权接口和云雾 chat/completions 接口，用于在不访问 open.feishu.cn 和 yunwu.ai 的情况下做性能测试。
+延迟可设为固定值或对数正态分布，并可按比例注入 5xx 错误和按频率上限返回 429
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, parse_qs
+
+_RECORDS_PATH = re.compile(r"^/open-apis/bitable/v1/apps/([^/]+)/tables/([^/]+)/records(?:/([^/?]+))?$")
+
+
+class MockBitable:
+    """内存中的多维表格数据（按 table_id 存放记录）"""
+
+    def __init__(self):
+        self.tables: Dict[str, List[Dict]] = {}
+        self._next_id = 0
+        self._last_modified = 0
+        self._lock = threading.Lock()
+        self.modified_field = "最后更新时间"     # 按 last_modified_time 比较的"修改时间"字段名
+
+    def new_record_id(self) -> str:
+        with self._lock:
+            self._next_id += 1
+            return f"rec{self._next_id:08d}"
+
+    def _modified_now(self) -> int:
+        # 调用方持有锁；保证修改时间严格递增
+        self._last_modified = max(int(time.time() * 1000), self._last_modified + 1)
+        return self._last_modified
+
+    def add_records(self, table_id: str, fields_list: List[Dict]) -> List[Dict]:
+        records = [{"record_id": self.new_record_id(), "fields": dict(f)} for f in fields_list]
+        with self._lock:
+            for r in records:
+                r["last_modified_time"] = self._modified_now()
+            self.tables.setdefault(table_id, []).extend(records)
+        return records
+
+    def update_record(self, table_id: str, record_id: str, fields: Dict) -> Optional[Dict]:
+        """更新记录字段（值为 None 时删除该字段）"""
+        with self._lock:
+            for r in self.tables.get(table_id, []):
+                if r["record_id"] == record_id:
+                    for k, v in fields.items():
+                        if v is None:
+                            r["fields"].pop(k, None)
+                        else:
+                            r["fields"][k] = v
+                    r["last_modified_time"] = self._modified_now()
+                    return r
+        return None
+
+    def delete_records(self, table_id: str, record_ids: List[str]):
+        with self._lock:
+            removed = set(record_ids)
+            self.tables[table_id] = [r for r in self.tables.get(table_id, []) if r["record_id"] not in removed]
+
+    def records(self, table_id: str) -> List[Dict]:
+        with self._lock:
+            return list(self.tables.get(table_id, []))
+
+
+def _match(record: Dict, condition: Dict, modified_field: str = "") -> bool:
+    name = condition.get("field_name")
+    if modified_field and name == modified_field:
+        value = record.get("last_modified_time")
+    else:
+        value = record["fields"].get(name)
+    expected = condition.get("value") or []
+    operator = condition.get("operator")
+    if operator == "is":
+        if not expected:
+            return False
+        if isinstance(value, bool) or value is None and expected[0] in ("true", "false"):
+            return bool(value) == (expected[0] == "true")
+        return value == expected[0]
+    if operator == "isEmpty":
+        return value in (None, "", [])
+    if operator == "isNotEmpty":
+        return value not in (None, "", [])
+    if operator == "contains":
+        return value is not None and any(str(e) in str(value) for e in expected)
+    if operator == "isGreater":
+        # 日期条件的值形如 ["ExactDate", "毫秒时间戳"]
+        try:
+            return value is not None and float(value) > float(expected[-1])
+        except (TypeError, ValueError):
+            return False
+    return True
+
+
+class MockFeishuHandler(BaseHTTPRequestHandler):
+    """飞书开放平台接口的最小实现"""
+    protocol_version = "HTTP/1.1"
+    server: "MockServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: Dict, status: int = 200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.server.record(self.command, urlsplit(self.path).path, len(body))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b""
+        return json.loads(raw) if raw else {}
+
+    def _throttled(self) -> bool:
+        """超过模拟的频率上限时返回 429 + 99991400"""
+        if not self.server.allow():
+            body = json.dumps({"code": 99991400, "msg": "request trigger frequency limit"}).encode('utf-8')
+            self.server.record(self.command, urlsplit(self.path).path, len(body))
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("x-ogw-ratelimit-limit", str(int(self.server.rate_limit)))
+            self.send_header("x-ogw-ratelimit-reset", "1")
+            self.end_headers()
+            self.wfile.write(body)
+            return True
+        return False
+
+    def _authorized(self) -> bool:
+        """已作废的令牌返回 99991663（与飞书一致使用 HTTP 400）；超过频率上限返回 429；按比例注入 500"""
+        if self._throttled():
+            return False
+        if self.server.fail():
+            self._send_json({"code": 1254000, "msg": "internal error"}, 500)
+            return False
+        token = self.headers.get("Authorization", "").replace("Bearer ", "", 1)
+        if token in self.server.revoked_tokens:
+            self._send_json({"code": 99991663, "msg": "Invalid access token for authorization."}, 400)
+            return False
+        return True
+
+    def do_GET(self):
+        self.server.delay()
+        if not self._authorized():
+            return
+        parts = urlsplit(self.path)
+        match = _RECORDS_PATH.match(parts.path)
+        if not match or match.group(3):
+            self._send_json({"code": 404, "msg": "not found"}, 404)
+            return
+        query = parse_qs(parts.query)
+        page_size = min(int(query.get("page_size", ["20"])[0]), 500)
+        offset = int(query.get("page_token", ["0"])[0])
+        records = [{"record_id": r["record_id"], "fields": r["fields"]}
+                   for r in self.server.bitable.records(match.group(2))]
+        self._send_page(records, offset, page_size)
+
+    def do_POST(self):
+        self.server.delay()
+        parts = urlsplit(self.path)
+        data = self._read_json()
+        if parts.path == "/open-apis/auth/v3/tenant_access_token/internal":
+            self._send_json({"code": 0, "tenant_access_token": self.server.issue_token(), "expire": 7200})
+            return
+        if not self._authorized():
+            return
+
+        match = _RECORDS_PATH.match(parts.path)
+        if match and match.group(3) == "search":
+            query = parse_qs(parts.query)
+            page_size = min(int(query.get("page_size", ["20"])[0]), 500)
+            offset = int(query.get("page_token", ["0"])[0])
+            records = self.server.bitable.records(match.group(2))
+            conditions = (data.get("filter") or {}).get("conditions") or []
+            modified_field = self.server.bitable.modified_field
+            records = [r for r in records if all(_match(r, c, modified_field) for c in conditions)]
+            field_names = data.get("field_names")
+            automatic = data.get("automatic_fields")
+            records = [
+                dict({"record_id": r["record_id"],
+                      "fields": {k: v for k, v in r["fields"].items() if not field_names or k in field_names}},
+                     **({"last_modified_time": r["last_modified_time"]} if automatic else {}))
+                for r in records
+            ]
+            self._send_page(records, offset, page_size)
+            return
+
+        if match and match.group(3) == "batch_create":
+            created = self.server.bitable.add_records(
+                match.group(2), [r.get("fields", {}) for r in data.get("records", [])]
+            )
+            self._send_json({"code": 0, "data": {"records": created}})
+            return
+
+        if match and match.group(3) == "batch_update":
+            updated = [
+                self.server.bitable.update_record(match.group(2), r.get("record_id"), r.get("fields") or {})
+                for r in data.get("records", [])
+            ]
+            if not all(updated):
+                self._send_json({"code": 1254043, "msg": "RecordIdNotFound"})
+                return
+            self._send_json({"code": 0, "data": {"records": updated}})
+            return
+
+        self._send_json({"code": 404, "msg": "not found"}, 404)
+
+    def do_PUT(self):
+        self.server.delay()
+        data = self._read_json()
+        if not self._authorized():
+            return
+        match = _RECORDS_PATH.match(urlsplit(self.path).path)
+        if match and match.group(3):
+            self.server.bitable.update_record(match.group(2), match.group(3), data.get("fields") or {})
+        self._send_json({"code": 0, "data": {}})
+
+    def _send_page(self, records: List[Dict], offset: int, page_size: int):
+        page = records[offset:offset + page_size]
+        has_more = offset + page_size < len(records)
+        self._send_json({
+            "code": 0,
+            "data": {
+                "items": page,
+                "has_more": has_more,
+                "page_token": str(offset + page_size) if has_more else None,
+                "total": len(records),
+            }
+        })
+
+
+class MockServer(ThreadingHTTPServer):
+    """带延迟模拟和流量统计的本地服务器"""
+    daemon_threads = True
+
+    request_queue_size = 1024
+
+    def __init__(self, handler, latency: float = 0.0, bandwidth: float = 0.0,
+                 bitable: Optional[MockBitable] = None, jitter: float = 0.0, error_rate: float = 0.0):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency          # 每个请求的延迟中位数（秒）
+        self.jitter = jitter            # 对数正态分布的 sigma，0 表示固定延迟
+        self.error_rate = error_rate    # 随机返回 500 的比例
+        self.bandwidth = bandwidth      # 下行带宽（字节/秒），0 表示不限
+        self.bitable = bitable or MockBitable()
+        self.stats = {"requests": 0, "bytes_sent": 0}
+        self._stats_lock = threading.Lock()
+        self.issued_tokens = 0
+        self.revoked_tokens = set()     # 模拟提前失效的令牌
+        self.rate_limit = 0.0           # 数据表接口每秒请求上限，0 表示不限
+        self._window = [0.0, 0]         # [窗口开始时间, 窗口内请求数]
+
+    def allow(self) -> bool:
+        """固定 1 秒窗口计数，超过 rate_limit 时拒绝"""
+        if not self.rate_limit:
+            return True
+        with self._stats_lock:
+            now = time.monotonic()
+            if now - self._window[0] >= 1.0:
+                self._window = [now, 0]
+            self._window[1] += 1
+            if self._window[1] > self.rate_limit:
+                self.stats["throttled"] = self.stats.get("throttled", 0) + 1
+                return False
+            return True
+
+    def issue_token(self) -> str:
+        with self._stats_lock:
+            self.issued_tokens += 1
+            return f"t-mock-{self.issued_tokens}"
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def delay(self):
+        if self.latency:
+            latency = random.lognormvariate(math.log(self.latency), self.jitter) if self.jitter else self.latency
+            time.sleep(latency)
+
+    def fail(self) -> bool:
+        """按 error_rate 随机决定本次请求是否返回 500"""
+        if self.error_rate and random.random() < self.error_rate:
+            with self._stats_lock:
+                self.stats["errors"] = self.stats.get("errors", 0) + 1
+            return True
+        return False
+
+    def record(self, method: str, path: str, size: int):
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats["bytes_sent"] += size
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.stats = {"requests": 0, "bytes_sent": 0}
+
+    def start(self) -> "MockServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def start_mock_feishu(latency: float = 0.0, bandwidth: float = 0.0, jitter: float = 0.0,
+                      error_rate: float = 0.0, rate_limit: float = 0.0) -> MockServer:
+    """启动模拟飞书服务器（接口前缀为 base_url + /open-apis）"""
+    server = MockServer(MockFeishuHandler, latency=latency, bandwidth=bandwidth, jitter=jitter, error_rate=error_rate)
+    server.rate_limit = rate_limit
+    return server.start()
+
+
+# 拼接模拟标题用的词表（不含品牌名和禁用词）
+_TITLE_WORDS = [
+    "Portable", "Label", "Maker", "Machine", "Wireless", "Thermal", "Printer", "Compact", "Office", "Home",
+    "Organization", "Tape", "Waterproof", "Sticker", "Inkless", "Mini", "Handheld", "Smart", "Storage",
+    "Kitchen", "School", "Barcode", "Multiple", "Templates", "Bluetooth", "Phone", "Compatible", "Clear",
+]
+# 合并请求提示词中的产品 JSON 数组
+_BATCH_INPUT = re.compile(r"^\[\{.*\}\]$", re.M)
+_ADJUST_PREFIX = ("这个标题太短了", "这个标题太长了")
+
+
+def mock_title(seed: str, length: int) -> str:
+    """由 seed 确定的英文标题，长度在 length-6 到 length 之间"""
+    rng = random.Random(hashlib.md5(seed.encode('utf-8')).hexdigest())
+    words = []
+    while True:
+        word = rng.choice(_TITLE_WORDS)
+        if len(" ".join(words + [word])) > length:
+            break
+        words.append(word)
+    title = " ".join(words)
+    for word in ("Kit", "Set", "Box"):
+        if len(title) < length - 6:
+            title += " " + word
+    return title
+
+
+class MockYunwuHandler(BaseHTTPRequestHandler):
+    """chat/completions 接口的最小实现：按提示词类型返回合规或需要调整的标题"""
+    protocol_version = "HTTP/1.1"
+    server: "MockServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.server.record(self.command, self.path, len(body))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        data = json.loads(self.rfile.read(length) or b"{}")
+        if urlsplit(self.path).path != "/v1/chat/completions":
+            self._send(404, {"error": {"message": "not found"}})
+            return
+        if not self.server.allow():
+            self._send(429, {"error": {"message": "rate limited"}}, {"Retry-After": "1"})
+            return
+        self.server.delay()
+        if self.server.fail():
+            self._send(500, {"error": {"message": "upstream error"}})
+            return
+
+        prompt = data["messages"][-1]["content"]
+        n = max(1, int(data.get("n") or 1))
+        self._send(200, {"choices": [{"index": i, "message": {"role": "assistant", "content": self._answer(prompt, i)}}
+                                     for i in range(n)]})
+
+    def _answer(self, prompt: str, variant: int) -> str:
+        seed = f"{prompt}#{variant}"
+        if prompt.startswith(_ADJUST_PREFIX):
+            return mock_title(seed, 106)
+        batch = _BATCH_INPUT.search(prompt)
+        if batch:
+            items = json.loads(batch.group(0))
+            return json.dumps([{"id": item["id"], "title": mock_title(f"{seed}{item['id']}", 106)} for item in items])
+        # 按 off_rate 返回过短的标题，触发模型调整流程
+        if random.Random(seed).random() < self.server.off_rate:
+            return mock_title(seed, 80)
+        return mock_title(seed, 106)
+
+
+def start_mock_yunwu(latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                     rate_limit: float = 0.0, off_rate: float = 0.0) -> MockServer:
+    """启动模拟云雾服务器（接口前缀为 base_url + /v1）
+
+    off_rate 为首次生成时返回长度不合规标题的比例。
+    """
+    server = MockServer(MockYunwuHandler, latency=latency, jitter=jitter, error_rate=error_rate)
+    server.rate_limit = rate_limit
+    server.off_rate = off_rate
+    return server.start()
@@ -0,0 +1,192 @@
+"""
+异步 HTTP 客户端模块
+基于 asyncio 流实现的最小 HTTP/1.1 客户端，按主机复用 keep-alive 连接（仅依赖标准库）
+"""
+import asyncio
+import json
+import ssl
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .config import HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_IDLE_TIMEOUT
+from .http_client import SSL_CONTEXT, HTTPError
+from . import trace
+
+# 复用连接失败时可安全重试的异常（服务端已关闭空闲连接）
+_STALE_ERRORS = (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+
+
+class _Connection:
+    """一条 HTTP 长连接"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.idle_since = 0.0
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncHTTPClient:
+    """带连接池的异步 HTTP 客户端（单事件循环内使用）"""
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+                 read_timeout: float = HTTP_READ_TIMEOUT, idle_timeout: float = HTTP_IDLE_TIMEOUT,
+                 ssl_context: ssl.SSLContext = SSL_CONTEXT):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self.ssl_context = ssl_context
+        self._idle: Dict[Tuple[str, str, int], List[_Connection]] = {}
+        self._stats = {"requests": 0, "connections_opened": 0, "connections_reused": 0, "stale_retries": 0}
+
+    async def _acquire(self, key: Tuple[str, str, int]) -> Tuple[_Connection, bool]:
+        loop = asyncio.get_running_loop()
+        idle = self._idle.get(key) or []
+        while idle:
+            conn = idle.pop()
+            if loop.time() - conn.idle_since < self.idle_timeout and not conn.reader.at_eof():
+                self._stats["connections_reused"] += 1
+                return conn, True
+            conn.close()
+
+        scheme, host, port = key
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                host, port,
+                ssl=self.ssl_context if scheme == "https" else None,
+                server_hostname=host if scheme == "https" else None,
+            ),
+            timeout=self.connect_timeout,
+        )
+        self._stats["connections_opened"] += 1
+        return _Connection(reader, writer), False
+
+    def _release(self, key: Tuple[str, str, int], conn: _Connection):
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.pool_size:
+            conn.idle_since = asyncio.get_running_loop().time()
+            idle.append(conn)
+        else:
+            conn.close()
+
+    async def request(self, method: str, url: str, headers: Dict = None, body: bytes = None,
+                      timeout: float = None) -> Tuple[int, Dict[str, str], bytes]:
+        """发送请求，返回 (状态码, 响应头(小写键), 响应体)"""
+        parts = urlsplit(url)
+        with trace.span(f"{method} {parts.hostname}", cat="http", path=parts.path) as span:
+            status, response_headers, data = await self._request(method, parts, headers, body, timeout)
+            span.set(status=status, bytes=len(data))
+        return status, response_headers, data
+
+    async def _request(self, method: str, parts, headers: Optional[Dict], body: Optional[bytes],
+                       timeout: Optional[float]) -> Tuple[int, Dict[str, str], bytes]:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        host_header = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host_header}", "Accept-Encoding: identity"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        if body is not None or method in ("POST", "PUT", "PATCH"):
+            lines.append(f"Content-Length: {len(body or b'')}")
+        raw_request = ("\r\n".join(lines) + "\r\n\r\n").encode('utf-8') + (body or b"")
+
+        self._stats["requests"] += 1
+        while True:
+            conn, reused = await self._acquire(key)
+            try:
+                status, response_headers, data, keep_alive = await asyncio.wait_for(
+                    self._exchange(conn, raw_request, method), timeout=timeout or self.read_timeout
+                )
+            except _STALE_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                self._stats["stale_retries"] += 1
+                continue
+            except BaseException:
+                conn.close()
+                raise
+
+            if keep_alive:
+                self._release(key, conn)
+            else:
+                conn.close()
+            return status, response_headers, data
+
+    async def _exchange(self, conn: _Connection, raw_request: bytes,
+                        method: str) -> Tuple[int, Dict[str, str], bytes, bool]:
+        conn.writer.write(raw_request)
+        await conn.writer.drain()
+
+        status_line = await conn.reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b"", None)
+        version, status = status_line.decode('latin-1').split(" ", 2)[:2]
+        status = int(status)
+
+        response_headers = {}
+        while True:
+            line = await conn.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == "HTTP/1.1" and response_headers.get("connection", "").lower() != "close"
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            data = b""
+        elif response_headers.get("transfer-encoding", "").lower() == "chunked":
+            data = await self._read_chunked(conn.reader)
+        elif "content-length" in response_headers:
+            data = await conn.reader.readexactly(int(response_headers["content-length"]))
+        else:
+            data = await conn.reader.read()
+            keep_alive = False
+        return status, response_headers, data, keep_alive
+
+    @staticmethod
+    async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+        chunks = []
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # 跳过 trailer
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    async def request_json(self, method: str, url: str, headers: Dict = None, data: Dict = None,
+                           timeout: float = None) -> Dict:
+        """发送 JSON 请求并解析 JSON 响应，状态码 >= 400 时抛出 HTTPError"""
+        headers = dict(headers or {})
+        body = None
+        if data:
+            body = json.dumps(data).encode('utf-8')
+            if 'Content-Type' not in headers:
+                headers['Content-Type'] = 'application/json'
+
+        status, response_headers, raw = await self.request(method, url, headers=headers, body=body, timeout=timeout)
+        if status >= 400:
+            raise HTTPError(status, raw.decode('utf-8', errors='replace'), response_headers)
+        return json.loads(raw.decode('utf-8'))
+
+    def stats(self) -> Dict:
+        """连接复用统计"""
+        return dict(self._stats)
+
+    async def close(self):
+        """关闭所有空闲连接"""
+        idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
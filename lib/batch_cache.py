@@ -0,0 +1,174 @@
+"""
+批次列表缓存模块
+/api/batches 的响应在进程内缓存 BATCHES_CACHE_TTL 秒：
+- 过期后 BATCHES_STALE_TTL 秒内仍先返回旧数据，同时在后台线程刷新（stale-while-revalidate）
+- 同一时间只有一个刷新请求访问飞书，其余请求等待或直接使用旧数据
+- 响应体的哈希作为 ETag，内容变化的时间作为 Last-Modified，供客户端做条件请求
+"""
+import hashlib
+import json
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Dict, List, Optional
+
+from .config import BATCHES_CACHE_TTL, BATCHES_STALE_TTL
+from .feishu import get_feishu_token, get_all_batches, is_progress_text, is_stale_progress, WEBHOOK_ACCEPTED_TEXT
+
+
+def build_batch_list(batches: List[Dict]) -> Dict:
+    """把表3批次按状态分组为面板使用的响应体"""
+    pending = []
+    completed = []
+
+    for b in batches:
+        batch_info = {
+            "batch": b["batch"],
+            "record_id": b["record_id"],
+            "coze_run": b["coze_run"],
+            "result": b["coze_result"] or ""
+        }
+
+        if b["coze_run"] and (not b["coze_result"] or b["coze_result"] == WEBHOOK_ACCEPTED_TEXT
+                              or is_stale_progress(b["coze_result"])):
+            # 未处理、webhook 已接收等待处理，或进度心跳已过期（处理进程已中断）
+            batch_info["status"] = "pending"
+            pending.append(batch_info)
+        elif is_progress_text(b["coze_result"]):
+            # COZE result 中是处理进度，批次尚未完成
+            batch_info["status"] = "running"
+            pending.append(batch_info)
+        elif b["coze_result"]:
+            batch_info["status"] = "completed"
+            completed.append(batch_info)
+        else:
+            batch_info["status"] = "idle"
+            pending.append(batch_info)
+
+    return {
+        "success": True,
+        "pending": pending,
+        "completed": completed,
+        "total": len(batches)
+    }
+
+
+def _load_batch_list() -> Dict:
+    return build_batch_list(get_all_batches(get_feishu_token()))
+
+
+class BatchListCache:
+    """带后台刷新的批次列表缓存（线程安全）"""
+
+    def __init__(self, load: Callable[[], Dict] = _load_batch_list, ttl: float = BATCHES_CACHE_TTL,
+                 stale_ttl: float = BATCHES_STALE_TTL):
+        self.load = load
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entry: Optional[Dict] = None     # {"body", "etag", "last_modified", "fetched_at"}
+        self._lock = threading.Lock()
+        self._refreshing: Optional[threading.Event] = None
+        self._error: Optional[Exception] = None
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "errors": 0}
+
+    def get(self, force: bool = False) -> Dict:
+        """返回缓存条目；过期不久时返回旧条目并在后台刷新，force 时同步刷新"""
+        with self._lock:
+            entry = self._entry
+            age = time.monotonic() - entry["fetched_at"] if entry else None
+            if entry and not force and age < self.ttl:
+                self._stats["hits"] += 1
+                return entry
+            stale = entry is not None and not force and age < self.ttl + self.stale_ttl
+            self._stats["stale_hits" if stale else "misses"] += 1
+            # 单飞：已有刷新在进行时复用它
+            leader = self._refreshing is None
+            if leader:
+                self._refreshing = threading.Event()
+            done = self._refreshing
+
+        if stale:
+            if leader:
+                threading.Thread(target=self._refresh, args=(done,), name="batches-refresh", daemon=True).start()
+            return entry
+
+        if leader:
+            self._refresh(done)
+        else:
+            done.wait()
+        with self._lock:
+            if self._entry is not None and (self._error is None or not force):
+                return self._entry
+            raise self._error or Exception("获取批次列表失败")
+
+    def _refresh(self, done: threading.Event):
+        try:
+            body = self.load()
+        except Exception as e:
+            with self._lock:
+                self._error = e
+                self._stats["errors"] += 1
+        else:
+            raw = json.dumps(body, ensure_ascii=False, sort_keys=True).encode('utf-8')
+            etag = '"' + hashlib.sha256(raw).hexdigest()[:32] + '"'
+            with self._lock:
+                previous = self._entry
+                changed = previous is None or previous["etag"] != etag
+                self._entry = {
+                    "body": raw,
+                    "etag": etag,
+                    "last_modified": time.time() if changed else previous["last_modified"],
+                    "fetched_at": time.monotonic(),
+                }
+                self._error = None
+                self._stats["refreshes"] += 1
+        finally:
+            with self._lock:
+                self._refreshing = None
+            done.set()
+
+    def invalidate(self):
+        """批次状态被本进程修改后调用，下一次请求同步刷新"""
+        with self._lock:
+            if self._entry is not None:
+                self._entry = dict(self._entry, fetched_at=float("-inf"))
+
+    def stats(self) -> Dict:
+        """命中/刷新计数和当前数据的缓存时长"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["age"] = round(time.monotonic() - self._entry["fetched_at"], 1) \
+                if self._entry and self._entry["fetched_at"] != float("-inf") else None
+        return stats
+
+
+def not_modified(entry: Dict, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    """按 If-None-Match / If-Modified-Since 判断客户端缓存是否仍然有效"""
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or entry["etag"] in tags or f"W/{entry['etag']}" in tags
+    if if_modified_since:
+        try:
+            return int(entry["last_modified"]) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cache_headers(entry: Dict) -> Dict[str, str]:
+    """缓存条目对应的 ETag / Last-Modified / Cache-Control 响应头"""
+    return {
+        "ETag": entry["etag"],
+        "Last-Modified": formatdate(entry["last_modified"], usegmt=True),
+        # 允许 CDN 共享缓存，过期后先返回旧内容并在后台回源
+        "Cache-Control": f"public, max-age=0, s-maxage={int(BATCHES_CACHE_TTL)}, "
+                         f"stale-while-revalidate={int(BATCHES_STALE_TTL)}",
+    }
+
+
+_cache = BatchListCache()
+
+
+def get_batch_list_cache() -> BatchListCache:
+    """获取进程内共享的批次列表缓存"""
+    return _cache
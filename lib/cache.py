@@ -0,0 +1,130 @@
+"""
+标题缓存模块
+以渲染后的提示词、模型名和提示词版本的哈希为键，把生成结果持久化到本地 SQLite，
+输入未变化的产品重复处理时不再调用大模型
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from .config import MODEL_NAME, PROMPT_VERSION, TITLE_CACHE_PATH, TITLE_CACHE_MAX_ENTRIES, TITLE_CACHE_MAX_AGE
+
+# 每写入多少条执行一次淘汰
+_EVICT_EVERY = 100
+# 命中后的 last_used 更新攒够多少条写一次库
+_TOUCH_EVERY = 100
+
+
+def cache_key(prompt: str, model: str = MODEL_NAME, version: str = PROMPT_VERSION) -> str:
+    """计算缓存键"""
+    return hashlib.sha256(f"{version}\n{model}\n{prompt}".encode('utf-8')).hexdigest()
+
+
+class TitleCache:
+    """基于 SQLite 的标题缓存（线程安全），按条数和存活时间淘汰"""
+
+    def __init__(self, path: str, max_entries: int = TITLE_CACHE_MAX_ENTRIES,
+                 max_age: float = TITLE_CACHE_MAX_AGE):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS titles ("
+            " key TEXT PRIMARY KEY, title TEXT NOT NULL,"
+            " created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_titles_last_used ON titles(last_used)")
+        self._conn.commit()
+        self._puts = 0
+        self._touched: Dict[str, float] = {}    # 命中但尚未写入 last_used 的键
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存，过期或不存在时返回 None
+
+        命中时只在内存中记下使用时间，攒够 _TOUCH_EVERY 条或下次写入时再批量更新 last_used，
+        读多的场景下不必每次命中都提交一次事务。
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT title, created_at FROM titles WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self._stats["misses"] += 1
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= _TOUCH_EVERY:
+                self._flush_touched()
+                self._conn.commit()
+            self._stats["hits"] += 1
+            return row[0]
+
+    def _flush_touched(self):
+        """把攒下的 last_used 更新写入数据库（调用方持有锁并负责提交）"""
+        if self._touched:
+            self._conn.executemany("UPDATE titles SET last_used = ? WHERE key = ?",
+                                   [(used, key) for key, used in self._touched.items()])
+            self._touched.clear()
+
+    def put(self, key: str, title: str):
+        """写入缓存"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO titles (key, title, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, title, now, now)
+            )
+            self._touched.pop(key, None)
+            self._flush_touched()
+            self._stats["writes"] += 1
+            self._puts += 1
+            if self._puts % _EVICT_EVERY == 0:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """删除过期条目，并把总数压到 max_entries 以内（优先淘汰最久未使用的）"""
+        removed = self._conn.execute("DELETE FROM titles WHERE created_at < ?", (now - self.max_age,)).rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM titles").fetchone()[0]
+        if count > self.max_entries:
+            removed += self._conn.execute(
+                "DELETE FROM titles WHERE key IN (SELECT key FROM titles ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            ).rowcount
+        self._stats["evictions"] += removed
+
+    def stats(self) -> Dict:
+        """命中统计（hits 即跳过的大模型调用次数）"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+_cache: Optional[TitleCache] = None
+_cache_lock = threading.Lock()
+_cache_failed = False
+
+
+def get_title_cache() -> Optional[TitleCache]:
+    """获取进程内共享的标题缓存；未配置路径或无法打开时返回 None"""
+    global _cache, _cache_failed
+    if _cache is None and not _cache_failed and TITLE_CACHE_PATH:
+        with _cache_lock:
+            if _cache is None and not _cache_failed:
+                try:
+                    _cache = TitleCache(TITLE_CACHE_PATH)
+                except sqlite3.Error:
+                    _cache_failed = True
+    return _cache
+
+
+def cache_stats() -> Dict:
+    """当前缓存统计，缓存未启用时返回空字典"""
+    cache = get_title_cache()
+    return cache.stats() if cache else {}
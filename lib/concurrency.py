@@ -0,0 +1,239 @@
+"""
+自适应并发控制模块
+AIMD（加性增、乘性减）控制同时进行中的大模型请求数：
+延迟和错误率正常时每完成约一个并发窗口的请求就把上限加 1，
+遇到 429 / 5xx / 超时，或短时间内多次延迟突增时把上限乘以系数下调
+
+多个批次同时处理时共用同一个上限（全局并发预算）。每个批次是一个 Flow（用 flow() 在当前上下文中声明），
+有空闲名额时按策略挑选等待中的批次：
+- fair: 进行中请求数 / 权重 最小的批次优先（加权公平分配，小批次不会被大批次挤占）
+- sjf:  剩余产品数最少的批次优先（短批次优先完成）
+同一批次内按到达顺序分配。
+"""
+import asyncio
+import collections
+import contextvars
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# 请求结果分类
+OK = "ok"
+THROTTLED = "throttled"     # 429
+OVERLOADED = "overloaded"   # 5xx / 超时
+FAILED = "failed"           # 其他错误（参数、解析等，与负载无关，不调整上限）
+
+# 调度策略
+FAIR = "fair"
+SJF = "sjf"
+POLICIES = (FAIR, SJF)
+
+
+class Flow:
+    """一个批次在并发预算中的身份（权重和剩余产品数）"""
+
+    def __init__(self, name: str, weight: float = 1.0):
+        self.name = name
+        self.weight = max(weight, 1e-6)
+        self.remaining = 0
+        self._lock = threading.Lock()
+
+    def add(self, count: int):
+        """调整剩余产品数（负数表示完成）"""
+        with self._lock:
+            self.remaining = max(0, self.remaining + count)
+
+
+# 未声明批次的请求（单独调用、测试脚本等）共用的默认 Flow
+_DEFAULT_FLOW = Flow("default")
+_current_flow: contextvars.ContextVar = contextvars.ContextVar("concurrency_flow", default=None)
+
+
+def current_flow() -> Optional[Flow]:
+    return _current_flow.get()
+
+
+@contextmanager
+def flow(name: str, weight: float = 1.0):
+    """在当前上下文中声明一个批次，其中的大模型请求按该批次参与调度"""
+    current = Flow(name, weight)
+    token = _current_flow.set(current)
+    try:
+        yield current
+    finally:
+        _current_flow.reset(token)
+
+
+def run_in_flow(fn, current: Optional[Flow]):
+    """包装 fn，使其在其他线程中执行时也属于 current 批次"""
+    if current is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        token = _current_flow.set(current)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_flow.reset(token)
+    return wrapper
+
+
+class AIMDController:
+    """线程安全的 AIMD 并发上限控制器"""
+
+    def __init__(self, initial: int, min_limit: int = 1, max_limit: int = 32,
+                 decrease: float = 0.5, latency_factor: float = 2.5, smoothing: float = 0.1,
+                 policy: str = FAIR, spike_threshold: int = 3, spike_window: float = 10.0):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.decrease = decrease                # 乘性下调系数
+        self.latency_factor = latency_factor    # 延迟超过基线多少倍视为突增
+        self.smoothing = smoothing              # 延迟 EWMA 平滑系数
+        self.spike_threshold = max(1, spike_threshold)  # spike_window 秒内突增多少次才下调
+        self.spike_window = spike_window
+        self.inflight = 0
+        self.policy = policy if policy in POLICIES else FAIR
+        self.reason = "initial"
+        self._baseline = None                   # 成功请求的延迟基线（EWMA）
+        self._spikes = collections.deque()      # 最近的延迟突增时间
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._flow_inflight: Dict[Flow, int] = {}
+        self._waiting: Dict[Flow, list] = {}    # Flow -> 等待中的排队号（先到先得）
+        self._tickets = itertools.count()
+        self._stats = {"increases": 0, "decreases": 0, "throttled": 0, "overloaded": 0,
+                       "latency_spikes": 0, "failed": 0, "completed": 0}
+
+    def _slots(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    def _priority(self, current: Flow, ticket: int):
+        if self.policy == SJF:
+            return current.remaining, ticket
+        return self._flow_inflight.get(current, 0) / current.weight, ticket
+
+    def _next_flow(self, candidate: Optional[Flow] = None) -> Optional[Flow]:
+        """下一个名额应分给的批次（candidate 为未排队、正在尝试的批次）"""
+        # 调用方持有锁
+        best, best_key = None, None
+        for current, tickets in self._waiting.items():
+            key = self._priority(current, tickets[0])
+            if best_key is None or key < best_key:
+                best, best_key = current, key
+        if candidate is not None and candidate not in self._waiting:
+            key = self._priority(candidate, float("inf"))
+            if best_key is None or key < best_key:
+                best = candidate
+        return best
+
+    def _take(self, current: Flow):
+        # 调用方持有锁
+        self.inflight += 1
+        self._flow_inflight[current] = self._flow_inflight.get(current, 0) + 1
+
+    def try_acquire(self) -> bool:
+        """有空闲名额且按调度策略轮到当前批次时占用一个并返回 True"""
+        current = current_flow() or _DEFAULT_FLOW
+        with self._cond:
+            if self.inflight < self._slots() and self._next_flow(current) is current:
+                self._take(current)
+                return True
+            return False
+
+    def acquire(self):
+        """阻塞直到拿到名额（多个批次同时等待时按调度策略分配）"""
+        current = current_flow() or _DEFAULT_FLOW
+        with self._cond:
+            if self.inflight < self._slots() and not self._waiting:
+                self._take(current)
+                return
+            ticket = next(self._tickets)
+            tickets = self._waiting.setdefault(current, [])
+            tickets.append(ticket)
+            while not (self.inflight < self._slots() and tickets[0] == ticket
+                       and self._next_flow() is current):
+                self._cond.wait()
+            tickets.pop(0)
+            if not tickets:
+                del self._waiting[current]
+            self._take(current)
+            if self._waiting and self.inflight < self._slots():
+                self._cond.notify_all()
+
+    async def acquire_async(self, poll: float = 0.05):
+        """异步等待名额（不阻塞事件循环）"""
+        while not self.try_acquire():
+            await asyncio.sleep(poll)
+
+    def release(self, outcome: str, latency: float = 0.0):
+        """归还名额并根据结果调整上限"""
+        current = current_flow() or _DEFAULT_FLOW
+        with self._cond:
+            self.inflight -= 1
+            count = self._flow_inflight.get(current, 0) - 1
+            if count > 0:
+                self._flow_inflight[current] = count
+            else:
+                self._flow_inflight.pop(current, None)
+            now = time.monotonic()
+            self._stats["completed"] += 1
+
+            if outcome in (THROTTLED, OVERLOADED):
+                self._stats[outcome] += 1
+                self._cut(now, outcome)
+            elif outcome == FAILED:
+                self._stats["failed"] += 1
+            elif self._baseline is not None and latency > self._baseline * self.latency_factor:
+                # 单次突增可能只是个别慢请求，窗口内累计多次才下调；
+                # 突增的延迟同样计入基线，基线偏低（如首个请求特别快）时会很快追上实际水平
+                self._stats["latency_spikes"] += 1
+                reason = f"latency {latency:.1f}s > {self.latency_factor}x {self._baseline:.1f}s"
+                self._update_baseline(latency)
+                self._spikes.append(now)
+                while self._spikes and now - self._spikes[0] > self.spike_window:
+                    self._spikes.popleft()
+                if len(self._spikes) >= self.spike_threshold:
+                    self._spikes.clear()
+                    self._cut(now, reason)
+            else:
+                self._update_baseline(latency)
+                if self.limit < self.max_limit:
+                    # 每完成约 limit 个成功请求（约一个往返）加 1
+                    before = int(self.limit)
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                    if int(self.limit) > before:
+                        self._stats["increases"] += 1
+                        self.reason = "healthy"
+            self._cond.notify_all()
+
+    def _update_baseline(self, latency: float):
+        # 调用方持有锁
+        self._baseline = latency if self._baseline is None else \
+            self._baseline + self.smoothing * (latency - self._baseline)
+
+    def _cut(self, now: float, reason: str):
+        # 同一批并发请求的连续失败只下调一次（冷却时间取一个延迟基线，尚无基线时 1 秒）
+        cooldown = self._baseline if self._baseline is not None else 1.0
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        self._stats["decreases"] += 1
+        self.reason = reason
+
+    def stats(self) -> Dict:
+        """当前上限、进行中请求数、最近一次调整原因及计数"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "limit": self._slots(),
+                "inflight": self.inflight,
+                "reason": self.reason,
+                "policy": self.policy,
+                "flows": len(set(self._flow_inflight) | set(self._waiting)),
+                "latency_baseline": round(self._baseline, 3) if self._baseline is not None else None,
+            })
+        return stats
@@ -3,13 +3,15 @@
 从环境变量读取配置，支持本地开发和 Vercel 部署
 """
 import os
+import tempfile
 
 # 云雾API配置
-YUNWU_API_BASE = "https://yunwu.ai/v1"
+YUNWU_API_BASE = os.environ.get("YUNWU_API_BASE", "https://yunwu.ai/v1")
 YUNWU_API_KEY = os.environ.get("YUNWU_API_KEY", "sk-2hX6ze27mkjOWtpCbKeo9U056wR6qmN8DttWMRCvYyNluQ4C")
 MODEL_NAME = "gpt-5.1-2025-11-13"
 
 # 飞书配置
+FEISHU_API_BASE = os.environ.get("FEISHU_API_BASE", "https://open.feishu.cn/open-apis")
 FEISHU_APP_ID = os.environ.get("FEISHU_APP_ID", "cli_a73bda7327399013")
 FEISHU_APP_SECRET = os.environ.get("FEISHU_APP_SECRET", "IxStGQLRexU8XAKuu2uyAfmWQfHPVXlb")
 FEISHU_APP_TOKEN = os.environ.get("FEISHU_APP_TOKEN", "Xm6ubPCUZa2M7nsjalTczVW5nCf")
@@ -19,6 +21,82 @@ TABLE_INPUT = "tblDgzsh7WQoCxZS"      # COZEINPUTD27-2 (表1: 产品数据采集
 TABLE_OUTPUT = "tblECTD6VFMI2ofL"     # V1D27-2 (表2: 产品详情输出)
 TABLE_PROGRESS = "tblwDLoWyb6YlRZJ"   # Progress-D27-2 (表3: 批次进度)
 
+# 表1查询每页条数（records/search 接口上限 500）
+INPUT_PAGE_SIZE = int(os.environ.get("INPUT_PAGE_SIZE", "500"))
+
+# 飞书多维表格限速配置（每个 app + 数据表一个令牌桶，被限流时自动降速并退避重试）
+FEISHU_RATE_LIMIT = float(os.environ.get("FEISHU_RATE_LIMIT", "10"))     # 每张表每秒请求数上限
+FEISHU_MAX_RETRIES = int(os.environ.get("FEISHU_MAX_RETRIES", "5"))      # 限流/服务端错误的最大重试次数
+FEISHU_BACKOFF_BASE = float(os.environ.get("FEISHU_BACKOFF_BASE", "0.5"))  # 退避基数（秒）
+FEISHU_BACKOFF_MAX = float(os.environ.get("FEISHU_BACKOFF_MAX", "30"))     # 单次退避上限（秒），也是 Retry-After 的上限
+
+# /api/batches 批次列表缓存配置
+BATCHES_CACHE_TTL = float(os.environ.get("BATCHES_CACHE_TTL", "15"))      # 缓存有效期（秒）
+BATCHES_STALE_TTL = float(os.environ.get("BATCHES_STALE_TTL", "60"))      # 过期后仍可先返回旧数据并后台刷新的时长（秒）
+
+# 监控模式（--watch）配置：只拉取触发中的批次，空闲时逐步拉长检查间隔
+WATCH_MAX_INTERVAL = float(os.environ.get("WATCH_MAX_INTERVAL", "600"))      # 空闲时检查间隔上限（秒）
+WATCH_BACKOFF = float(os.environ.get("WATCH_BACKOFF", "2"))                  # 每次拉长的倍数
+WATCH_IDLE_POLLS = int(os.environ.get("WATCH_IDLE_POLLS", "3"))              # 连续多少次无新批次后开始拉长
+WATCH_FULL_SYNC_INTERVAL = float(os.environ.get("WATCH_FULL_SYNC_INTERVAL", "1800"))  # 全量核对间隔（秒）
+PROGRESS_MODIFIED_FIELD = os.environ.get("PROGRESS_MODIFIED_FIELD", "")     # 表3的"修改时间"字段名，置空时只在本地比较
+
+# 标题生成并发配置
+GENERATION_CONCURRENCY = int(os.environ.get("GENERATION_CONCURRENCY", "8"))          # 默认并发数
+MAX_GENERATION_CONCURRENCY = int(os.environ.get("MAX_GENERATION_CONCURRENCY", "32"))  # 并发数上限
+YUNWU_RATE_LIMIT = float(os.environ.get("YUNWU_RATE_LIMIT", "5"))                    # 云雾API每秒请求数，0 表示不限
+YUNWU_BACKOFF_MAX = float(os.environ.get("YUNWU_BACKOFF_MAX", "30"))                  # 云雾API单次重试等待上限（秒），Retry-After 超过时按此值
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "200"))             # 异步流水线阶段间队列长度
+BATCH_PARALLELISM = int(os.environ.get("BATCH_PARALLELISM", "3"))                   # 同时处理的批次数（共用上面的并发上限）
+BATCH_POLICY = os.environ.get("BATCH_POLICY", "fair")                               # 批次间分配并发名额: fair(加权公平) / sjf(剩余最少优先)
+
+# 批次断点日志（记录每个产品的处理状态，中断后从断点继续；置空关闭）
+BATCH_JOURNAL_PATH = os.environ.get("BATCH_JOURNAL_PATH", os.path.join(tempfile.gettempdir(), "feishu_batch_journal.sqlite3"))
+BATCH_JOURNAL_MAX_AGE = float(os.environ.get("BATCH_JOURNAL_MAX_AGE", "86400"))   # 批次日志超过多少秒未更新即过期删除，0 表示不过期
+
+# Webhook 任务队列配置（server.py --webhook 模式）
+JOB_QUEUE_PATH = os.environ.get("JOB_QUEUE_PATH", os.path.join(tempfile.gettempdir(), "feishu_jobs.sqlite3"))
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", "2"))                     # 消费队列的工作线程数
+JOB_VISIBILITY_TIMEOUT = float(os.environ.get("JOB_VISIBILITY_TIMEOUT", "120"))  # 租约时长（秒），处理中由心跳续期
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))                  # 最多执行次数
+JOB_RETRY_DELAY = float(os.environ.get("JOB_RETRY_DELAY", "30"))                 # 首次重试等待（秒），之后指数退避
+
+# 表2 流式写入配置
+WRITE_FLUSH_SIZE = int(os.environ.get("WRITE_FLUSH_SIZE", "100"))       # 攒够多少条写一次（batch_create 上限 100）
+WRITE_MAX_DELAY = float(os.environ.get("WRITE_MAX_DELAY", "10"))        # 最早一条标题最多等待多久就写入（秒）
+OUTPUT_WRITE_MODE = os.environ.get("OUTPUT_WRITE_MODE", "upsert")        # upsert: 已有 ASIN 更新原记录; append: 总是新建
+OUTPUT_INDEX_TTL = float(os.environ.get("OUTPUT_INDEX_TTL", "3600"))     # 表2 ASIN 索引重新全量扫描的间隔（秒），0 表示不过期
+
+# 表3 处理进度（处理中定时把 "x/N、速度、预计剩余时间" 写入 COZE result，多个批次合并为一次 batch_update）
+PROGRESS_UPDATE_INTERVAL = float(os.environ.get("PROGRESS_UPDATE_INTERVAL", "5"))  # 最短更新间隔（秒），0 关闭
+PROGRESS_STALE_AFTER = float(os.environ.get("PROGRESS_STALE_AFTER", "600"))  # 进度超过多少秒未更新视为进程已中断（秒）
+
+# 批次耗时追踪（设置目录后每个批次写出一个 Chrome trace 文件，置空关闭）
+TRACE_DIR = os.environ.get("TRACE_DIR", "")
+
+# HTTP 连接池配置
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "10"))                 # 每个主机保留的空闲长连接数
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "10"))   # 建立连接超时（秒）
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "60"))         # 读取响应超时（秒）
+HTTP_IDLE_TIMEOUT = float(os.environ.get("HTTP_IDLE_TIMEOUT", "50"))         # 空闲连接超过该时间后丢弃（秒）
+
+# 标题缓存配置（提示词内容变化时请递增 PROMPT_VERSION，使旧缓存失效）
+PROMPT_VERSION = "1"
+TITLE_CACHE_PATH = os.environ.get("TITLE_CACHE_PATH", os.path.join(tempfile.gettempdir(), "feishu_title_cache.sqlite3"))  # 置空关闭缓存
+TITLE_CACHE_MAX_ENTRIES = int(os.environ.get("TITLE_CACHE_MAX_ENTRIES", "50000"))
+TITLE_CACHE_MAX_AGE = float(os.environ.get("TITLE_CACHE_MAX_AGE", str(30 * 86400)))   # 缓存有效期（秒）
+
+# 标题规则（与提示词中的规则保持一致）
+TITLE_MIN_LENGTH = 100
+TITLE_MAX_LENGTH = 110
+BANNED_BRANDS = ["Nelko", "Phomemo", "NIIMBOT", "TransOurDream", "SUPVAN", "JADENS"]
+BANNED_WORDS = ["battery", "batteries", "rechargeable"]
+
+# 每次请求的候选标题数（>1 时一次请求多个候选，在本地挑选最合规的）
+TITLE_CANDIDATES = int(os.environ.get("TITLE_CANDIDATES", "1"))
+# 候选获取方式: n(使用接口的 n 参数) 或 lines(让模型在一个回答中逐行给出)
+TITLE_CANDIDATES_MODE = os.environ.get("TITLE_CANDIDATES_MODE", "n")
+
 # 标题生成提示词
 TITLE_GENERATION_PROMPT = """你是一个专业的电商产品标题优化专家。请根据以下信息生成一个优化的英文产品标题。
 
@@ -43,3 +121,27 @@ TITLE_GENERATION_PROMPT = """你是一个专业的电商产品标题优化专家
 确保字符数严格在 100-110 之间。
 
 现在请生成标题："""
+
+# 多产品合并请求配置（TITLE_BATCH_SIZE > 1 时把多个产品放进一次请求，规则只发送一次）
+TITLE_BATCH_SIZE = int(os.environ.get("TITLE_BATCH_SIZE", "1"))                       # 每次请求的产品数，1 表示不合并
+TITLE_BATCH_MAX_TOKENS = int(os.environ.get("TITLE_BATCH_MAX_TOKENS", "4000"))        # 合并请求的 max_tokens 上限
+TITLE_BATCH_TOKENS_PER_ITEM = 80                                                      # 每个产品输出预留的 token 数
+
+# 多产品合并请求提示词（规则与 TITLE_GENERATION_PROMPT 保持一致）
+TITLE_BATCH_PROMPT = """你是一个专业的电商产品标题优化专家。请为下面 JSON 数组中的每个产品分别生成一个优化的英文产品标题。
+
+## 输入信息（每项的 id 用于对应输出）：
+{products}
+
+## 标题生成规则（每个标题都必须严格遵守）：
+1. 使用 name_format 的结构构建标题
+2. 标题总字符数（含空格）必须在 100-110 个字符之间（这是硬性要求！）
+3. 保留产品核心本质，突出独特卖点和优势
+4. 不包含任何品牌名（如 Nelko, Phomemo, NIIMBOT, TransOurDream, SUPVAN, JADENS 等）
+5. 保持英文，不翻译成中文
+6. 如果是单品，不添加 "1pack"
+7. 绝对不能使用以下词汇：battery, batteries, rechargeable
+
+## 输出要求：
+只输出一个 JSON 数组，每个产品一项，格式为 {{"id": "输入中的id", "title": "优化后的标题"}}，
+不要包含任何解释或其他内容。确保每个标题的字符数严格在 100-110 之间。"""
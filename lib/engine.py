@@ -0,0 +1,224 @@
+"""
+标题生成引擎
+用有界线程池并发生成标题：每个产品完成时立即回调（写入表2等），日志回调和结果保持输入顺序；
+产品也可以是逐页拉取的迭代器，取到一个就提交一个，不必等全部拉取完
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from .config import GENERATION_CONCURRENCY, MAX_GENERATION_CONCURRENCY, TITLE_BATCH_SIZE
+from .yunwu import generate_product_title, generate_titles_batched, batch_limit
+from .concurrency import current_flow, run_in_flow
+from .metrics import PRODUCTS
+from . import trace
+
+
+def clamp_concurrency(value, default: int = GENERATION_CONCURRENCY) -> int:
+    """把外部传入的并发数规整到 1 ~ MAX_GENERATION_CONCURRENCY"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(value, MAX_GENERATION_CONCURRENCY))
+
+
+def _generate_one(generate: Callable, index: int, product: Dict) -> Dict:
+    """生成单个产品的标题，异常转换为结果中的 error"""
+    outcome = {
+        "index": index,
+        "asin": product.get("asin", "Unknown"),
+        "record_id": product.get("record_id"),
+        "title": None,
+        "status": "success",
+        "error": None,
+    }
+    start = time.perf_counter()
+    try:
+        with trace.span("product", index=index, asin=outcome["asin"]):
+            title = generate(product)
+        if title:
+            outcome["title"] = title
+        else:
+            outcome["status"] = "failed"
+            outcome["error"] = "生成失败"
+    except Exception as e:
+        outcome["status"] = "error"
+        outcome["error"] = str(e)
+    outcome["latency"] = round(time.perf_counter() - start, 3)
+    return outcome
+
+
+def _submit_chunk(pool: ThreadPoolExecutor, generate: Callable, generate_batch: Callable,
+                  start: int, chunk: List[Dict]) -> List[Future]:
+    """提交一组产品的合并请求，返回每个产品各自的 Future
+
+    合并请求完成后，成功的产品直接得到结果，其余产品再提交单产品生成任务。
+    """
+    futures = [Future() for _ in chunk]
+    started = time.perf_counter()
+
+    generate_one = trace.bind(_generate_one)
+
+    def run_batch():
+        try:
+            with trace.span("product.batch", first=start, count=len(chunk)):
+                return generate_batch(chunk)
+        except Exception:
+            return [None] * len(chunk)
+
+    def on_batch_done(batch_future: Future):
+        latency = round(time.perf_counter() - started, 3)
+        for offset, (product, title, future) in enumerate(zip(chunk, batch_future.result(), futures)):
+            if title:
+                future.set_result({
+                    "index": start + offset,
+                    "asin": product.get("asin", "Unknown"),
+                    "record_id": product.get("record_id"),
+                    "title": title,
+                    "status": "success",
+                    "error": None,
+                    "latency": latency,
+                })
+            else:
+                single = pool.submit(generate_one, generate, start + offset, product)
+                single.add_done_callback(lambda f, target=future: target.set_result(f.result()))
+
+    pool.submit(trace.bind(run_batch)).add_done_callback(on_batch_done)
+    return futures
+
+
+def _track_flow(current, generate: Callable, generate_batch: Callable):
+    """让生成函数在工作线程中属于 current 批次，并在完成后扣减剩余产品数"""
+    def generate_in_flow(product):
+        try:
+            return generate(product)
+        finally:
+            current.add(-1)
+
+    def generate_batch_in_flow(chunk):
+        titles = generate_batch(chunk)
+        current.add(-sum(1 for title in titles if title))    # 失败的产品改走单产品流程，届时再扣减
+        return titles
+
+    return run_in_flow(generate_in_flow, current), run_in_flow(generate_batch_in_flow, current)
+
+
+# 提交结束标记
+_FEED_END = object()
+
+
+def _completed(future: Future, on_complete: Optional[Callable[[Dict], None]]) -> Future:
+    """产品完成时立即调用 on_complete，返回在其执行完之后才完成的 Future"""
+    done = Future()
+
+    def callback(f: Future):
+        outcome = f.result()
+        PRODUCTS.inc(outcome["status"])
+        try:
+            if on_complete:
+                on_complete(outcome)
+        except Exception as e:
+            done.set_exception(e)
+        else:
+            done.set_result(outcome)
+
+    future.add_done_callback(callback)
+    return done
+
+
+def _submit_all(pool: ThreadPoolExecutor, products: Iterable[Dict], generate: Callable,
+                generate_batch: Callable, batch_size: int, current) -> Iterator[Future]:
+    """按输入顺序提交产品，逐个产出每个产品的 Future"""
+    products = iter(products)
+    if batch_size > 1:
+        start = 1
+        while True:
+            chunk = list(islice(products, batch_size))
+            if not chunk:
+                return
+            if current is not None:
+                current.add(len(chunk))
+            yield from _submit_chunk(pool, generate, generate_batch, start, chunk)
+            start += len(chunk)
+    else:
+        generate_one = trace.bind(_generate_one)
+        for i, product in enumerate(products, 1):
+            if current is not None:
+                current.add(1)
+            yield pool.submit(generate_one, generate, i, product)
+
+
+def _feed(futures: Iterator[Future], limit: int) -> Iterator[Future]:
+    """在后台线程中遍历 futures（即拉取产品并提交），未完成的产品最多 limit 个
+
+    按完成数而不是按顺序消费数限流，排在前面的慢产品不会挡住后续产品的提交。
+    拉取产品的异常在已提交的产品都产出后抛出。
+    """
+    ahead: queue.Queue = queue.Queue()
+    slots = threading.Semaphore(limit)
+    error = []
+
+    def run():
+        try:
+            while True:
+                slots.acquire()
+                future = next(futures, _FEED_END)
+                if future is _FEED_END:
+                    break
+                future.add_done_callback(lambda _: slots.release())
+                ahead.put(future)
+        except Exception as e:
+            error.append(e)
+        finally:
+            ahead.put(_FEED_END)
+
+    threading.Thread(target=trace.bind(run), name="title-feed", daemon=True).start()
+    while True:
+        future = ahead.get()
+        if future is _FEED_END:
+            break
+        yield future
+    if error:
+        raise error[0]
+
+
+def generate_titles(products: Iterable[Dict], concurrency: int = GENERATION_CONCURRENCY,
+                    on_result: Optional[Callable[[Dict], None]] = None,
+                    generate: Callable[[Dict], Optional[str]] = generate_product_title,
+                    batch_size: int = TITLE_BATCH_SIZE,
+                    generate_batch: Callable[[List[Dict]], List[Optional[str]]] = generate_titles_batched,
+                    on_complete: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """并发生成一批产品的标题
+
+    返回与 products 一一对应的结果列表，每项包含 index(从1开始)/asin/title/status/error/latency。
+    on_complete 在每个产品完成时立即回调（在工作线程中，需线程安全），写入表2、进度等应放在这里，
+    不会被排在前面的慢产品挡住；on_result 按输入顺序逐个回调，只用于输出有序日志。
+    返回前所有回调都已执行完。
+    products 不是列表时（如 ProductStream）在后台线程中边拉取边提交，未完成的产品最多 concurrency*4 个；
+    拉取中途失败时已提交的产品照常完成并回调，之后抛出拉取的异常。
+    batch_size > 1 时每 batch_size 个产品合并为一次请求，合并请求中失败的产品改走单产品流程。
+    在 flow() 中调用时，工作线程中的请求都计入该批次，剩余产品数随生成进度更新（供 sjf 调度）。
+    """
+    concurrency = clamp_concurrency(concurrency)
+    batch_size = batch_limit(batch_size)
+    current = current_flow()
+    if current is not None:
+        generate, generate_batch = _track_flow(current, generate, generate_batch)
+    outcomes = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="title") as pool:
+        futures = (_completed(future, on_complete)
+                   for future in _submit_all(pool, products, generate, generate_batch, batch_size, current))
+        if isinstance(products, (list, tuple)):
+            futures = list(futures)
+        else:
+            futures = _feed(futures, concurrency * 4)
+        for future in futures:
+            outcome = future.result()
+            if on_result:
+                on_result(outcome)
+            outcomes.append(outcome)
+    return outcomes
@@ -2,73 +2,197 @@
 飞书 API 封装模块
 提供飞书多维表格的读写功能
 """
-import urllib.request
-import urllib.error
 import json
-import ssl
+import math
+import queue
+import random
+import re
+import threading
 import time
-from typing import List, Dict, Optional
+from datetime import datetime
+from typing import Iterator, List, Dict, Optional, Tuple
 from .config import (
-    FEISHU_APP_ID, FEISHU_APP_SECRET, FEISHU_APP_TOKEN,
-    TABLE_INPUT, TABLE_OUTPUT, TABLE_PROGRESS
+    FEISHU_API_BASE, FEISHU_APP_TOKEN,
+    TABLE_INPUT, TABLE_OUTPUT, TABLE_PROGRESS, INPUT_PAGE_SIZE, PROGRESS_MODIFIED_FIELD, PROGRESS_STALE_AFTER,
+    FEISHU_RATE_LIMIT, FEISHU_MAX_RETRIES, FEISHU_BACKOFF_BASE, FEISHU_BACKOFF_MAX, OUTPUT_WRITE_MODE
 )
+from .http_client import get_client, HTTPError
+from .ratelimit import AdaptiveRateLimiter
+from .token_manager import get_token_manager, INVALID_TOKEN_CODES
+from .output_index import get_output_index
+from . import trace
+from .metrics import INPUT_PAGE_SECONDS, WRITE_SECONDS, FEISHU_RETRIES, gauge, register_collector
+
+_BEARER = "Bearer "
+
+# 频率限制错误码（99991400 为开放平台通用限流，1254290 为多维表格 TooManyRequest）
+RATE_LIMIT_CODES = {99991400, 1254290}
+# 可重试的多维表格错误码（1254291 写冲突）
+RETRYABLE_CODES = {1254291}
+# 记录不存在（表2索引中的记录已被删除）
+RECORD_NOT_FOUND_CODES = {1254043}
+
+# 按 (app_token, table_id) 区分的限速器
+_limiters: Dict[Tuple[str, str], AdaptiveRateLimiter] = {}
+_limiters_lock = threading.Lock()
+_TABLE_PATH = re.compile(r"/bitable/v1/apps/([^/?]+)/tables/([^/?]+)")
+
+
+def feishu_limiter(url: str) -> Optional[AdaptiveRateLimiter]:
+    """返回 URL 所属数据表的限速器，非多维表格接口返回 None"""
+    match = _TABLE_PATH.search(url)
+    if not match:
+        return None
+    key = (match.group(1), match.group(2))
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = AdaptiveRateLimiter(FEISHU_RATE_LIMIT, burst=max(1, int(FEISHU_RATE_LIMIT)))
+        return limiter
+
+
+def limiter_stats() -> Dict[str, Dict]:
+    """各数据表限速器的当前速率和被限流次数"""
+    with _limiters_lock:
+        items = list(_limiters.items())
+    return {
+        f"{app}/{table}": dict(limiter.stats, rate=round(limiter.rate, 2))
+        for (app, table), limiter in items
+    }
 
-# SSL上下文（跳过验证，生产环境建议启用验证）
-SSL_CONTEXT = ssl.create_default_context()
-SSL_CONTEXT.check_hostname = False
-SSL_CONTEXT.verify_mode = ssl.CERT_NONE
 
-# Token 缓存
-_token_cache = {"token": None, "expires_at": 0}
+_LIMITER_RATE = gauge("feishu_rate_limit", "各数据表限速器的当前速率（请求/秒）", ["table"])
 
 
-def http_request(url: str, method: str = "GET", headers: Dict = None, data: Dict = None, timeout: int = 30) -> Dict:
-    """发送HTTP请求"""
-    if headers is None:
-        headers = {}
+def _collect_limiters():
+    for table, stats in limiter_stats().items():
+        _LIMITER_RATE.set(stats["rate"], table)
 
-    body = None
-    if data:
-        body = json.dumps(data).encode('utf-8')
-        if 'Content-Type' not in headers:
-            headers['Content-Type'] = 'application/json'
 
-    req = urllib.request.Request(url, data=body, headers=headers, method=method)
+register_collector(_collect_limiters)
+
 
+def header_float(headers, name: str) -> Optional[float]:
     try:
-        with urllib.request.urlopen(req, timeout=timeout, context=SSL_CONTEXT) as response:
-            return json.loads(response.read().decode('utf-8'))
-    except urllib.error.HTTPError as e:
-        error_body = e.read().decode('utf-8')
-        raise Exception(f"HTTP {e.code}: {error_body}")
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
 
 
-def get_feishu_token() -> str:
-    """获取飞书访问令牌（带缓存）"""
-    global _token_cache
-    current_time = time.time()
+def retry_after_seconds(headers, limit: float = FEISHU_BACKOFF_MAX) -> float:
+    """从 Retry-After / x-ogw-ratelimit-reset 响应头读取需要等待的秒数
 
-    # Token 有效期2小时，提前5分钟刷新
-    if _token_cache["token"] and current_time < _token_cache["expires_at"] - 300:
-        return _token_cache["token"]
+    不超过 limit：过大或异常的值（inf、nan）会让整个批次卡在一次等待里，同时占着并发名额。
+    """
+    for name in ("retry-after", "x-ogw-ratelimit-reset"):
+        value = header_float(headers, name)
+        if value is not None and math.isfinite(value):
+            return min(max(0.0, value), limit)
+        if value is not None and value > 0:
+            return limit
+    return 0.0
 
-    url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
-    data = {
-        "app_id": FEISHU_APP_ID,
-        "app_secret": FEISHU_APP_SECRET
-    }
-    result = http_request(url, method="POST", data=data)
 
-    if result.get("code") == 0:
-        _token_cache["token"] = result["tenant_access_token"]
-        _token_cache["expires_at"] = current_time + result.get("expire", 7200)
-        return _token_cache["token"]
-    raise Exception(f"获取飞书token失败: {result}")
+def backoff_delay(attempt: int, retry_after: float = 0.0) -> float:
+    """带随机抖动的指数退避时长，不小于服务端要求的等待时间"""
+    delay = random.uniform(0, min(FEISHU_BACKOFF_MAX, FEISHU_BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after)
+
+
+def retry_reason(status: int, code) -> Optional[str]:
+    """需要退避重试的响应返回原因（throttled / server_error / conflict），否则返回 None"""
+    if status == 429 or code in RATE_LIMIT_CODES:
+        return "throttled"
+    if status >= 500:
+        return "server_error"
+    if code in RETRYABLE_CODES:
+        return "conflict"
+    return None
+
+
+def _send(method: str, url: str, headers: Dict, data: Dict, timeout: int) -> Tuple[int, Dict[str, str], Dict]:
+    """发送请求，返回 (状态码, 响应头, 解析后的响应体)
+
+    4xx/5xx 的响应体不是 JSON 时（如网关返回的纯文本 429、HTML 502）以 {"msg": 原文} 代替，由调用方按状态码处理。
+    """
+    headers = dict(headers or {})
+    body = None
+    if data:
+        body = json.dumps(data).encode('utf-8')
+        headers.setdefault('Content-Type', 'application/json')
+    status, response_headers, raw = get_client().request(method, url, headers=headers, body=body, timeout=timeout)
+    try:
+        result = json.loads(raw.decode('utf-8'))
+    except ValueError:
+        if status >= 400:
+            return status, response_headers, {"msg": raw.decode('utf-8', errors='replace')[:500]}
+        raise
+    return status, response_headers, result
+
+
+def http_request(url: str, method: str = "GET", headers: Dict = None, data: Dict = None, timeout: int = 30) -> Dict:
+    """发送HTTP请求（经由共享连接池）
+
+    - 多维表格接口经过按数据表区分的自适应限速器；遇到 429 / 限流错误码 / 5xx 时
+      按 Retry-After 和带抖动的指数退避重试，最多 FEISHU_MAX_RETRIES 次
+    - 携带的令牌已被替换时自动换用新令牌；接口返回令牌失效错误码时刷新令牌并重试一次
+    - 最终状态码 >= 400 时抛出 HTTPError
+    """
+    manager = get_token_manager()
+    limiter = feishu_limiter(url)
+    auth = (headers or {}).get("Authorization", "")
+    if auth.startswith(_BEARER):
+        token = manager.current(auth[len(_BEARER):])
+        headers = dict(headers, Authorization=_BEARER + token)
+    else:
+        token = None
+
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire()
+        status, response_headers, result = _send(method, url, headers, data, timeout)
+        code = result.get("code")
+
+        if token and code in INVALID_TOKEN_CODES:
+            FEISHU_RETRIES.inc("invalid_token")
+            manager.invalidate(token)
+            token = None        # 只换一次令牌
+            headers = dict(headers, Authorization=_BEARER + manager.get())
+            continue
+
+        reason = retry_reason(status, code)
+        if reason:
+            retry_after = retry_after_seconds(response_headers)
+            if reason == "throttled" and limiter:
+                limiter.penalize(retry_after)
+            if attempt >= FEISHU_MAX_RETRIES:
+                raise Exception(f"飞书接口重试 {attempt} 次后仍失败 (HTTP {status}): {result}")
+            FEISHU_RETRIES.inc(reason)
+            delay = backoff_delay(attempt, retry_after)
+            with trace.span("feishu.backoff", cat="sleep", status=status, attempt=attempt + 1):
+                time.sleep(delay)
+            attempt += 1
+            continue
+
+        if limiter:
+            limiter.reward()
+            server_limit = header_float(response_headers, "x-ogw-ratelimit-limit")
+            if server_limit:
+                limiter.cap(server_limit)
+        if status >= 400:
+            raise HTTPError(status, json.dumps(result, ensure_ascii=False), response_headers)
+        return result
+
+
+def get_feishu_token() -> str:
+    """获取飞书访问令牌（进程内共享，单飞刷新）"""
+    return get_token_manager().get()
 
 
 def get_all_batches(token: str) -> List[Dict]:
     """获取表3中所有批次及其状态"""
-    url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_PROGRESS}/records?page_size=100"
+    url = f"{FEISHU_API_BASE}/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_PROGRESS}/records?page_size=100"
     headers = {"Authorization": f"Bearer {token}"}
 
     result = http_request(url, headers=headers)
@@ -88,18 +212,142 @@ def get_all_batches(token: str) -> List[Dict]:
     return batches
 
 
-def get_triggered_batches(token: str) -> List[Dict]:
-    """获取表3中 COZE RUN 被勾选且 COZE result 为空的批次"""
-    all_batches = get_all_batches(token)
-    return [
-        b for b in all_batches
-        if b["coze_run"] == True and (not b["coze_result"] or b["coze_result"].strip() == "")
+# 查询触发中的批次时只返回这些列
+PROGRESS_FIELD_NAMES = ["Batch#", "COZE RUN", "COZE result"]
+
+# 处理中写入 COZE result 的进度文本前缀（见 progress.progress_text）
+PROGRESS_PREFIX = "处理中"
+# 进度文本末尾的心跳时间标签，只有进度上报器会写入，用于判断处理进程是否已中断
+PROGRESS_HEARTBEAT = "更新于"
+# api/webhook.py 收到触发后写入的占位文本（等待在控制台处理，不是进度）
+WEBHOOK_ACCEPTED_TEXT = "已接收，等待处理"
+
+_HEARTBEAT_FORMAT = "%Y-%m-%d %H:%M:%S %z"
+_HEARTBEAT_PATTERN = re.compile(re.escape(PROGRESS_HEARTBEAT) + r" (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} [+-]\d{4})\s*$")
+
+
+def heartbeat_text(timestamp: Optional[float] = None) -> str:
+    """进度文本末尾的心跳部分，如 "更新于 2026-10-17 15:00:00 +0800"（带时区，跨机器可比较）"""
+    moment = datetime.fromtimestamp(time.time() if timestamp is None else timestamp).astimezone()
+    return f"{PROGRESS_HEARTBEAT} {moment.strftime(_HEARTBEAT_FORMAT)}"
+
+
+def progress_heartbeat(text) -> Optional[float]:
+    """取出进度文本中的心跳时间（时间戳秒）；不是进度上报器写入的进度时返回 None"""
+    text = field_text(text).strip()
+    if not text.startswith(PROGRESS_PREFIX):
+        return None
+    match = _HEARTBEAT_PATTERN.search(text)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1), _HEARTBEAT_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+def is_progress_text(text) -> bool:
+    """COZE result 是否为进度上报器写入的进度（而不是最终结果或 webhook 的占位文本）"""
+    return progress_heartbeat(text) is not None
+
+
+def is_stale_progress(text, now: Optional[float] = None) -> bool:
+    """进度的心跳是否已超过 PROGRESS_STALE_AFTER 秒（处理进程已中断）"""
+    heartbeat = progress_heartbeat(text)
+    if heartbeat is None or PROGRESS_STALE_AFTER <= 0:
+        return False
+    return heartbeat < (time.time() if now is None else now) - PROGRESS_STALE_AFTER
+
+
+def triggered_filter(since_ms: Optional[int] = None) -> Dict:
+    """COZE RUN 被勾选且 COZE result 为空的查询条件（由服务端执行）
+
+    配置了 PROGRESS_MODIFIED_FIELD 且给出 since_ms 时，再加上"修改时间晚于 since_ms"的条件。
+    飞书按日期比较该条件，返回的是超集，精确比较由调用方用 last_modified_time 完成。
+    """
+    conditions = [
+        {"field_name": "COZE RUN", "operator": "is", "value": ["true"]},
+        {"field_name": "COZE result", "operator": "isEmpty", "value": []},
     ]
+    if PROGRESS_MODIFIED_FIELD and since_ms is not None:
+        conditions.append({"field_name": PROGRESS_MODIFIED_FIELD, "operator": "isGreater",
+                           "value": ["ExactDate", str(since_ms)]})
+    return {"conjunction": "and", "conditions": conditions}
+
+
+def stale_progress_filter() -> Dict:
+    """COZE RUN 被勾选且 COZE result 为带心跳的进度的查询条件（由服务端执行，心跳是否过期由调用方判断）"""
+    return {"conjunction": "and", "conditions": [
+        {"field_name": "COZE RUN", "operator": "is", "value": ["true"]},
+        {"field_name": "COZE result", "operator": "contains", "value": [PROGRESS_PREFIX]},
+        {"field_name": "COZE result", "operator": "contains", "value": [PROGRESS_HEARTBEAT]},
+    ]}
+
+
+def _search_progress(token: str, query_filter: Dict) -> List[Dict]:
+    """按条件分页查询表3，返回原始记录"""
+    base_url = f"{FEISHU_API_BASE}/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_PROGRESS}/records/search?page_size=500"
+    headers = {"Authorization": f"Bearer {token}"}
+    query = {
+        "field_names": PROGRESS_FIELD_NAMES,
+        "filter": query_filter,
+        "automatic_fields": True
+    }
+
+    items = []
+    page_token = None
+    while True:
+        url = base_url + (f"&page_token={page_token}" if page_token else "")
+        result = http_request(url, method="POST", headers=headers, data=query)
+        if result.get("code") != 0:
+            raise Exception(f"查询触发批次失败: {result}")
+        items.extend(result.get("data", {}).get("items") or [])
+        if not result.get("data", {}).get("has_more"):
+            break
+        page_token = result.get("data", {}).get("page_token")
+    return items
+
+
+def search_triggered_batches(token: str, since_ms: Optional[int] = None) -> List[Dict]:
+    """按条件查询表3中触发中的批次，返回 [{"batch", "record_id", "modified"}]
+
+    modified 为记录的 last_modified_time（毫秒），供监控模式维护高水位。
+    不带 since_ms 的全量查询还会找回进度心跳超过 PROGRESS_STALE_AFTER 秒的批次
+    （处理进程中途退出时 COZE result 停留在"处理中"，重新处理时从断点日志继续）。
+    """
+    items = _search_progress(token, triggered_filter(since_ms))
+    include_stale = since_ms is None and PROGRESS_STALE_AFTER > 0
+    if include_stale:
+        items += _search_progress(token, stale_progress_filter())
+    now = time.time()
+
+    batches = []
+    seen = set()
+    for item in items:
+        fields = item.get("fields", {})
+        batch_num = field_text(fields.get("Batch#"))
+        modified = item.get("last_modified_time") or 0
+        result_text = field_text(fields.get("COZE result")).strip()
+        # 服务端已过滤，这里再按原规则核对一次（COZE result 只含空白也视为未处理）
+        triggered = not result_text or (include_stale and is_stale_progress(result_text, now))
+        if batch_num and fields.get("COZE RUN") == True and triggered and item.get("record_id") not in seen:
+            seen.add(item.get("record_id"))
+            batches.append({
+                "batch": batch_num,
+                "record_id": item.get("record_id"),
+                "modified": modified,
+            })
+    return batches
+
+
+def get_triggered_batches(token: str) -> List[Dict]:
+    """获取表3中 COZE RUN 被勾选且 COZE result 为空的批次（服务端过滤，读取全部分页）"""
+    return search_triggered_batches(token)
 
 
 def update_batch_result(token: str, record_id: str, result_text: str) -> bool:
     """更新表3中批次的 COZE result 字段"""
-    url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_PROGRESS}/records/{record_id}"
+    url = f"{FEISHU_API_BASE}/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_PROGRESS}/records/{record_id}"
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
@@ -117,79 +365,384 @@ def update_batch_result(token: str, record_id: str, result_text: str) -> bool:
         return False
 
 
-def get_products_by_batch(token: str, batch_num: str) -> List[Dict]:
-    """获取指定批次的所有产品"""
-    base_url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_INPUT}/records"
-    headers = {"Authorization": f"Bearer {token}"}
+def progress_records_payload(updates: Dict[str, str]) -> Dict:
+    """构造批量更新表3 COZE result 的 batch_update 请求体（record_id -> 文本）"""
+    return {
+        "records": [
+            {"record_id": record_id, "fields": {"COZE result": text}}
+            for record_id, text in updates.items()
+        ]
+    }
 
-    all_products = []
-    page_token = None
 
-    while True:
-        url = f"{base_url}?page_size=100"
-        if page_token:
-            url += f"&page_token={page_token}"
+def update_batch_results(token: str, updates: Dict[str, str]) -> int:
+    """用一次 batch_update 更新多个批次的 COZE result（每次最多 1000 条），返回更新条数，失败时抛出异常"""
+    url = f"{FEISHU_API_BASE}/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_PROGRESS}/records/batch_update"
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
+    items = list(updates.items())
+    for start in range(0, len(items), 1000):
+        chunk = dict(items[start:start + 1000])
+        result = http_request(url, method="POST", headers=headers, data=progress_records_payload(chunk))
+        if result.get("code") != 0:
+            raise Exception(f"批量更新表3失败: {result}")
+    return len(items)
+
+
+# 生成标题需要的表1字段（只让服务端返回这些列）
+INPUT_FIELD_NAMES = ["ASIN", "商品标题", "产品卖点", "name format", "重量_1", "体积_1"]
+
+
+def field_text(value) -> str:
+    """把多维表格字段值统一转成文本（兼容纯文本、富文本分段和超链接对象）"""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return str(value.get("text", ""))
+    if isinstance(value, list):
+        return "".join(field_text(v) for v in value)
+    return str(value)
+
+
+def _batch_filter(batch_num: str) -> Dict:
+    """按 Batch # 过滤的查询条件（由服务端执行）"""
+    return {
+        "conjunction": "and",
+        "conditions": [
+            {"field_name": "Batch #", "operator": "is", "value": [batch_num]}
+        ]
+    }
 
-        result = http_request(url, headers=headers)
 
+class Product:
+    """表1中的一个产品（__slots__ 紧凑存储，支持 product.get("asin") / product["asin"] 式读取）"""
+    __slots__ = ("record_id", "asin", "original_title", "bullets", "name_format", "weight", "size")
+
+    def __init__(self, record_id: Optional[str] = None, asin: str = "", original_title: str = "",
+                 bullets: str = "", name_format: str = "", weight: str = "", size: str = ""):
+        self.record_id = record_id
+        self.asin = asin
+        self.original_title = original_title
+        self.bullets = bullets
+        self.name_format = name_format
+        self.weight = weight
+        self.size = size
+
+    def get(self, name: str, default=None):
+        return getattr(self, name) if name in self.__slots__ else default
+
+    def __getitem__(self, name: str):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"Product(asin={self.asin!r}, record_id={self.record_id!r})"
+
+
+def parse_product(item: Dict) -> Product:
+    """把表1记录转换为产品"""
+    fields = item.get("fields", {})
+    return Product(
+        record_id=item.get("record_id"),
+        asin=field_text(fields.get("ASIN")),
+        original_title=field_text(fields.get("商品标题")),
+        bullets=field_text(fields.get("产品卖点")),
+        name_format=field_text(fields.get("name format")),
+        weight=field_text(fields.get("重量_1")),
+        size=field_text(fields.get("体积_1")),
+    )
+
+
+def products_page_request(batch_num: str, page_token: Optional[str] = None) -> Tuple[str, Dict]:
+    """构造查询批次产品某一页的请求，返回 (url, 请求体)"""
+    url = f"{FEISHU_API_BASE}/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_INPUT}/records/search?page_size={INPUT_PAGE_SIZE}"
+    if page_token:
+        url += f"&page_token={page_token}"
+    query = {
+        "field_names": INPUT_FIELD_NAMES,
+        "filter": _batch_filter(batch_num),
+        "automatic_fields": False
+    }
+    return url, query
+
+
+def count_products_by_batch(token: str, batch_num: str) -> int:
+    """查询批次的产品数（只取一条记录，读取返回的 total）"""
+    url = f"{FEISHU_API_BASE}/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_INPUT}/records/search?page_size=1"
+    query = {"field_names": ["ASIN"], "filter": _batch_filter(batch_num), "automatic_fields": False}
+    result = http_request(url, method="POST", headers={"Authorization": f"Bearer {token}"}, data=query)
+    if result.get("code") != 0:
+        raise Exception(f"查询批次产品数失败: {result}")
+    return int(result.get("data", {}).get("total") or 0)
+
+
+# 后台拉取结束标记
+_PAGES_END = object()
+
+
+class ProductStream:
+    """逐页拉取批次产品（服务端按批次过滤，只返回生成标题用到的字段）
+
+    迭代时逐个产出 Product，第一页返回后即可开始生成标题；prefetch 为 True 时由后台线程
+    提前拉取下一页（最多领先一页，消费慢时暂停拉取），与当前页的标题生成重叠。
+    total 为服务端返回的批次产品总数，读取时若尚未拉取则先同步拉取第一页。
+    """
+
+    def __init__(self, token: str, batch_num: str, prefetch: bool = True):
+        self.token = token
+        self.batch_num = batch_num
+        self.prefetch = prefetch
+        self.pages = 0
+        self._total: Optional[int] = None
+        self._first: Optional[Tuple[List[Product], Optional[str]]] = None
+        self._queue: queue.Queue = queue.Queue(maxsize=1)
+        self._stop = threading.Event()
+
+    def _fetch_page(self, page_token: Optional[str]) -> Tuple[List[Product], Optional[str]]:
+        """拉取一页，返回 (产品列表, 下一页 page_token 或 None)"""
+        url, query = products_page_request(self.batch_num, page_token)
+        self.pages += 1
+        with INPUT_PAGE_SECONDS.time(), trace.span("fetch.page", page=self.pages):
+            result = http_request(url, method="POST", headers={"Authorization": f"Bearer {self.token}"}, data=query)
         if result.get("code") != 0:
-            break
+            raise Exception(f"查询批次产品失败: {result}")
+        data = result.get("data", {})
+        if self._total is None:
+            self._total = int(data.get("total") or 0)
+        products = [parse_product(item) for item in data.get("items") or []]
+        return products, data.get("page_token") if data.get("has_more") else None
+
+    def _first_page(self) -> Tuple[List[Product], Optional[str]]:
+        if self._first is None:
+            self._first = self._fetch_page(None)
+            if self._total is None or self._total < len(self._first[0]):
+                self._total = len(self._first[0])
+        return self._first
+
+    @property
+    def total(self) -> int:
+        self._first_page()
+        return self._total
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
 
-        for item in result.get("data", {}).get("items", []):
-            fields = item.get("fields", {})
-            if fields.get("Batch #") == batch_num:
-                asin_field = fields.get("ASIN", {})
-                asin = asin_field.get("text", "") if isinstance(asin_field, dict) else str(asin_field)
+    def _prefetch(self, page_token: str):
+        try:
+            while page_token and not self._stop.is_set():
+                page = self._fetch_page(page_token)
+                if not self._put(page):
+                    return
+                page_token = page[1]
+        except Exception as e:
+            self._put(e)
+            return
+        self._put(_PAGES_END)
+
+    def __iter__(self) -> Iterator[Product]:
+        products, page_token = self._first_page()
+        self._first = None          # 第一页只产出一次，产出后即可释放
+        if page_token and self.prefetch:
+            threading.Thread(target=trace.bind(self._prefetch), args=(page_token,),
+                             name="product-prefetch", daemon=True).start()
+        try:
+            while True:
+                yield from products
+                if not page_token:
+                    return
+                if self.prefetch:
+                    page = self._queue.get()
+                    if page is _PAGES_END:
+                        return
+                    if isinstance(page, Exception):
+                        raise page
+                    products, page_token = page
+                else:
+                    products, page_token = self._fetch_page(page_token)
+        finally:
+            self.close()
+
+    def close(self):
+        """停止后台拉取（提前结束迭代时调用）"""
+        self._stop.set()
+
+
+def get_products_by_batch(token: str, batch_num: str) -> List[Product]:
+    """获取指定批次的所有产品（服务端按批次过滤，只返回生成标题用到的字段）"""
+    return list(ProductStream(token, batch_num, prefetch=False))
+
+
+def output_records_payload(records: List[Dict]) -> Dict:
+    """构造写入表2的 batch_create 请求体"""
+    return {
+        "records": [
+            {
+                "fields": {
+                    "ASIN": r["asin"],
+                    "Product_Name": r["product_name"]
+                }
+            }
+            for r in records
+        ]
+    }
 
-                product = {
-                    "record_id": item.get("record_id"),
-                    "asin": asin,
-                    "original_title": fields.get("商品标题", ""),
-                    "bullets": fields.get("产品卖点", ""),
-                    "name_format": fields.get("name format", ""),
-                    "weight": fields.get("重量_1", ""),
-                    "size": fields.get("体积_1", ""),
+
+def output_update_payload(records: List[Dict]) -> Dict:
+    """构造按 record_id 更新表2标题的 batch_update 请求体（records 需带 record_id）"""
+    return {
+        "records": [
+            {
+                "record_id": r["record_id"],
+                "fields": {
+                    "Product_Name": r["product_name"]
                 }
-                all_products.append(product)
+            }
+            for r in records
+        ]
+    }
 
-        if not result.get("data", {}).get("has_more"):
-            break
-        page_token = result.get("data", {}).get("page_token")
 
-    return all_products
+def output_create_url() -> str:
+    """表2 batch_create 接口地址"""
+    return f"{FEISHU_API_BASE}/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_OUTPUT}/records/batch_create"
 
 
-def write_to_output_table(token: str, records: List[Dict]) -> int:
-    """批量写入产品标题到表2"""
-    url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_OUTPUT}/records/batch_create"
+def output_update_url() -> str:
+    """表2 batch_update 接口地址"""
+    return f"{FEISHU_API_BASE}/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_OUTPUT}/records/batch_update"
+
+
+def created_pairs(result: Dict) -> List[Tuple[str, str]]:
+    """从 batch_create 的返回中取出新建记录的 (ASIN, record_id)"""
+    return [
+        (field_text((item.get("fields") or {}).get("ASIN")), item.get("record_id"))
+        for item in (result.get("data") or {}).get("records") or []
+    ]
+
+
+def scan_output_index(token: str) -> List[Tuple[str, str]]:
+    """分页扫描表2（只取 ASIN 字段），返回 [(ASIN, record_id)]"""
+    headers = {"Authorization": f"Bearer {token}"}
+    base_url = f"{FEISHU_API_BASE}/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_OUTPUT}/records/search?page_size=500"
+    query = {"field_names": ["ASIN"], "automatic_fields": False}
+    pairs = []
+    page_token = None
+
+    with trace.span("output_index.scan"):
+        while True:
+            url = base_url + (f"&page_token={page_token}" if page_token else "")
+            result = http_request(url, method="POST", headers=headers, data=query)
+            if result.get("code") != 0:
+                raise Exception(f"扫描表2失败: {result}")
+            for item in result.get("data", {}).get("items") or []:
+                pairs.append((field_text(item.get("fields", {}).get("ASIN")), item.get("record_id")))
+            if not result.get("data", {}).get("has_more"):
+                break
+            page_token = result.get("data", {}).get("page_token")
+
+    return pairs
+
+
+def _post_output(token: str, url: str, payload: Dict) -> Dict:
+    """调用表2批量接口，返回响应（业务错误码也返回，由调用方判断）"""
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
     }
+    try:
+        return http_request(url, method="POST", headers=headers, data=payload)
+    except HTTPError as e:
+        try:
+            return json.loads(e.body)
+        except ValueError:
+            raise e
+
+
+def upsert_output_records(token: str, records: List[Dict]) -> int:
+    """已有 ASIN 用 batch_update 更新原记录，其余用 batch_create 新建，返回本批已写入的输入记录数
+
+    同一 ASIN 在本批中出现多次时只写入最后一条，合并掉的记录同样算作已写入，
+    因此成功时返回值总是 len(records)，与批次的产品数一致（据此判断批次是否全部完成）。
+    """
+    index = get_output_index()
+    index.ensure(lambda: scan_output_index(token))
+    updates, creates = index.split(records)
+
+    if updates:
+        result = _post_output(token, output_update_url(), output_update_payload(updates))
+        if result.get("code") in RECORD_NOT_FOUND_CODES:
+            # 表2中的记录被删除过：重新扫描后再分一次
+            index.invalidate()
+            index.ensure(lambda: scan_output_index(token))
+            updates, creates = index.split(records)
+            result = _post_output(token, output_update_url(), output_update_payload(updates)) if updates else {"code": 0}
+        if result.get("code") != 0:
+            raise Exception(f"更新表2失败: {result}")
+
+    pairs = []
+    if creates:
+        result = _post_output(token, output_create_url(), output_records_payload(creates))
+        if result.get("code") != 0:
+            raise Exception(f"写入表2失败: {result}")
+        pairs = created_pairs(result)
+    index.remember(pairs, updated=len(updates))
+    return len(records)
+
+
+def write_output_batch(token: str, records: List[Dict]) -> int:
+    """写入一批（最多100条）产品标题到表2，返回写入条数，失败时抛出异常
+
+    OUTPUT_WRITE_MODE 为 upsert（默认）时按 ASIN 更新已有记录、只新建表2中没有的；append 时总是新建。
+    """
+    start = time.perf_counter()
+    try:
+        with trace.span("write.batch", records=len(records), mode=OUTPUT_WRITE_MODE):
+            if OUTPUT_WRITE_MODE == "append":
+                result = _post_output(token, output_create_url(), output_records_payload(records))
+                if result.get("code") != 0:
+                    raise Exception(f"写入表2失败: {result}")
+                count = len(records)
+            else:
+                count = upsert_output_records(token, records)
+    except Exception:
+        WRITE_SECONDS.observe(time.perf_counter() - start, "error")
+        raise
+    WRITE_SECONDS.observe(time.perf_counter() - start, "ok")
+    return count
+
+
+def write_to_output_table(token: str, records: List[Dict]) -> int:
+    """批量写入产品标题到表2（限速和限流重试由 http_request 处理），返回成功写入条数
 
+    某一组写入失败时继续写入其余各组，全部结束后抛出异常说明失败条数和原因。
+    """
     success_count = 0
+    failed = 0
+    errors = []
 
     for i in range(0, len(records), 100):
         batch = records[i:i+100]
-        batch_data = {
-            "records": [
-                {
-                    "fields": {
-                        "ASIN": r["asin"],
-                        "Product_Name": r["product_name"]
-                    }
-                }
-                for r in batch
-            ]
-        }
 
         try:
-            result = http_request(url, method="POST", headers=headers, data=batch_data)
-            if result.get("code") == 0:
-                success_count += len(batch)
-        except Exception:
-            pass
-
-        time.sleep(0.3)
+            success_count += write_output_batch(token, batch)
+        except Exception as e:
+            failed += len(batch)
+            errors.append(str(e)[:200])
 
+    if errors:
+        raise Exception(f"写入表2失败 {failed}/{len(records)} 条（已写入 {success_count}）: {errors[0]}")
     return success_count
@@ -0,0 +1,240 @@
+"""
+HTTP 连接池模块
+按主机复用 keep-alive 长连接和 TLS 会话，避免每次请求都重新握手
+"""
+import http.client
+import json
+import ssl
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .config import HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_IDLE_TIMEOUT
+from . import trace
+
+# SSL上下文（跳过验证，生产环境建议启用验证）
+SSL_CONTEXT = ssl.create_default_context()
+SSL_CONTEXT.check_hostname = False
+SSL_CONTEXT.verify_mode = ssl.CERT_NONE
+
+# 复用连接失败时可安全重试的异常（服务端已关闭空闲连接）
+_STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+
+class HTTPError(Exception):
+    """HTTP 状态码错误（保留状态码、响应头和响应体）"""
+
+    def __init__(self, code: int, body: str, headers=None):
+        super().__init__(f"HTTP {code}: {body}")
+        self.code = code
+        self.body = body
+        self.headers = headers or {}
+
+
+class _TLSSessionConnection(http.client.HTTPSConnection):
+    """握手时复用同一主机上次的 TLS 会话"""
+
+    def __init__(self, host: str, port: Optional[int], pool: "_HostPool", **kwargs):
+        super().__init__(host, port, **kwargs)
+        self._pool = pool
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        server_hostname = self._tunnel_host or self.host
+        self.sock = self._context.wrap_socket(
+            self.sock, server_hostname=server_hostname, session=self._pool.tls_session
+        )
+        self._pool.on_tls_connected(self.sock)
+
+
+class _HostPool:
+    """单个主机的空闲连接池"""
+
+    def __init__(self, scheme: str, host: str, port: Optional[int], client: "HTTPClient"):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.client = client
+        self.tls_session = None
+        self._idle: List[Tuple[http.client.HTTPConnection, float]] = []
+        self._lock = threading.Lock()
+
+    def new_connection(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return _TLSSessionConnection(
+                self.host, self.port, self,
+                timeout=self.client.connect_timeout, context=self.client.ssl_context
+            )
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.client.connect_timeout)
+
+    def acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """取出一个空闲连接，没有则新建；返回 (连接, 是否复用)"""
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn, idle_since = self._idle.pop()
+                if now - idle_since < self.client.idle_timeout:
+                    return conn, True
+                conn.close()
+        return self.new_connection(), False
+
+    def release(self, conn: http.client.HTTPConnection):
+        """归还连接，超出池大小则直接关闭"""
+        with self._lock:
+            if len(self._idle) < self.client.pool_size:
+                self._idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def on_tls_connected(self, sock: ssl.SSLSocket):
+        self.client._count("tls_handshakes")
+        if sock.session_reused:
+            self.client._count("tls_resumed")
+        if sock.session is not None:
+            self.tls_session = sock.session
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+
+class HTTPClient:
+    """带连接池的 HTTP 客户端（线程安全）"""
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+                 read_timeout: float = HTTP_READ_TIMEOUT, idle_timeout: float = HTTP_IDLE_TIMEOUT,
+                 ssl_context: ssl.SSLContext = SSL_CONTEXT):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self.ssl_context = ssl_context
+        self._pools: Dict[Tuple[str, str, Optional[int]], _HostPool] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "connections_opened": 0,
+            "connections_reused": 0,
+            "stale_retries": 0,
+            "tls_handshakes": 0,
+            "tls_resumed": 0,
+        }
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self._stats[key] += n
+
+    def _pool_for(self, scheme: str, host: str, port: Optional[int]) -> _HostPool:
+        key = (scheme, host, port)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = _HostPool(scheme, host, port, self)
+            return pool
+
+    def request(self, method: str, url: str, headers: Dict = None, body: bytes = None,
+                timeout: float = None) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        """发送请求，返回 (状态码, 响应头, 响应体)"""
+        parts = urlsplit(url)
+        with trace.span(f"{method} {parts.hostname}", cat="http", path=parts.path) as span:
+            status, response_headers, data = self._request(method, parts, headers, body, timeout)
+            span.set(status=status, bytes=len(data))
+        return status, response_headers, data
+
+    def _request(self, method: str, parts, headers: Optional[Dict], body: Optional[bytes],
+                 timeout: Optional[float]) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        pool = self._pool_for(parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        self._count("requests")
+        while True:
+            conn, reused = pool.acquire()
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                    self._count("connections_opened")
+                else:
+                    self._count("connections_reused")
+                conn.sock.settimeout(timeout or self.read_timeout)
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                data = response.read()
+            except _STALE_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                # 复用的连接已被服务端关闭，换新连接重试一次
+                self._count("stale_retries")
+                continue
+            except Exception:
+                conn.close()
+                raise
+
+            if response.will_close:
+                conn.close()
+            else:
+                pool.release(conn)
+            return response.status, response.headers, data
+
+    def request_json(self, method: str, url: str, headers: Dict = None, data: Dict = None,
+                     timeout: float = None) -> Dict:
+        """发送 JSON 请求并解析 JSON 响应，状态码 >= 400 时抛出 HTTPError"""
+        headers = dict(headers or {})
+        body = None
+        if data:
+            body = json.dumps(data).encode('utf-8')
+            if 'Content-Type' not in headers:
+                headers['Content-Type'] = 'application/json'
+
+        status, response_headers, raw = self.request(method, url, headers=headers, body=body, timeout=timeout)
+        if status >= 400:
+            raise HTTPError(status, raw.decode('utf-8', errors='replace'), response_headers)
+        return json.loads(raw.decode('utf-8'))
+
+    def stats(self) -> Dict:
+        """连接复用统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["hosts"] = len(self._pools)
+        handled = stats["connections_opened"] + stats["connections_reused"]
+        stats["reuse_rate"] = round(stats["connections_reused"] / handled, 3) if handled else 0.0
+        return stats
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.close()
+
+
+_default_client: Optional[HTTPClient] = None
+_default_lock = threading.Lock()
+
+
+def get_client() -> HTTPClient:
+    """获取进程内共享的 HTTP 客户端"""
+    global _default_client
+    if _default_client is None:
+        with _default_lock:
+            if _default_client is None:
+                _default_client = HTTPClient()
+    return _default_client
+
+
+def format_stats(stats: Dict) -> str:
+    """格式化连接复用统计，便于日志输出"""
+    return (f"请求 {stats['requests']} 次 | 新建连接 {stats['connections_opened']} | "
+            f"复用 {stats['connections_reused']} ({stats['reuse_rate']:.0%}) | "
+            f"TLS握手 {stats['tls_handshakes']} (会话复用 {stats['tls_resumed']})")
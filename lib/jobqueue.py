@@ -0,0 +1,221 @@
+"""
+持久化任务队列模块
+Webhook 收到触发后把任务写入本地 SQLite 队列并立即返回，由固定数量的工作线程消费。
+至少一次投递：任务被领取后在可见性超时内由心跳续期，进程崩溃后超时的任务会被重新领取；
+处理抛出异常时按退避时间重试，超过最大次数（含崩溃后租约过期的领取次数）后标记为 dead
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from .config import JOB_QUEUE_PATH, JOB_VISIBILITY_TIMEOUT, JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY
+
+QUEUED = "queued"
+RUNNING = "running"
+DEAD = "dead"
+DONE = "done"
+
+
+class JobQueue:
+    """基于 SQLite 的持久化任务队列（线程安全，可多进程共享同一文件）"""
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, visibility_timeout: float = JOB_VISIBILITY_TIMEOUT,
+                 max_attempts: int = JOB_MAX_ATTEMPTS, retry_delay: float = JOB_RETRY_DELAY):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._available = threading.Event()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0, available_at REAL NOT NULL, lease_until REAL,"
+            " last_error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, key TEXT)"
+        )
+        try:
+            # 旧版本队列文件没有 key 列
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN key TEXT")
+        except sqlite3.OperationalError:
+            pass
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, available_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs(key)")
+
+    def enqueue(self, payload: Dict, key: Optional[str] = None) -> int:
+        """加入任务，返回任务ID
+
+        指定 key 时，若已有相同 key 的任务在排队或运行中，不重复加入，直接返回已有任务的ID。
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = None
+                if key is not None:
+                    row = self._conn.execute(
+                        "SELECT id FROM jobs WHERE key = ? AND status IN (?, ?) ORDER BY id LIMIT 1",
+                        (key, QUEUED, RUNNING)
+                    ).fetchone()
+                if row:
+                    job_id = row[0]
+                else:
+                    job_id = self._conn.execute(
+                        "INSERT INTO jobs (payload, status, available_at, created_at, updated_at, key)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        (json.dumps(payload, ensure_ascii=False), QUEUED, now, now, now, key)
+                    ).lastrowid
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.notify()
+        return job_id
+
+    def claim(self) -> Optional[Dict]:
+        """领取一个可执行的任务（排队中且已到重试时间，或运行中但租约已过期且未超过最大次数）"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 租约过期（处理进程崩溃）且重试次数已用完的任务不再领取，直接标记为 dead
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, lease_until = NULL, last_error = ?, updated_at = ?"
+                    " WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                    (DEAD, "租约过期且重试次数已用完", now, RUNNING, now, self.max_attempts)
+                )
+                row = self._conn.execute(
+                    "SELECT id, payload, attempts FROM jobs"
+                    " WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?)"
+                    " ORDER BY id LIMIT 1",
+                    (QUEUED, now, RUNNING, now)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, updated_at = ? WHERE id = ?",
+                    (RUNNING, now + self.visibility_timeout, now, row[0])
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {"id": row[0], "payload": json.loads(row[1]), "attempts": row[2] + 1}
+
+    def heartbeat(self, job_ids: List[int]):
+        """为运行中的任务续期租约"""
+        lease_until = time.time() + self.visibility_timeout
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ?",
+                [(lease_until, job_id, RUNNING) for job_id in job_ids]
+            )
+
+    def complete(self, job_id: int):
+        """任务完成，从队列删除"""
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def fail(self, job_id: int, attempts: int, error: str) -> str:
+        """任务失败：未超过最大次数时按指数退避重新排队，否则标记为 dead；返回新状态"""
+        now = time.time()
+        if attempts >= self.max_attempts:
+            status, available_at = DEAD, now
+        else:
+            status, available_at = QUEUED, now + self.retry_delay * 2 ** (attempts - 1)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, lease_until = NULL, last_error = ?, updated_at = ?"
+                " WHERE id = ?",
+                (status, available_at, error[:500], now, job_id)
+            )
+        return status
+
+    def notify(self):
+        """唤醒等待中的工作线程"""
+        self._available.set()
+
+    def wait(self, timeout: float):
+        """等待新任务入队（或超时）"""
+        if self._available.wait(timeout):
+            self._available.clear()
+
+    def stats(self) -> Dict:
+        """各状态的任务数"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        stats = {QUEUED: 0, RUNNING: 0, DEAD: 0}
+        stats.update(dict(rows))
+        return stats
+
+
+class WorkerPool:
+    """固定数量的队列消费线程，另有一个心跳线程为运行中的任务续期
+
+    on_done 在队列状态更新后以 (任务内容, 新状态 done/queued/dead) 调用。
+    """
+
+    def __init__(self, queue: JobQueue, handle: Callable[[Dict], None], workers: int = 2,
+                 poll_interval: float = 5.0, on_done: Optional[Callable[[Dict, str], None]] = None):
+        self.queue = queue
+        self.handle = handle
+        self.on_done = on_done
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self._running: Dict[int, float] = {}
+        self._running_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "WorkerPool":
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.queue.notify()
+
+    def _work(self):
+        while not self._stop.is_set():
+            job = self.queue.claim()
+            if job is None:
+                self.queue.wait(self.poll_interval)
+                continue
+
+            with self._running_lock:
+                self._running[job["id"]] = time.time()
+            try:
+                self.handle(job["payload"])
+            except Exception as e:
+                status = self.queue.fail(job["id"], job["attempts"], str(e))
+            else:
+                self.queue.complete(job["id"])
+                status = DONE
+            finally:
+                with self._running_lock:
+                    self._running.pop(job["id"], None)
+            if self.on_done:
+                self.on_done(job["payload"], status)
+
+    def _heartbeat(self):
+        interval = max(1.0, self.queue.visibility_timeout / 3)
+        while not self._stop.wait(interval):
+            with self._running_lock:
+                job_ids = list(self._running)
+            if job_ids:
+                self.queue.heartbeat(job_ids)
+
+    def stats(self) -> Dict:
+        with self._running_lock:
+            busy = len(self._running)
+        return {"workers": self.workers, "busy": busy}
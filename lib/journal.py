@@ -0,0 +1,205 @@
+"""
+批次断点日志模块
+在本地 SQLite 中记录每个批次内各产品的处理状态（pending → generated → written），
+批次中途中断后重新处理时，已写入的产品直接跳过，已生成未写入的产品直接写入，不再调用大模型。
+产品按表1的 record_id 区分（没有 record_id 时退回 ASIN），重复或为空的 ASIN 各自记录；
+超过 BATCH_JOURNAL_MAX_AGE 未更新的批次日志视为过期删除，之后重新处理该批次会全部重新生成
+"""
+import sqlite3
+import threading
+import time
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .config import BATCH_JOURNAL_PATH, BATCH_JOURNAL_MAX_AGE
+
+PENDING = "pending"
+GENERATED = "generated"
+WRITTEN = "written"
+
+
+def item_key(product: Dict) -> str:
+    """产品在断点日志中的键：表1 record_id，没有时用 ASIN"""
+    return product.get("record_id") or product.get("asin", "")
+
+
+class BatchJournal:
+    """基于 SQLite 的批次断点日志（线程安全）"""
+
+    def __init__(self, path: str, max_age: float = BATCH_JOURNAL_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS batch_products ("
+            " batch TEXT NOT NULL, item TEXT NOT NULL, asin TEXT NOT NULL, state TEXT NOT NULL, title TEXT,"
+            " updated_at REAL NOT NULL, PRIMARY KEY (batch, item))"
+        )
+        self._conn.commit()
+
+    def start(self, batch_num: str, products: List[Dict]):
+        """登记批次内的产品，已有记录的产品保持原状态"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO batch_products (batch, item, asin, state, title, updated_at)"
+                " VALUES (?, ?, ?, ?, NULL, ?)",
+                [(batch_num, item_key(p), p.get("asin", ""), PENDING, now) for p in products]
+            )
+            self._conn.commit()
+
+    def items(self, batch_num: str) -> Dict[str, Dict]:
+        """返回 {item: {"asin", "state", "title"}}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT item, asin, state, title FROM batch_products WHERE batch = ?", (batch_num,)
+            ).fetchall()
+        return {item: {"asin": asin, "state": state, "title": title} for item, asin, state, title in rows}
+
+    def mark_generated(self, batch_num: str, item: str, title: str):
+        """记录已生成的标题"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE batch_products SET state = ?, title = ?, updated_at = ? WHERE batch = ? AND item = ?",
+                (GENERATED, title, time.time(), batch_num, item)
+            )
+            self._conn.commit()
+
+    def mark_written(self, batch_num: str, items: List[str]):
+        """记录已写入表2的产品"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE batch_products SET state = ?, updated_at = ? WHERE batch = ? AND item = ?",
+                [(WRITTEN, now, batch_num, item) for item in items]
+            )
+            self._conn.commit()
+
+    def prune(self) -> int:
+        """删除超过 max_age 未更新的批次日志，返回删除的行数"""
+        if not self.max_age:
+            return 0
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM batch_products WHERE batch IN"
+                " (SELECT batch FROM batch_products GROUP BY batch HAVING MAX(updated_at) < ?)",
+                (time.time() - self.max_age,)
+            ).rowcount
+            self._conn.commit()
+        return removed
+
+    def clear(self, batch_num: str):
+        """批次全部完成后删除其日志"""
+        with self._lock:
+            self._conn.execute("DELETE FROM batch_products WHERE batch = ?", (batch_num,))
+            self._conn.commit()
+
+
+_journal: Optional[BatchJournal] = None
+_journal_lock = threading.Lock()
+_journal_failed = False
+
+
+def get_batch_journal() -> Optional[BatchJournal]:
+    """获取进程内共享的断点日志；未配置路径或无法打开时返回 None"""
+    global _journal, _journal_failed
+    if _journal is None and not _journal_failed and BATCH_JOURNAL_PATH:
+        with _journal_lock:
+            if _journal is None and not _journal_failed:
+                try:
+                    _journal = BatchJournal(BATCH_JOURNAL_PATH)
+                except sqlite3.Error:
+                    _journal_failed = True
+    return _journal
+
+
+def resume_batch(batch_num: str, products: List[Dict]) -> Dict:
+    """按断点日志拆分批次产品
+
+    返回 {"pending": 需要生成的产品, "generated": 已生成未写入的记录 [{asin, product_name, item}],
+          "written": 已写入的产品数}；未启用日志时所有产品都是 pending。
+    """
+    plan = {"pending": list(products), "generated": [], "written": 0}
+    journal = get_batch_journal()
+    if journal is None:
+        return plan
+
+    journal.prune()
+    journal.start(batch_num, products)
+    items = journal.items(batch_num)
+    plan["pending"] = []
+    for product in products:
+        item = items.get(item_key(product)) or {"state": PENDING}
+        if item["state"] == GENERATED:
+            plan["generated"].append({"asin": product.get("asin", ""), "product_name": item["title"],
+                                      "item": item_key(product)})
+        elif item["state"] == WRITTEN:
+            plan["written"] += 1
+        else:
+            plan["pending"].append(product)
+    return plan
+
+
+def resume_stream(batch_num: str, products: Iterable[Dict], chunk: int = 100) -> Tuple[Dict, Iterator[Dict]]:
+    """流式版本的 resume_batch：不需要先取到全部产品
+
+    返回 (plan, pending)。plan 的 generated / written 直接来自断点日志（遍历产品前即可使用），
+    pending 为惰性迭代器，逐块登记产品并只产出需要生成的产品。
+    """
+    plan = {"generated": [], "written": 0}
+    journal = get_batch_journal()
+    if journal is None:
+        return plan, iter(products)
+
+    journal.prune()
+    items = journal.items(batch_num)
+    for key, item in items.items():
+        if item["state"] == GENERATED:
+            plan["generated"].append({"asin": item["asin"], "product_name": item["title"], "item": key})
+        elif item["state"] == WRITTEN:
+            plan["written"] += 1
+
+    def pending() -> Iterator[Dict]:
+        iterator = iter(products)
+        while True:
+            block = list(islice(iterator, chunk))
+            if not block:
+                return
+            journal.start(batch_num, block)
+            for product in block:
+                if (items.get(item_key(product)) or {"state": PENDING})["state"] == PENDING:
+                    yield product
+
+    return plan, pending()
+
+
+def has_resume_state(batch_num: str) -> bool:
+    """断点日志中是否有该批次未过期的记录"""
+    journal = get_batch_journal()
+    if journal is None:
+        return False
+    journal.prune()
+    return bool(journal.items(batch_num))
+
+
+def record_generated(batch_num: str, item: str, title: str):
+    """记录已生成的标题（item 为 item_key(产品)；未启用日志时不做任何事）"""
+    journal = get_batch_journal()
+    if journal:
+        journal.mark_generated(batch_num, item, title)
+
+
+def record_written(batch_num: str, records: List[Dict]):
+    """记录已写入表2的记录（可直接作为 StreamingWriter 的 on_written 回调；记录带 item 时按 item，否则按 ASIN）"""
+    journal = get_batch_journal()
+    if journal:
+        journal.mark_written(batch_num, [r.get("item") or r["asin"] for r in records])
+
+
+def finish_batch(batch_num: str):
+    """批次全部写入后清除其断点日志"""
+    journal = get_batch_journal()
+    if journal:
+        journal.clear(batch_num)
@@ -0,0 +1,221 @@
+"""
+指标模块
+进程内的计数器、仪表和延迟直方图，以 Prometheus 文本格式输出（/metrics）。
+热路径上每次记录只是一次加锁的字典更新和一次二分查找；
+需要在抓取时才读取的状态（限速器速率、并发上限等）通过 register_collector 注册回调。
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 默认延迟桶（秒），覆盖飞书接口的几十毫秒到大模型调用的几十秒
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _label_text(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_label_text(self.labelnames, labels)} {_number(v)}" for labels, v in items
+        ]
+
+
+class Gauge(_Metric):
+    """可任意设置的数值；max_series 限制标签组合数，超过时丢弃最早设置的一组"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), max_series: Optional[int] = None):
+        super().__init__(name, help_text, labelnames)
+        self.max_series = max_series
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values.pop(labels, None)
+            self._values[labels] = value
+            if self.max_series and len(self._values) > self.max_series:
+                self._values.pop(next(iter(self._values)))
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_label_text(self.labelnames, labels)} {_number(v)}" for labels, v in items
+        ]
+
+
+class Histogram(_Metric):
+    """延迟直方图（固定分桶）"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签组合 -> [各桶计数（不累计，最后一个为 +Inf）, 总和]
+        self._series: Dict[Tuple, List] = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """记录 with 代码块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels) -> int:
+        with self._lock:
+            series = self._series.get(labels)
+            return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = self._header()
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, labels, le)} {cumulative}")
+            label_text = _label_text(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {total!r}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+_registry: List[_Metric] = []
+_collectors: List[Callable[[], None]] = []
+
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def counter(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+    return _register(Counter(name, help_text, labelnames))
+
+
+def gauge(name: str, help_text: str, labelnames: Sequence[str] = (), max_series: Optional[int] = None) -> Gauge:
+    return _register(Gauge(name, help_text, labelnames, max_series))
+
+
+def histogram(name: str, help_text: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help_text, labelnames, buckets))
+
+
+def register_collector(collect: Callable[[], None]):
+    """注册在每次输出指标前调用的回调（用于把当前状态写入仪表）"""
+    _collectors.append(collect)
+
+
+# ==================== 指标定义 ====================
+
+TOKEN_FETCH_SECONDS = histogram(
+    "feishu_token_fetch_seconds", "获取 tenant_access_token 的耗时", ["outcome"])
+INPUT_PAGE_SECONDS = histogram(
+    "feishu_input_page_seconds", "拉取表1一页产品的耗时")
+WRITE_SECONDS = histogram(
+    "feishu_write_seconds", "写入表2（batch_create）一次的耗时", ["outcome"])
+FEISHU_RETRIES = counter(
+    "feishu_retries_total", "飞书接口重试次数", ["reason"])
+WRITE_FAILURES = counter(
+    "feishu_write_failed_records_total", "写入表2失败的记录数")
+
+YUNWU_REQUEST_SECONDS = histogram(
+    "yunwu_request_seconds", "每次云雾 chat/completions 请求的耗时", ["outcome"])
+ADJUST_SECONDS = histogram(
+    "title_adjust_seconds", "标题长度不合规时让模型重新调整的耗时")
+YUNWU_RETRIES = counter(
+    "yunwu_retries_total", "生成失败后的重试次数", ["reason"])
+TITLE_FALLBACKS = counter(
+    "title_fallbacks_total", "模型调整后仍不合规、在本地兜底的标题数", ["kind"])
+
+PRODUCTS = counter(
+    "products_total", "处理的产品数", ["status"])
+BATCH_SECONDS = histogram(
+    "batch_seconds", "处理一个批次的总耗时", buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 3600))
+BATCH_THROUGHPUT = gauge(
+    "batch_products_per_second", "最近批次的处理速度（产品数/秒）", ["batch"], max_series=20)
+
+
+def record_batch(batch_num: str, products: int, seconds: float):
+    """记录一个批次的总耗时和处理速度"""
+    BATCH_SECONDS.observe(seconds)
+    BATCH_THROUGHPUT.set(round(products / seconds, 3) if seconds > 0 else 0, batch_num)
+
+
+def render() -> str:
+    """输出 Prometheus 文本格式的全部指标"""
+    for collect in list(_collectors):
+        try:
+            collect()
+        except Exception:
+            pass
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,103 @@
+"""
+表2 ASIN 索引模块
+缓存表2中 ASIN -> record_id 的对应关系，用于按 ASIN 更新已有记录（upsert）：
+- 首次写入时分页扫描表2建立索引（并发调用只扫描一次），超过 OUTPUT_INDEX_TTL 后重新扫描
+- 之后新建的记录在写入成功后直接加入索引，无需再扫描
+- 表2中已有的重复 ASIN 以最早的一条为准，其余保持不变
+- ASIN 为空的记录无法对应，总是新建
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .config import OUTPUT_INDEX_TTL
+
+
+class OutputIndex:
+    """表2 ASIN -> record_id 索引（线程安全）"""
+
+    def __init__(self, ttl: float = OUTPUT_INDEX_TTL, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._index: Optional[Dict[str, str]] = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()     # 扫描表2期间持有，避免重复扫描
+        self._stats = {"builds": 0, "scanned": 0, "duplicates": 0, "updates": 0, "creates": 0}
+
+    def _fresh(self) -> bool:
+        # 调用方持有 _lock
+        return self._index is not None and (not self.ttl or self.clock() - self._built_at < self.ttl)
+
+    def ensure(self, load: Callable[[], List[Tuple[str, str]]]):
+        """索引不存在或已过期时调用 load() 扫描表2（返回 [(ASIN, record_id)]）重建"""
+        with self._lock:
+            if self._fresh():
+                return
+        with self._build_lock:
+            with self._lock:
+                if self._fresh():
+                    return
+            pairs = load()
+            index: Dict[str, str] = {}
+            for asin, record_id in pairs:
+                if asin and record_id:
+                    index.setdefault(asin, record_id)
+            with self._lock:
+                self._index = index
+                self._built_at = self.clock()
+                self._stats["builds"] += 1
+                self._stats["scanned"] = len(pairs)
+                self._stats["duplicates"] = len(pairs) - len(index)
+
+    def split(self, records: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """把待写入的记录分为 (已存在需更新的, 需新建的)；同一 ASIN 出现多次时只保留最后一条
+
+        已存在的记录带上 record_id 字段；ASIN 为空的记录不去重，全部新建。
+        """
+        latest: Dict[str, Dict] = {}
+        updates, creates = [], []
+        for record in records:
+            if not record.get("asin"):
+                creates.append(record)
+                continue
+            latest.pop(record["asin"], None)
+            latest[record["asin"]] = record
+        with self._lock:
+            index = self._index or {}
+            for asin, record in latest.items():
+                record_id = index.get(asin)
+                if record_id:
+                    updates.append(dict(record, record_id=record_id))
+                else:
+                    creates.append(record)
+        return updates, creates
+
+    def remember(self, pairs: List[Tuple[str, str]], updated: int = 0):
+        """记录新建成功的 (ASIN, record_id)"""
+        with self._lock:
+            if self._index is not None:
+                for asin, record_id in pairs:
+                    if asin and record_id:
+                        self._index.setdefault(asin, record_id)
+            self._stats["creates"] += len(pairs)
+            self._stats["updates"] += updated
+
+    def invalidate(self):
+        """丢弃索引（表2记录被删除等情况下，下次写入时重新扫描）"""
+        with self._lock:
+            self._index = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._index) if self._index is not None else 0
+        return stats
+
+
+_index = OutputIndex()
+
+
+def get_output_index() -> OutputIndex:
+    """获取进程内共享的表2 ASIN 索引"""
+    return _index
@@ -0,0 +1,257 @@
+"""
+asyncio 批次流水线
+在单个事件循环里让 拉取产品 → 生成标题 → 写入表2 三个阶段重叠执行，
+阶段之间用有界队列做背压（仅依赖标准库）
+"""
+import asyncio
+import json
+import time
+from typing import Callable, Dict, List, Optional
+
+from .aio_http import AsyncHTTPClient
+from .http_client import HTTPError
+from .concurrency import current_flow
+from .config import GENERATION_CONCURRENCY, PIPELINE_QUEUE_SIZE, OUTPUT_WRITE_MODE, FEISHU_MAX_RETRIES
+from .feishu import (
+    products_page_request, parse_product, output_records_payload, output_create_url, feishu_limiter,
+    output_update_payload, output_update_url, created_pairs, scan_output_index, upsert_output_records,
+    retry_reason, retry_after_seconds, backoff_delay, header_float, RECORD_NOT_FOUND_CODES
+)
+from .output_index import get_output_index
+from .yunwu import generate_product_title_async
+from .metrics import INPUT_PAGE_SECONDS, WRITE_SECONDS, WRITE_FAILURES, PRODUCTS, FEISHU_RETRIES
+from . import trace
+
+# 队列结束标记
+_DONE = None
+
+
+async def _wait_limiter(url: str):
+    """与同步请求共用按数据表区分的限速器"""
+    limiter = feishu_limiter(url)
+    wait = limiter.reserve() if limiter else 0
+    if wait > 0:
+        with trace.span("ratelimit.wait", cat="sleep", wait=round(wait, 3)):
+            await asyncio.sleep(wait)
+
+
+async def _request(client: AsyncHTTPClient, method: str, url: str, headers: Dict, data: Dict = None) -> Dict:
+    """与同步的 http_request 相同的限速和重试：429 / 限流错误码 / 5xx / 写冲突时退避重试
+
+    返回解析后的响应体（业务错误码如记录不存在也可能随 4xx 返回，交给调用方判断）；
+    响应体不是 JSON 的 4xx 抛出 HTTPError，重试 FEISHU_MAX_RETRIES 次后仍失败时抛出异常。
+    """
+    limiter = feishu_limiter(url)
+    attempt = 0
+    while True:
+        await _wait_limiter(url)
+        status, response_headers = 200, {}
+        try:
+            result = await client.request_json(method, url, headers=headers, data=data)
+        except HTTPError as e:
+            status, response_headers = e.code, e.headers
+            try:
+                result = json.loads(e.body)
+            except ValueError:
+                result = {"msg": e.body[:500]}
+
+        reason = retry_reason(status, result.get("code"))
+        if reason:
+            retry_after = retry_after_seconds(response_headers)
+            if reason == "throttled" and limiter:
+                limiter.penalize(retry_after)
+            if attempt >= FEISHU_MAX_RETRIES:
+                raise Exception(f"飞书接口重试 {attempt} 次后仍失败 (HTTP {status}): {result}")
+            FEISHU_RETRIES.inc(reason)
+            with trace.span("feishu.backoff", cat="sleep", status=status, attempt=attempt + 1):
+                await asyncio.sleep(backoff_delay(attempt, retry_after))
+            attempt += 1
+            continue
+
+        if limiter:
+            limiter.reward()
+            server_limit = header_float(response_headers, "x-ogw-ratelimit-limit")
+            if server_limit:
+                limiter.cap(server_limit)
+        if status >= 400 and "code" not in result:
+            raise HTTPError(status, result.get("msg", ""), response_headers)
+        return result
+
+
+async def _fetch_stage(client: AsyncHTTPClient, token: str, batch_num: str,
+                       products_q: asyncio.Queue, summary: Dict):
+    """逐页拉取批次产品并放入队列（队列满时等待下游消费）"""
+    headers = {"Authorization": f"Bearer {token}"}
+    current = current_flow()
+    page_token = None
+    page = 0
+    while True:
+        page += 1
+        url, query = products_page_request(batch_num, page_token)
+        start = time.perf_counter()
+        with trace.span("fetch.page", page=page):
+            result = await _request(client, "POST", url, headers, query)
+        INPUT_PAGE_SECONDS.observe(time.perf_counter() - start)
+        if result.get("code") != 0:
+            raise Exception(f"查询批次产品失败: {result}")
+
+        items = result.get("data", {}).get("items") or []
+        if current is not None:
+            current.add(len(items))
+        for item in items:
+            summary["total"] += 1
+            await products_q.put((summary["total"], parse_product(item)))
+
+        if not result.get("data", {}).get("has_more"):
+            break
+        page_token = result.get("data", {}).get("page_token")
+
+
+async def _generate_stage(client: AsyncHTTPClient, products_q: asyncio.Queue, results_q: asyncio.Queue,
+                          on_result: Optional[Callable[[Dict], None]]):
+    """从队列取产品生成标题，结果交给写入阶段"""
+    current = current_flow()
+    while True:
+        item = await products_q.get()
+        if item is _DONE:
+            return
+        index, product = item
+        outcome = {
+            "index": index,
+            "asin": product.get("asin", "Unknown"),
+            "record_id": product.get("record_id"),
+            "title": None,
+            "status": "success",
+            "error": None,
+        }
+        start = time.perf_counter()
+        try:
+            with trace.span("product", index=index, asin=outcome["asin"]):
+                title = await generate_product_title_async(client, product)
+            if title:
+                outcome["title"] = title
+            else:
+                outcome["status"] = "failed"
+                outcome["error"] = "生成失败"
+        except Exception as e:
+            outcome["status"] = "error"
+            outcome["error"] = str(e)
+        outcome["latency"] = round(time.perf_counter() - start, 3)
+        PRODUCTS.inc(outcome["status"])
+        if current is not None:
+            current.add(-1)
+
+        if on_result:
+            on_result(outcome)
+        await results_q.put(outcome)
+
+
+async def _write_stage(client: AsyncHTTPClient, token: str, results_q: asyncio.Queue, summary: Dict):
+    """攒够 100 条就写入表2（upsert 模式下已有 ASIN 更新原记录），结束时写入剩余部分"""
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
+    create_url, update_url = output_create_url(), output_update_url()
+    index = get_output_index()
+    buffer: List[Dict] = []
+
+    async def post(url: str, payload: Dict) -> Dict:
+        return await _request(client, "POST", url, headers, payload)
+
+    async def write(batch: List[Dict]) -> int:
+        """写入一批，返回已写入的记录数（同一 ASIN 合并写入的也计入，与 upsert_output_records 一致）"""
+        if OUTPUT_WRITE_MODE == "append":
+            result = await post(create_url, output_records_payload(batch))
+            if result.get("code") != 0:
+                raise Exception(f"写入表2失败: {result}")
+            return len(batch)
+        # 索引只在首次或过期时扫描表2（同步请求，放到线程中执行）
+        await asyncio.to_thread(index.ensure, lambda: scan_output_index(token))
+        updates, creates = index.split(batch)
+        if updates:
+            result = await post(update_url, output_update_payload(updates))
+            if result.get("code") in RECORD_NOT_FOUND_CODES:
+                # 表2中的记录被删除过：交给同步流程重新扫描后写入
+                index.invalidate()
+                return await asyncio.to_thread(upsert_output_records, token, batch)
+            if result.get("code") != 0:
+                raise Exception(f"更新表2失败: {result}")
+        pairs = []
+        if creates:
+            result = await post(create_url, output_records_payload(creates))
+            if result.get("code") != 0:
+                raise Exception(f"写入表2失败: {result}")
+            pairs = created_pairs(result)
+        index.remember(pairs, updated=len(updates))
+        return len(batch)
+
+    async def flush():
+        batch = buffer[:]
+        buffer.clear()
+        start = time.perf_counter()
+        ok = True
+        try:
+            with trace.span("write.batch", records=len(batch), mode=OUTPUT_WRITE_MODE):
+                summary["written"] += await write(batch)
+        except Exception as e:
+            ok = False
+            summary["write_errors"].append(str(e)[:200])
+        WRITE_SECONDS.observe(time.perf_counter() - start, "ok" if ok else "error")
+        if not ok:
+            WRITE_FAILURES.inc(amount=len(batch))
+
+    while True:
+        outcome = await results_q.get()
+        if outcome is _DONE:
+            break
+        if outcome["title"]:
+            summary["generated"] += 1
+            buffer.append({"asin": outcome["asin"], "product_name": outcome["title"]})
+            if len(buffer) >= 100:
+                await flush()
+    if buffer:
+        await flush()
+
+
+async def run_pipeline_async(token: str, batch_num: str, concurrency: int = GENERATION_CONCURRENCY,
+                             on_result: Optional[Callable[[Dict], None]] = None,
+                             queue_size: int = PIPELINE_QUEUE_SIZE) -> Dict:
+    """异步处理一个批次，返回 {"total", "generated", "written", "error", "write_errors"}
+
+    error 为拉取中途失败的原因（此时 total 只是已取到的产品数），write_errors 为写入表2失败的原因列表。
+    """
+    client = AsyncHTTPClient()
+    products_q: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    results_q: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    summary = {"total": 0, "generated": 0, "written": 0, "error": None, "write_errors": []}
+
+    writer = asyncio.create_task(_write_stage(client, token, results_q, summary))
+    workers = [
+        asyncio.create_task(_generate_stage(client, products_q, results_q, on_result))
+        for _ in range(max(1, concurrency))
+    ]
+    try:
+        try:
+            await _fetch_stage(client, token, batch_num, products_q, summary)
+        except Exception as e:
+            # 拉取中途失败时，已取到的产品仍然走完生成和写入
+            summary["error"] = f"获取产品失败: {e}"
+        for _ in workers:
+            await products_q.put(_DONE)
+        await asyncio.gather(*workers)
+        await results_q.put(_DONE)
+        await writer
+    except BaseException:
+        for task in workers + [writer]:
+            task.cancel()
+        raise
+    finally:
+        await client.close()
+    return summary
+
+
+def run_pipeline(token: str, batch_num: str, concurrency: int = GENERATION_CONCURRENCY,
+                 on_result: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """在新的事件循环中运行异步流水线（供同步代码调用）"""
+    return asyncio.run(run_pipeline_async(token, batch_num, concurrency, on_result))
@@ -0,0 +1,152 @@
+"""
+表3 处理进度上报模块
+生成过程中每完成一个产品只在内存里计数，后台线程每隔 PROGRESS_UPDATE_INTERVAL 秒
+把有变化的批次写成 "处理中 x/N | 速度 | 预计剩余 | 更新于 时间" 写入 COZE result；
+同时处理的多个批次合并为一次 records/batch_update 请求，不会因逐个产品 PUT 触发飞书限流。
+进度长时间没有变化时也会定期重写（刷新末尾的心跳时间），心跳超过 PROGRESS_STALE_AFTER 秒的批次
+视为处理进程已中断，全量检查时会被重新触发（见 feishu.search_triggered_batches）。
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from .config import PROGRESS_UPDATE_INTERVAL, PROGRESS_STALE_AFTER
+from .feishu import get_feishu_token, update_batch_results, heartbeat_text, PROGRESS_PREFIX
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    """把剩余秒数格式化为 "1小时5分" / "3分20秒" / "45秒" """
+    if seconds is None:
+        return "--"
+    seconds = int(seconds + 0.5)
+    if seconds >= 3600:
+        return f"{seconds // 3600}小时{seconds % 3600 // 60}分"
+    if seconds >= 60:
+        return f"{seconds // 60}分{seconds % 60}秒"
+    return f"{seconds}秒"
+
+
+def progress_text(done: int, total: int, rate: float) -> str:
+    """表3 中显示的进度文本"""
+    eta = (total - done) / rate if rate > 0 else None
+    return f"{PROGRESS_PREFIX} {done}/{total} | {rate:.1f}个/秒 | 预计剩余 {format_eta(eta)}"
+
+
+class ProgressReporter:
+    """合并各批次的进度并定时批量写入表3（线程安全）
+
+    start() 登记批次，advance() 在每个产品完成时调用，finish() 停止上报；
+    finish() 会等待进行中的写入结束，之后调用方写入的最终结果不会被旧进度覆盖。
+    """
+
+    def __init__(self, interval: float = PROGRESS_UPDATE_INTERVAL,
+                 update: Callable[[str, Dict[str, str]], int] = update_batch_results,
+                 get_token: Callable[[], str] = get_feishu_token,
+                 clock: Callable[[], float] = time.monotonic,
+                 keepalive: float = PROGRESS_STALE_AFTER / 3):
+        self.interval = interval
+        self.keepalive = keepalive      # 进度没有变化时最长多久重写一次，0 不重写
+        self.update = update
+        self.get_token = get_token
+        self.clock = clock
+        self._entries: Dict[str, Dict] = {}     # record_id -> 进度
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()     # 写入表3期间持有
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"flushes": 0, "records": 0, "advances": 0, "errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def start(self, record_id: Optional[str], total: int, done: int = 0):
+        """登记一个批次（done 为断点续跑时已完成的产品数）"""
+        if not self.enabled or not record_id:
+            return
+        with self._lock:
+            self._entries[record_id] = {
+                "total": total, "done": done, "base": done, "started": self.clock(),
+                "dirty": True, "text": None, "written_at": None,
+            }
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="progress-reporter", daemon=True)
+                self._thread.start()
+
+    def advance(self, record_id: Optional[str], count: int = 1):
+        """记录完成的产品数（只更新内存）"""
+        with self._lock:
+            entry = self._entries.get(record_id)
+            if entry is not None:
+                entry["done"] = min(entry["total"], entry["done"] + count)
+                entry["dirty"] = True
+                self._stats["advances"] += 1
+
+    def finish(self, record_id: Optional[str]):
+        """停止上报该批次，并等待进行中的写入结束"""
+        with self._lock:
+            if self._entries.pop(record_id, None) is None:
+                return
+        with self._flush_lock:
+            pass
+
+    def _pending_updates(self) -> Dict[str, str]:
+        # 调用方持有锁
+        now = self.clock()
+        updates = {}
+        for record_id, entry in self._entries.items():
+            # 长时间没有变化（如单个产品卡住）时重写一次，避免被当作进程已中断
+            due = self.keepalive and entry["written_at"] is not None and now - entry["written_at"] >= self.keepalive
+            if not entry["dirty"] and not due:
+                continue
+            entry["dirty"] = False
+            elapsed = now - entry["started"]
+            rate = (entry["done"] - entry["base"]) / elapsed if elapsed > 0 else 0.0
+            text = progress_text(entry["done"], entry["total"], rate)
+            if text != entry["text"] or due:
+                entry["text"] = text
+                entry["written_at"] = now
+                updates[record_id] = f"{text} | {heartbeat_text()}"
+        return updates
+
+    def flush(self) -> int:
+        """立即把有变化的批次写入表3，返回更新条数"""
+        with self._flush_lock:
+            with self._lock:
+                updates = self._pending_updates()
+            if not updates:
+                return 0
+            try:
+                self.update(self.get_token(), updates)
+            except Exception:
+                with self._lock:
+                    self._stats["errors"] += 1
+                    # 下一轮重试仍在处理中的批次
+                    for record_id in updates:
+                        entry = self._entries.get(record_id)
+                        if entry is not None:
+                            entry["dirty"] = True
+                            entry["text"] = None
+                return 0
+            with self._lock:
+                self._stats["flushes"] += 1
+                self._stats["records"] += len(updates)
+            return len(updates)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["active"] = len(self._entries)
+        return stats
+
+
+_reporter = ProgressReporter()
+
+
+def get_progress_reporter() -> ProgressReporter:
+    """获取进程内共享的进度上报器"""
+    return _reporter
@@ -0,0 +1,84 @@
+"""
+限速模块
+令牌桶限速器，多个线程共享同一个速率上限
+"""
+import threading
+import time
+
+from . import trace
+
+
+class RateLimiter:
+    """令牌桶限速器（线程安全）"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate                # 每秒补充的令牌数，<= 0 表示不限速
+        self.burst = max(1, burst)      # 桶容量（允许的突发请求数）
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """预占令牌，返回调用方需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1):
+        """阻塞直到拿到令牌"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            with trace.span("ratelimit.wait", cat="sleep", wait=round(wait, 3)):
+                time.sleep(wait)
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """根据服务端限流反馈自动调整速率的令牌桶
+
+    被限流时速率减半，并在 Retry-After 期间暂停所有调用方；
+    此后每次成功请求按加性增长逐步恢复，直到 max_rate。
+    """
+
+    def __init__(self, rate: float, burst: int = 1, min_rate: float = 0.5, increase: float = 0.1):
+        super().__init__(rate, burst)
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.increase = increase        # 每次成功请求增加的速率（次/秒）
+        self._blocked_until = 0.0
+        self.stats = {"throttled": 0, "waited": 0.0}
+
+    def reserve(self, tokens: float = 1) -> float:
+        wait = super().reserve(tokens)
+        with self._lock:
+            blocked = self._blocked_until - time.monotonic()
+            if wait > 0 or blocked > 0:
+                self.stats["waited"] += max(wait, blocked)
+        return max(wait, blocked)
+
+    def penalize(self, retry_after: float = 0.0):
+        """收到限流响应：速率减半，retry_after 秒内不再放行请求"""
+        with self._lock:
+            self.stats["throttled"] += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            if retry_after > 0:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+    def reward(self):
+        """请求成功：速率加性恢复"""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def cap(self, max_rate: float):
+        """服务端声明的速率上限（如 x-ogw-ratelimit-limit）"""
+        with self._lock:
+            if max_rate > 0:
+                self.max_rate = max_rate
+                self.rate = min(self.rate, max_rate)
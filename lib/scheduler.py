@@ -0,0 +1,110 @@
+"""
+多批次调度模块
+同时处理多个触发的批次，所有批次共用云雾API的自适应并发上限（全局预算）：
+- 最多 parallel 个批次同时处理，其余按策略排队
+- 批次内的大模型请求在 concurrency.flow() 中发出，由并发控制器在批次间分配名额
+  （fair: 加权公平；sjf: 剩余产品数最少的批次优先）
+- sjf 策略下排队中的批次也按产品数从少到多开始处理（size_of 提供产品数）
+"""
+import itertools
+import threading
+from typing import Callable, Dict, List, Optional
+
+from .concurrency import FAIR, SJF, POLICIES, flow
+
+
+class BatchScheduler:
+    """并行处理批次的调度器（线程安全，可在处理中继续加入新批次）
+
+    process(批次信息) 返回是否处理成功；批次信息至少包含 batch，可选 weight（默认 1）。
+    """
+
+    def __init__(self, process: Callable[[Dict], bool], parallel: int = 3, policy: str = FAIR,
+                 size_of: Optional[Callable[[Dict], Optional[int]]] = None):
+        self.process = process
+        self.parallel = max(1, parallel)
+        self.policy = policy if policy in POLICIES else FAIR
+        self.size_of = size_of
+        self._cond = threading.Condition()
+        self._pending: List = []                # [(排序键, 批次信息)]
+        self._active: Dict[str, Dict] = {}      # 批次号 -> 批次信息（排队中或处理中）
+        self._running = 0
+        self._order = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._stats = {"submitted": 0, "succeeded": 0, "failed": 0}
+
+    def _sort_key(self, batch_info: Dict):
+        order = next(self._order)
+        if self.policy == SJF and self.size_of:
+            size = batch_info.get("size")
+            return (size if size is not None else float("inf"), order)
+        return (0, order)
+
+    def submit(self, batches: List[Dict]) -> int:
+        """加入批次（已在排队或处理中的批次跳过），返回新加入的批次数"""
+        added = []
+        with self._cond:
+            for batch_info in batches:
+                if batch_info["batch"] not in self._active:
+                    self._active[batch_info["batch"]] = batch_info
+                    added.append(batch_info)
+        if not added:
+            return 0
+
+        # sjf 需要先知道产品数（在锁外查询）
+        if self.policy == SJF and self.size_of:
+            for batch_info in added:
+                try:
+                    batch_info["size"] = self.size_of(batch_info)
+                except Exception:
+                    batch_info["size"] = None
+
+        with self._cond:
+            for batch_info in added:
+                self._pending.append((self._sort_key(batch_info), batch_info))
+            self._pending.sort(key=lambda item: item[0])
+            self._stats["submitted"] += len(added)
+            while len(self._threads) < self.parallel:
+                thread = threading.Thread(target=self._work, name=f"batch-{len(self._threads) + 1}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._cond.notify_all()
+        return len(added)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                _, batch_info = self._pending.pop(0)
+                self._running += 1
+
+            ok = False
+            try:
+                with flow(batch_info["batch"], batch_info.get("weight", 1.0)):
+                    ok = bool(self.process(batch_info))
+            except Exception:
+                ok = False
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._active.pop(batch_info["batch"], None)
+                    self._stats["succeeded" if ok else "failed"] += 1
+                    self._cond.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待所有已加入的批次处理完，超时返回 False"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._active, timeout)
+
+    def active(self) -> List[str]:
+        """排队中和处理中的批次号"""
+        with self._cond:
+            return list(self._active)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({"running": self._running, "pending": len(self._pending),
+                          "parallel": self.parallel, "policy": self.policy})
+        return stats
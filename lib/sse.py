@@ -0,0 +1,69 @@
+"""
+Server-Sent Events 输出模块
+把处理进度以 text/event-stream 格式逐条写给浏览器：
+- 可以在任意线程中调用 send()，写入时加锁保证事件不交错
+- 空闲超过 heartbeat 秒时发送注释行，避免代理因长时间无数据断开连接
+- 浏览器断开后不再写入，但调用方的处理流程照常完成
+"""
+import json
+import threading
+import time
+from typing import Dict, Optional
+
+SSE_HEADERS = {
+    "Content-Type": "text/event-stream; charset=utf-8",
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",       # 关闭 nginx 等反向代理的响应缓冲
+}
+
+
+def format_event(event: str, data: Dict, event_id: Optional[int] = None) -> bytes:
+    """编码一条 SSE 事件"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False))
+    return ("\n".join(lines) + "\n\n").encode('utf-8')
+
+
+class EventStream:
+    """向响应流写入 SSE 事件（线程安全）"""
+
+    def __init__(self, wfile, heartbeat: float = 15.0):
+        self.wfile = wfile
+        self.heartbeat = heartbeat
+        self.connected = True
+        self.sent = 0
+        self._lock = threading.Lock()
+        self._last_write = time.monotonic()
+        self._closed = threading.Event()
+        if heartbeat:
+            threading.Thread(target=self._keepalive, name="sse-heartbeat", daemon=True).start()
+
+    def _write(self, raw: bytes):
+        # 调用方持有锁
+        if not self.connected:
+            return
+        try:
+            self.wfile.write(raw)
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            self.connected = False
+        self._last_write = time.monotonic()
+
+    def send(self, event: str, data: Dict):
+        """发送一条事件"""
+        with self._lock:
+            self.sent += 1
+            self._write(format_event(event, data, self.sent))
+
+    def _keepalive(self):
+        while not self._closed.wait(self.heartbeat / 3):
+            with self._lock:
+                if time.monotonic() - self._last_write >= self.heartbeat:
+                    self._write(b": keepalive\n\n")
+
+    def close(self):
+        """停止心跳（响应结束后由服务器关闭连接）"""
+        self._closed.set()
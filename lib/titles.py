@@ -0,0 +1,260 @@
+"""
+标题规则与本地修正模块
+在本地把长度不合规的标题调整到 100-110 字符（删除低价值词、缩写单位、按短语边界截断或用完整卖点短语扩写），
+不需要再请求大模型；只能从单词中间截断时不做修正，交给大模型
+"""
+import re
+from itertools import combinations
+from typing import List, Optional, Tuple
+
+from .config import TITLE_MIN_LENGTH, TITLE_MAX_LENGTH, BANNED_BRANDS, BANNED_WORDS
+
+# 单位缩写（按节省字符数从多到少排列）
+_UNIT_ABBREVIATIONS = [
+    (re.compile(r"\b(\d+(?:\.\d+)?)\s*Millimeters?\b", re.I), r"\1mm"),
+    (re.compile(r"\b(\d+(?:\.\d+)?)\s*Centimeters?\b", re.I), r"\1cm"),
+    (re.compile(r"\b(\d+(?:\.\d+)?)\s*Milliliters?\b", re.I), r"\1ml"),
+    (re.compile(r"\b(\d+(?:\.\d+)?)\s*Inches\b", re.I), r"\1in"),
+    (re.compile(r"\b(\d+(?:\.\d+)?)\s*Inch\b", re.I), r"\1in"),
+    (re.compile(r"\b(\d+(?:\.\d+)?)\s*Ounces?\b", re.I), r"\1oz"),
+    (re.compile(r"\b(\d+(?:\.\d+)?)\s*Pounds\b", re.I), r"\1lbs"),
+    (re.compile(r"\b(\d+(?:\.\d+)?)\s*Pound\b", re.I), r"\1lb"),
+    (re.compile(r"\b(\d+(?:\.\d+)?)\s*(?:Feet|Foot)\b", re.I), r"\1ft"),
+    (re.compile(r"\b(\d+(?:\.\d+)?)\s*Gallons?\b", re.I), r"\1gal"),
+    (re.compile(r"\s+and\s+", re.I), " & "),
+]
+
+# 可删除的低价值营销词
+_FILLER_WORDS = [
+    "Brand New", "High-Quality", "High Quality", "Professional", "Upgraded", "Premium", "Excellent",
+    "Amazing", "Perfect", "Latest", "Ideal", "Super", "Great", "Best", "Very", "New",
+]
+_FILLER_PATTERNS = [re.compile(rf"\b{re.escape(w)}\b\s*", re.I) for w in _FILLER_WORDS]
+
+# 禁用词（品牌名 + 规则禁用词），连同紧跟其后、单独留下没有意义的词（如 "Batteries Included" 的 Included）
+_BANNED_PATTERN = re.compile(
+    r"\b(?:" + "|".join(re.escape(w) for w in BANNED_BRANDS + BANNED_WORDS) + r")\b"
+    r"(?:[\s-]+(?:not\s+)?(?:included|required|powered|operated|sold\s+separately)\b)?\s*", re.I
+)
+
+# 单品不应出现的 "1pack" 字样
+_ONE_PACK_PATTERN = re.compile(r"\b1\s*-?\s*pack\b\s*", re.I)
+
+# 中文及全角字符（标题必须保持英文）
+_CJK_PATTERN = re.compile(r"[\u3000-\u9fff\uff00-\uffef]")
+
+# 短语分隔符
+_PHRASE_SPLIT = re.compile(r"\s*(?:,|;|\s[-–|]\s)\s*")
+
+# 不用于扩写的卖点（包装清单、售后等）
+_SKIP_PHRASE_PREFIXES = ("what you get", "package", "warranty", "note", "customer", "reliable support")
+_MAX_EXPANSION_PHRASES = 6
+
+# 截断后不应出现在结尾的词
+_DANGLING_WORDS = {"and", "&", "or", "for", "with", "w/", "of", "to", "the", "a", "an", "in", "on", "by", "+"}
+
+
+def is_valid_length(title: str) -> bool:
+    """标题长度是否在规定范围内"""
+    return TITLE_MIN_LENGTH <= len(title) <= TITLE_MAX_LENGTH
+
+
+def _tidy(title: str) -> str:
+    """合并多余空白和删除词后残留的标点"""
+    title = re.sub(r"\s+", " ", title)
+    title = re.sub(r"\s+([,;])", r"\1", title)
+    title = re.sub(r"([,;])(?:\s*[,;])+", r"\1", title)
+    title = re.sub(r"\(\s*\)", "", title)
+    return title.strip(" ,;-–|")
+
+
+def find_banned_terms(title: str) -> List[str]:
+    """返回标题中出现的品牌名和禁用词"""
+    return [m.group(0).strip() for m in _BANNED_PATTERN.finditer(title)]
+
+
+def remove_banned_terms(title: str) -> str:
+    """删除标题中的品牌名、禁用词和 "1pack" 字样"""
+    title = _ONE_PACK_PATTERN.sub("", _BANNED_PATTERN.sub("", title))
+    # 删除后残留在标点前的连接词，如 "Mouse with, 2.4G"
+    title = re.sub(r"\s+(?:with|and|for|&)\s*(?=[,;]|$)", "", title, flags=re.I)
+    return _tidy(title)
+
+
+def _strip_dangling(title: str) -> str:
+    """去掉截断后结尾多余的连接词和标点"""
+    words = title.rstrip(" ,;-–|").split(" ")
+    while words and words[-1].lower() in _DANGLING_WORDS:
+        words.pop()
+    return " ".join(words).rstrip(" ,;-–|")
+
+
+def _shrink_step(title: str, pattern: re.Pattern, replacement: str) -> str:
+    """从后往前逐个应用替换，缩到上限以内即返回；不会缩到下限以下"""
+    for match in reversed(list(pattern.finditer(title))):
+        candidate = _tidy(title[:match.start()] + match.expand(replacement) + title[match.end():])
+        if len(candidate) < TITLE_MIN_LENGTH:
+            continue
+        title = candidate
+        if len(title) <= TITLE_MAX_LENGTH:
+            return title
+    return title
+
+
+# fit_title_detail 返回的修正方式
+FIT_VALID = "valid"             # 删除禁用词后已合规
+FIT_SHORTENED = "shortened"     # 删除低价值词 / 缩写单位
+FIT_PHRASE_CUT = "phrase_cut"   # 按短语边界截断
+FIT_WORD_CUT = "word_cut"       # 按单词边界截断（仅 allow_word_cut）
+FIT_EXPANDED = "expanded"       # 用完整卖点短语扩写
+FIT_PARTIAL = "partial_phrase"  # 用卖点短语的前几个单词扩写（仅 allow_word_cut）
+
+
+def _truncate_phrases(title: str, allow_word_cut: bool = False) -> Tuple[Optional[str], Optional[str]]:
+    """按短语边界从尾部截断，返回 (标题, 修正方式)；allow_word_cut 时最后一个短语不够截时退回到单词边界"""
+    phrases = _PHRASE_SPLIT.split(title)
+    separators = _PHRASE_SPLIT.findall(title)
+    kept = phrases[0]
+    for i, phrase in enumerate(phrases[1:]):
+        candidate = kept + separators[i] + phrase
+        if len(candidate) > TITLE_MAX_LENGTH:
+            break
+        kept = candidate
+    if TITLE_MIN_LENGTH <= len(kept) <= TITLE_MAX_LENGTH:
+        return kept, FIT_PHRASE_CUT
+    if not allow_word_cut:
+        return None, None
+
+    # 在单词边界截断
+    cut = title[:TITLE_MAX_LENGTH + 1]
+    cut = _strip_dangling(cut[:cut.rfind(" ")] if " " in cut else cut)
+    return (cut, FIT_WORD_CUT) if is_valid_length(cut) else (None, None)
+
+
+def _shorten(title: str, allow_word_cut: bool = False) -> Tuple[Optional[str], Optional[str]]:
+    for pattern in _FILLER_PATTERNS:
+        title = _shrink_step(title, pattern, "")
+        if is_valid_length(title):
+            return title, FIT_SHORTENED
+    for pattern, replacement in _UNIT_ABBREVIATIONS:
+        title = _shrink_step(title, pattern, replacement)
+        if is_valid_length(title):
+            return title, FIT_SHORTENED
+    return _truncate_phrases(title, allow_word_cut)
+
+
+def bullet_phrases(bullets: str) -> List[str]:
+    """从五点描述中提取可用于扩写标题的短语（优先取每条卖点的小标题）"""
+    phrases = []
+    for line in re.split(r"[\n•●▪◆]+|(?<=[.!?])\s+(?=[A-Z【\[])", bullets or ""):
+        line = line.strip(" -*【】[]\t")
+        if not line or not line.isascii():
+            continue
+        head = re.split(r"\s*[:：]\s*|\s+[-–—]\s+", line, maxsplit=1)[0]
+        if len(head) > 40:
+            head = re.split(r"[,.;!?]", line, maxsplit=1)[0]
+        if head.lower().startswith(_SKIP_PHRASE_PREFIXES):
+            continue
+        head = remove_banned_terms(head)
+        for pattern in _FILLER_PATTERNS:
+            head = pattern.sub("", head)
+        head = _tidy(head)
+        if 6 <= len(head) <= 40:
+            phrases.append(head)
+    return phrases
+
+
+def _is_redundant(phrase: str, title_words: set) -> bool:
+    """短语的大部分单词已在标题中出现"""
+    words = [w.lower() for w in re.findall(r"[\w']+", phrase)]
+    return not words or sum(w in title_words for w in words) * 2 > len(words)
+
+
+def _expand(title: str, bullets: str, allow_word_cut: bool = False) -> Tuple[Optional[str], Optional[str]]:
+    title_words = {w.lower() for w in re.findall(r"[\w']+", title)}
+    phrases = [p for p in bullet_phrases(bullets) if not _is_redundant(p, title_words)][:_MAX_EXPANSION_PHRASES]
+
+    # 优先用尽量少的完整短语补齐（按卖点顺序）
+    for count in range(1, len(phrases) + 1):
+        for combo in combinations(phrases, count):
+            candidate = ", ".join((title,) + combo)
+            if is_valid_length(candidate):
+                return candidate, FIT_EXPANDED
+    if not allow_word_cut:
+        return None, None
+
+    # 仍然不够长时，在完整短语后面再截取一个短语的前几个单词补齐
+    for count in range(0, len(phrases)):
+        for combo in combinations(phrases, count):
+            base = ", ".join((title,) + combo)
+            for phrase in phrases:
+                if phrase in combo:
+                    continue
+                words = phrase.split(" ")
+                for n in range(len(words) - 1, 0, -1):
+                    candidate = _strip_dangling(f"{base}, {' '.join(words[:n])}")
+                    if is_valid_length(candidate):
+                        return candidate, FIT_PARTIAL
+    return None, None
+
+
+def fit_title_detail(title: str, bullets: str = "", allow_word_cut: bool = False) -> Tuple[Optional[str], Optional[str]]:
+    """在本地把标题调整到规定长度，返回 (标题, 修正方式)，无法调整时返回 (None, None)
+
+    默认只在短语边界截断、只用完整的卖点短语扩写；allow_word_cut 时才允许从短语中间截断（仅用于对比统计）。
+    """
+    if _CJK_PATTERN.search(title):
+        return None, None
+    title = remove_banned_terms(_tidy(title))
+    if is_valid_length(title):
+        return title, FIT_VALID
+    if len(title) > TITLE_MAX_LENGTH:
+        return _shorten(title, allow_word_cut)
+    return _expand(title, bullets, allow_word_cut)
+
+
+def fit_title(title: str, bullets: str = "") -> Optional[str]:
+    """在本地把标题调整到规定长度，无法调整时返回 None（交给大模型处理）"""
+    return fit_title_detail(title, bullets)[0]
+
+
+def title_problems(title: str) -> List[str]:
+    """列出标题违反的规则，合规时返回空列表"""
+    problems = []
+    if not is_valid_length(title):
+        problems.append(f"长度 {len(title)}")
+    banned = find_banned_terms(title)
+    if banned:
+        problems.append(f"禁用词 {', '.join(banned)}")
+    if _ONE_PACK_PATTERN.search(title):
+        problems.append("含 1pack")
+    if _CJK_PATTERN.search(title):
+        problems.append("含中文")
+    return problems
+
+
+def score_title(title: str) -> Tuple[int, int]:
+    """候选标题评分（越小越好）：(长度以外的违规数, 与长度区间的距离)"""
+    rule_violations = len(find_banned_terms(title)) + bool(_ONE_PACK_PATTERN.search(title)) \
+        + bool(_CJK_PATTERN.search(title))
+    distance = max(TITLE_MIN_LENGTH - len(title), len(title) - TITLE_MAX_LENGTH, 0)
+    return rule_violations, distance
+
+
+def rank_titles(candidates: List[str]) -> List[str]:
+    """按评分从好到差排列候选标题（去重、去空）"""
+    unique = list(dict.fromkeys(c for c in candidates if c))
+    return sorted(unique, key=score_title)
+
+
+def pick_best_title(candidates: List[str], bullets: str = "") -> Optional[str]:
+    """从多个候选中选出合规标题：优先直接合规的，其次本地修正后合规的；都不行返回 None"""
+    ranked = rank_titles(candidates)
+    for title in ranked:
+        if not title_problems(title):
+            return title
+    for title in ranked:
+        fitted = fit_title(title, bullets)
+        if fitted:
+            return fitted
+    return None
@@ -0,0 +1,164 @@
+"""
+飞书访问令牌管理模块
+进程内共享一个 tenant_access_token：
+- 单飞刷新：令牌过期时只有一个线程请求新令牌，其余线程等待并复用结果
+- 后台刷新：长期运行的进程可启动后台线程，在过期前主动刷新
+- 失效重试：接口返回令牌失效错误码时作废当前令牌，换新令牌重试一次（见 feishu.http_request）
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from .config import FEISHU_API_BASE, FEISHU_APP_ID, FEISHU_APP_SECRET
+from .http_client import get_client
+from . import trace
+from .metrics import TOKEN_FETCH_SECONDS, gauge, register_collector
+
+# 令牌无效/过期的错误码
+INVALID_TOKEN_CODES = {99991661, 99991663, 99991664, 99991665, 99991668, 99991677}
+
+# 距离过期多久开始刷新（秒）
+REFRESH_MARGIN = 300
+# 后台刷新失败后的重试间隔（秒）
+RETRY_INTERVAL = 30
+
+
+def _request_tenant_token() -> Tuple[str, float]:
+    """请求新的 tenant_access_token，返回 (令牌, 有效期秒数)"""
+    url = f"{FEISHU_API_BASE}/auth/v3/tenant_access_token/internal"
+    data = {
+        "app_id": FEISHU_APP_ID,
+        "app_secret": FEISHU_APP_SECRET
+    }
+    result = get_client().request_json("POST", url, data=data, timeout=30)
+    if result.get("code") == 0:
+        return result["tenant_access_token"], result.get("expire", 7200)
+    raise Exception(f"获取飞书token失败: {result}")
+
+
+class TokenManager:
+    """线程安全的令牌缓存"""
+
+    def __init__(self, fetch: Callable[[], Tuple[str, float]] = _request_tenant_token,
+                 refresh_margin: float = REFRESH_MARGIN):
+        self.fetch = fetch
+        self.refresh_margin = refresh_margin
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._retired = set()           # 已被替换的旧令牌
+        self._lock = threading.Lock()
+        self._refreshing: Optional[threading.Event] = None
+        self._error: Optional[Exception] = None
+        self._background: Optional[threading.Thread] = None
+        self._stats = {"refreshes": 0, "failures": 0, "invalidations": 0,
+                       "last_latency": 0.0, "max_latency": 0.0, "total_latency": 0.0}
+
+    def _fresh(self) -> bool:
+        return self._token is not None and time.time() < self._expires_at - self.refresh_margin
+
+    def get(self) -> str:
+        """返回有效令牌，需要刷新时只有一个线程实际发起请求"""
+        with self._lock:
+            if self._fresh():
+                return self._token
+            if self._refreshing is None:
+                self._refreshing = threading.Event()
+                leader = True
+            elif self._token is not None and time.time() < self._expires_at:
+                # 其他线程正在提前刷新，旧令牌仍然有效，直接使用
+                return self._token
+            else:
+                leader = False
+            done = self._refreshing
+
+        if leader:
+            self._refresh(done)
+        else:
+            done.wait()
+
+        with self._lock:
+            if self._token is not None and time.time() < self._expires_at:
+                return self._token
+            raise self._error or Exception("获取飞书token失败")
+
+    def _refresh(self, done: threading.Event):
+        start = time.perf_counter()
+        try:
+            with trace.span("token.refresh"):
+                token, expire = self.fetch()
+        except Exception as e:
+            TOKEN_FETCH_SECONDS.observe(time.perf_counter() - start, "error")
+            with self._lock:
+                self._error = e
+                self._stats["failures"] += 1
+        else:
+            latency = time.perf_counter() - start
+            TOKEN_FETCH_SECONDS.observe(latency, "ok")
+            with self._lock:
+                if self._token and self._token != token:
+                    self._retired.add(self._token)
+                self._token = token
+                self._expires_at = time.time() + expire
+                self._error = None
+                self._stats["refreshes"] += 1
+                self._stats["last_latency"] = round(latency, 3)
+                self._stats["max_latency"] = round(max(self._stats["max_latency"], latency), 3)
+                self._stats["total_latency"] += latency
+        finally:
+            with self._lock:
+                self._refreshing = None
+            done.set()
+
+    def invalidate(self, token: str):
+        """接口报告令牌失效时调用；只作废仍在使用的同一个令牌，避免并发失效时重复刷新"""
+        with self._lock:
+            if token == self._token and self._expires_at > 0:
+                self._expires_at = 0.0
+                self._stats["invalidations"] += 1
+
+    def current(self, token: str) -> str:
+        """旧令牌已被替换时返回当前令牌，否则原样返回（供仍持有旧令牌的调用方换用新令牌）"""
+        with self._lock:
+            if token in self._retired and self._token:
+                return self._token
+        return token
+
+    def start_background_refresh(self):
+        """启动后台线程，在令牌过期前主动刷新（长期运行的进程使用）"""
+        with self._lock:
+            if self._background is not None:
+                return
+            self._background = threading.Thread(target=self._refresh_loop, name="token-refresh", daemon=True)
+        self._background.start()
+
+    def _refresh_loop(self):
+        while True:
+            with self._lock:
+                wait = self._expires_at - self.refresh_margin - time.time()
+            if wait > 0:
+                time.sleep(min(wait, 600))
+                continue
+            try:
+                self.get()
+            except Exception:
+                time.sleep(RETRY_INTERVAL)
+
+    def stats(self) -> Dict:
+        """刷新次数与耗时统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["expires_in"] = max(0, int(self._expires_at - time.time())) if self._token else 0
+        stats["avg_latency"] = round(stats["total_latency"] / stats["refreshes"], 3) if stats["refreshes"] else 0.0
+        stats["total_latency"] = round(stats["total_latency"], 3)
+        return stats
+
+
+_manager = TokenManager()
+
+_TOKEN_EXPIRES_IN = gauge("feishu_token_expires_in_seconds", "当前令牌剩余有效期")
+register_collector(lambda: _TOKEN_EXPIRES_IN.set(_manager.stats()["expires_in"]))
+
+
+def get_token_manager() -> TokenManager:
+    """获取进程内共享的令牌管理器"""
+    return _manager
@@ -0,0 +1,167 @@
+"""
+批次耗时追踪模块
+开启后为每个批次记录嵌套的耗时区间（阶段、每次 HTTP 调用、限速/退避等待），
+批次结束时写出一个 Chrome trace-event 格式的 JSON 文件，可直接拖入 https://ui.perfetto.dev 查看。
+
+- 通过环境变量 TRACE_DIR 或 server.py --trace DIR 开启
+- 当前批次的记录器保存在 contextvars 中，并发处理的多个批次互不干扰；
+  提交到线程池或后台线程的任务需用 bind() 带上当前上下文
+- 未开启时 span() 只做一次 ContextVar 读取并返回共享的空对象
+"""
+import asyncio
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from .config import TRACE_DIR
+
+_current: contextvars.ContextVar = contextvars.ContextVar("trace_recorder", default=None)
+_trace_dir = TRACE_DIR
+
+
+def set_trace_dir(path: str):
+    """设置追踪文件目录（置空关闭）"""
+    global _trace_dir
+    _trace_dir = path
+
+
+def enabled() -> bool:
+    return bool(_trace_dir)
+
+
+class TraceRecorder:
+    """收集一个批次的追踪事件（线程安全）"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pid = os.getpid()
+        self.events: List[Dict] = []
+        self.thread_names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def add(self, event: Dict, tid: int, thread_name: str):
+        with self._lock:
+            self.events.append(event)
+            self.thread_names.setdefault(tid, thread_name)
+
+    def to_json(self) -> Dict:
+        with self._lock:
+            events = list(self.events)
+            names = dict(self.thread_names)
+        meta = [{"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0, "args": {"name": self.name}}]
+        meta += [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": thread_name}}
+                 for tid, thread_name in names.items()]
+        return {"traceEvents": meta + events, "displayTimeUnit": "ms"}
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json(), f, ensure_ascii=False)
+
+
+def _task_tid() -> Optional[int]:
+    """在 asyncio 任务中时按任务区分轨道（同一线程上的并发任务不会互相嵌套）"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        return None
+    return id(task) & 0x7fffffff if task else None
+
+
+class _Span:
+    __slots__ = ("recorder", "name", "cat", "args", "start")
+
+    def __init__(self, recorder: TraceRecorder, name: str, cat: str, args: Dict):
+        self.recorder = recorder
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def set(self, **args):
+        """补充区间属性（如响应状态码）"""
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = f"{exc_type.__name__}: {exc}"[:200]
+        task_tid = _task_tid()
+        if task_tid is None:
+            tid, thread_name = threading.get_ident(), threading.current_thread().name
+        else:
+            tid, thread_name = task_tid, f"task-{task_tid:x}"
+        self.recorder.add({
+            "name": self.name, "cat": self.cat, "ph": "X",
+            "ts": self.start / 1000, "dur": (end - self.start) / 1000,
+            "pid": self.recorder.pid, "tid": tid, "args": self.args,
+        }, tid, thread_name)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, cat: str = "stage", **args):
+    """记录一个耗时区间：with span("fetch.page", page=1): ..."""
+    recorder = _current.get()
+    if recorder is None:
+        return _NULL_SPAN
+    return _Span(recorder, name, cat, args)
+
+
+def bind(fn: Callable) -> Callable:
+    """让提交到其他线程的函数沿用当前追踪上下文（未追踪时原样返回）"""
+    if _current.get() is None:
+        return fn
+    context = contextvars.copy_context()
+    # 每次调用使用上下文的副本，同一函数可在多个线程中同时运行
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+def _safe_name(text: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", str(text))[:80] or "batch"
+
+
+@contextmanager
+def trace_batch(batch_num: str, **args):
+    """追踪一个批次；开启时结束后写出追踪文件，recorder.path 为文件路径"""
+    if not _trace_dir or _current.get() is not None:
+        yield None
+        return
+    recorder = TraceRecorder(f"batch {batch_num}")
+    recorder.path = None
+    token = _current.set(recorder)
+    try:
+        with span("batch", batch=batch_num, **args):
+            yield recorder
+    finally:
+        _current.reset(token)
+        try:
+            os.makedirs(_trace_dir, exist_ok=True)
+            path = os.path.join(_trace_dir, f"trace-{_safe_name(batch_num)}-{datetime.now():%Y%m%d-%H%M%S}.json")
+            recorder.write(path)
+            recorder.path = path
+        except OSError:
+            pass
@@ -0,0 +1,81 @@
+"""
+监控模式的增量检查模块
+- 只向服务端查询触发中的批次（COZE RUN 勾选且 COZE result 为空），且只返回需要的列
+- 以记录的 last_modified_time 维护高水位，已返回过且之后未被修改的记录不再重复返回
+- 定期做一次不带高水位的全量核对，补上可能漏掉的记录
+- 连续空闲时按倍数拉长检查间隔，发现新批次后立即恢复为基础间隔
+"""
+import time
+from typing import Callable, Dict, List, Optional
+
+from .config import WATCH_MAX_INTERVAL, WATCH_BACKOFF, WATCH_IDLE_POLLS, WATCH_FULL_SYNC_INTERVAL
+from .feishu import search_triggered_batches
+
+
+class ProgressWatcher:
+    """表3增量检查器（单线程使用）"""
+
+    def __init__(self, interval: float, max_interval: float = WATCH_MAX_INTERVAL,
+                 backoff: float = WATCH_BACKOFF, idle_polls: int = WATCH_IDLE_POLLS,
+                 full_sync_interval: float = WATCH_FULL_SYNC_INTERVAL,
+                 search: Callable[[str, Optional[int]], List[Dict]] = search_triggered_batches,
+                 clock: Callable[[], float] = time.monotonic):
+        self.base_interval = max(1.0, float(interval))
+        self.max_interval = max(self.base_interval, max_interval)
+        self.backoff = max(1.0, backoff)
+        self.idle_polls = max(0, idle_polls)
+        self.full_sync_interval = full_sync_interval
+        self.search = search
+        self.clock = clock
+        self.interval = self.base_interval
+        self.high_water: Optional[int] = None     # 已返回记录中最大的 last_modified_time（毫秒）
+        self._seen: Dict[str, int] = {}           # record_id -> 返回时的 last_modified_time
+        self._idle = 0
+        self._last_full = None
+        self._stats = {"polls": 0, "full_syncs": 0, "found": 0, "skipped": 0}
+
+    def poll(self, token: str) -> List[Dict]:
+        """查询自上次以来新触发或被修改过的批次，并据此调整下一次检查间隔"""
+        now = self.clock()
+        full = self.high_water is None or now - self._last_full >= self.full_sync_interval
+        batches = self.search(token, None if full else self.high_water)
+        self._stats["polls"] += 1
+
+        if full:
+            self._stats["full_syncs"] += 1
+            self._last_full = now
+            # 全量结果就是当前仍在触发中的全部记录，其余记录不必再记住
+            current = {b["record_id"] for b in batches}
+            self._seen = {rid: m for rid, m in self._seen.items() if rid in current}
+
+        fresh = []
+        for b in batches:
+            modified = b.get("modified") or 0
+            if not full and self._seen.get(b["record_id"]) == modified:
+                self._stats["skipped"] += 1
+                continue
+            self._seen[b["record_id"]] = modified
+            fresh.append(b)
+            if self.high_water is None or modified > self.high_water:
+                self.high_water = modified
+        if self.high_water is None:
+            self.high_water = 0
+
+        self._stats["found"] += len(fresh)
+        self._adjust(bool(fresh))
+        return fresh
+
+    def _adjust(self, active: bool):
+        if active:
+            self._idle = 0
+            self.interval = self.base_interval
+            return
+        self._idle += 1
+        if self._idle > self.idle_polls:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+
+    def stats(self) -> Dict:
+        """检查次数、当前间隔和高水位"""
+        stats = dict(self._stats)
+        stats.update({"interval": self.interval, "idle_polls": self._idle, "high_water": self.high_water})
+        return stats
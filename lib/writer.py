@@ -0,0 +1,134 @@
+"""
+表2 流式写入模块
+生成标题的同时在后台线程中写入表2：攒够 100 条或等待超过最长延迟就写一次，
+写入耗时与大模型调用重叠，中途崩溃或超时也只丢失尚未写入的少量标题；
+写入失败的记录保留到 close() 时再重试一次，仍失败的记入 unwritten
+"""
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from .config import WRITE_FLUSH_SIZE, WRITE_MAX_DELAY
+from .feishu import write_output_batch
+from .metrics import WRITE_FAILURES
+from . import trace
+
+# 结束标记
+_CLOSE = object()
+
+
+class StreamingWriter:
+    """后台写入表2的缓冲区
+
+    add() 不阻塞生成线程；close() 写入剩余记录、重试失败的记录并等待后台线程结束。
+    on_written 在每次写入成功后（于后台线程中）以本次写入的记录调用，其异常记入 errors，不影响后续写入。
+    """
+
+    def __init__(self, token: str, flush_size: int = WRITE_FLUSH_SIZE, max_delay: float = WRITE_MAX_DELAY,
+                 write: Callable[[str, List[Dict]], int] = write_output_batch,
+                 on_written: Optional[Callable[[List[Dict]], None]] = None):
+        self.token = token
+        self.on_written = on_written
+        self.flush_size = max(1, min(flush_size, 100))   # batch_create 每次最多 100 条
+        self.max_delay = max_delay
+        self.write = write
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.errors: List[str] = []
+        self.unwritten: List[Dict] = []     # 最终重试后仍未写入的记录
+        self._retry: List[Dict] = []        # 写入失败、等待 close() 时重试的记录
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=trace.bind(self._run), name="output-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, asin: str, product_name: str, item: Optional[str] = None):
+        """加入一条待写入的标题（item 为断点日志中的产品键，原样传给 on_written）"""
+        record = {"asin": asin, "product_name": product_name}
+        if item is not None:
+            record["item"] = item
+        self._queue.put(record)
+
+    def _flush(self, buffer: List[Dict]) -> bool:
+        """写入一组记录，返回是否成功"""
+        self.flushes += 1
+        try:
+            self.written += self.write(self.token, buffer)
+        except Exception as e:
+            self.errors.append(str(e)[:200])
+            return False
+        if self.on_written:
+            try:
+                self.on_written(buffer)
+            except Exception as e:
+                self.errors.append(f"on_written: {str(e)[:200]}")
+        return True
+
+    def _flush_or_retry(self, buffer: List[Dict]):
+        if not self._flush(buffer):
+            self._retry.extend(buffer)
+
+    def _run(self):
+        try:
+            self._loop()
+        except Exception as e:
+            # 不应发生；记录后由 close() 接手队列中剩余的记录
+            self.errors.append(f"writer: {str(e)[:200]}")
+
+    def _loop(self):
+        buffer: List[Dict] = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _CLOSE:
+                break
+            if item is not None:
+                if not buffer:
+                    deadline = time.monotonic() + self.max_delay
+                buffer.append(item)
+
+            if buffer and (len(buffer) >= self.flush_size or time.monotonic() >= deadline):
+                self._flush_or_retry(buffer)
+                buffer = []
+                deadline = None
+
+        for i in range(0, len(buffer), self.flush_size):
+            self._flush_or_retry(buffer[i:i + self.flush_size])
+
+    def close(self) -> int:
+        """写入剩余记录并重试失败的记录，返回成功写入的总条数"""
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        # 后台线程意外退出时队列中可能还有记录
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _CLOSE:
+                self._retry.append(item)
+        retry, self._retry = self._retry, []
+        for i in range(0, len(retry), self.flush_size):
+            chunk = retry[i:i + self.flush_size]
+            if not self._flush(chunk):
+                self.unwritten.extend(chunk)
+                self.failed += len(chunk)
+                WRITE_FAILURES.inc(amount=len(chunk))
+        return self.written
+
+    def stats(self) -> Dict:
+        """写入统计"""
+        return {"written": self.written, "failed": self.failed, "flushes": self.flushes}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -2,28 +2,62 @@
 云雾 API 封装模块
 调用大模型生成产品标题
 """
-import urllib.request
-import urllib.error
+import asyncio
 import json
-import ssl
+import math
+import random
+import re
+import socket
 import time
-from typing import Dict, Optional
-from .config import YUNWU_API_BASE, YUNWU_API_KEY, MODEL_NAME, TITLE_GENERATION_PROMPT
+from typing import Callable, Dict, Generator, List, Optional, Tuple
+from .config import (
+    YUNWU_API_BASE, YUNWU_API_KEY, MODEL_NAME, TITLE_GENERATION_PROMPT, YUNWU_RATE_LIMIT, YUNWU_BACKOFF_MAX,
+    TITLE_MIN_LENGTH, TITLE_MAX_LENGTH, TITLE_CANDIDATES, TITLE_CANDIDATES_MODE,
+    TITLE_BATCH_PROMPT, TITLE_BATCH_MAX_TOKENS, TITLE_BATCH_TOKENS_PER_ITEM,
+    GENERATION_CONCURRENCY, MAX_GENERATION_CONCURRENCY, BATCH_POLICY
+)
+from .cache import get_title_cache, cache_key
+from .concurrency import AIMDController, OK, THROTTLED, OVERLOADED, FAILED, FAIR, POLICIES
+from .http_client import get_client, HTTPError
+from .metrics import (
+    YUNWU_REQUEST_SECONDS, ADJUST_SECONDS, YUNWU_RETRIES, TITLE_FALLBACKS, gauge, register_collector
+)
+from .ratelimit import RateLimiter
+from . import trace
+from .titles import pick_best_title, rank_titles, title_problems
 
-# SSL上下文
-SSL_CONTEXT = ssl.create_default_context()
-SSL_CONTEXT.check_hostname = False
-SSL_CONTEXT.verify_mode = ssl.CERT_NONE
+# 所有线程共享的云雾API限速器
+_rate_limiter = RateLimiter(YUNWU_RATE_LIMIT, burst=max(1, int(YUNWU_RATE_LIMIT)))
+# 所有线程共享的自适应并发控制器（限制同时进行中的请求数）
+_concurrency = AIMDController(GENERATION_CONCURRENCY, max_limit=MAX_GENERATION_CONCURRENCY, policy=BATCH_POLICY)
 
+_CONCURRENCY_GAUGE = gauge("yunwu_concurrency", "云雾API并发控制器的当前上限和进行中请求数", ["kind"])
 
-def call_yunwu_api(prompt: str, system_prompt: str = None) -> str:
-    """调用云雾API生成内容"""
-    url = f"{YUNWU_API_BASE}/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {YUNWU_API_KEY}",
-        "Content-Type": "application/json"
-    }
 
+def _collect_concurrency():
+    stats = _concurrency.stats()
+    _CONCURRENCY_GAUGE.set(stats["limit"], "limit")
+    _CONCURRENCY_GAUGE.set(stats["inflight"], "inflight")
+
+
+register_collector(_collect_concurrency)
+
+_CHAT_URL = f"{YUNWU_API_BASE}/chat/completions"
+_HEADERS = {
+    "Authorization": f"Bearer {YUNWU_API_KEY}",
+    "Content-Type": "application/json"
+}
+
+# 逐行候选模式下追加到提示词末尾的要求
+_CANDIDATES_SUFFIX = "\n\n请给出{n}个不同的候选标题，每行一个，不要编号，不要其他内容。"
+# 逐行候选模式下行首的编号或列表符号（其后须有空白，"2.4G"、"3.5mm" 这类开头不是编号）
+_LIST_MARKER = re.compile(r"^\s*(?:\d+[.)、:]|[-*•])\s+")
+# 模型输出中的 JSON 数组（可能被 ```json 代码块包裹）
+_JSON_ARRAY = re.compile(r"\[.*\]", re.S)
+
+
+def _chat_payload(prompt: str, system_prompt: str = None, n: int = 1, max_tokens: int = 200) -> Dict:
+    """构建 chat/completions 请求体"""
     messages = []
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
@@ -33,30 +67,154 @@ def call_yunwu_api(prompt: str, system_prompt: str = None) -> str:
         "model": MODEL_NAME,
         "messages": messages,
         "temperature": 0.7,
-        "max_tokens": 200
+        "max_tokens": max_tokens
     }
+    if n > 1:
+        payload["n"] = n
+    return payload
 
-    body = json.dumps(payload).encode('utf-8')
-    req = urllib.request.Request(url, data=body, headers=headers, method="POST")
 
-    try:
-        with urllib.request.urlopen(req, timeout=60, context=SSL_CONTEXT) as response:
-            result = json.loads(response.read().decode('utf-8'))
-    except urllib.error.HTTPError as e:
-        error_body = e.read().decode('utf-8')
-        raise Exception(f"HTTP {e.code}: {error_body}")
+def _clean_text(content: str) -> str:
+    """清理模型输出两端的空白和引号"""
+    return content.strip().strip('"').strip("'").strip()
+
 
+def _parse_completion(result: Dict) -> str:
+    """从 chat/completions 响应中取出清理后的文本"""
     if "choices" in result and len(result["choices"]) > 0:
         content = result["choices"][0]["message"]["content"]
-        content = content.strip().strip('"').strip("'").strip()
-        return content
+        return _clean_text(content)
     else:
         raise Exception(f"API调用失败: {result}")
 
 
-def generate_product_title(product: Dict) -> Optional[str]:
-    """使用大模型生成产品标题"""
-    prompt = TITLE_GENERATION_PROMPT.format(
+def _parse_candidates(result: Dict, n: int = 1, mode: str = TITLE_CANDIDATES_MODE) -> List[str]:
+    """取出所有候选标题：每个 choice 一个标题；逐行候选模式（mode 为 lines 且 n > 1）下
+    一个 choice 中逐行列出多个标题，此时才拆行并去掉行首编号"""
+    candidates = []
+    for choice in result.get("choices") or []:
+        content = (choice.get("message") or {}).get("content") or ""
+        if n <= 1 or mode != "lines":
+            content = _clean_text(content)
+            if content:
+                candidates.append(content)
+            continue
+        for line in content.splitlines():
+            line = _clean_text(_LIST_MARKER.sub("", line))
+            if line:
+                candidates.append(line)
+    if not candidates:
+        raise Exception(f"API调用失败: {result}")
+    return candidates
+
+
+def _candidates_payload(prompt: str, n: int) -> Dict:
+    """构建一次请求多个候选标题的请求体"""
+    if n <= 1:
+        return _chat_payload(prompt)
+    if TITLE_CANDIDATES_MODE == "lines":
+        # 不支持 n 参数的接口：让模型在一个回答里逐行给出多个标题
+        return _chat_payload(prompt + _CANDIDATES_SUFFIX.format(n=n), max_tokens=200 * n)
+    return _chat_payload(prompt, n=n, max_tokens=200)
+
+
+def _classify(error: Exception) -> str:
+    """把调用异常归类为并发控制器的结果类型"""
+    if isinstance(error, HTTPError):
+        if error.code == 429:
+            return THROTTLED
+        if error.code >= 500:
+            return OVERLOADED
+        return FAILED
+    if isinstance(error, (TimeoutError, socket.timeout, asyncio.TimeoutError, ConnectionError)):
+        return OVERLOADED
+    return FAILED
+
+
+def _post_chat(payload: Dict, timeout: float = 60, weight: int = 1) -> Dict:
+    """经过并发控制器和限速器发送 chat/completions 请求
+
+    weight 为本次请求包含的产品数，延迟按产品数折算后再与基线比较。
+    """
+    with trace.span("concurrency.wait", cat="sleep"):
+        _concurrency.acquire()
+    _rate_limiter.acquire()
+    start = time.perf_counter()
+    try:
+        result = get_client().request_json("POST", _CHAT_URL, headers=_HEADERS, data=payload, timeout=timeout)
+    except Exception as e:
+        outcome = _classify(e)
+        YUNWU_REQUEST_SECONDS.observe(time.perf_counter() - start, outcome)
+        _concurrency.release(outcome)
+        raise
+    latency = time.perf_counter() - start
+    YUNWU_REQUEST_SECONDS.observe(latency, OK)
+    _concurrency.release(OK, latency / weight)
+    return result
+
+
+async def _post_chat_async(client, payload: Dict, timeout: float = 60) -> Dict:
+    """异步版本的 _post_chat（client 为 AsyncHTTPClient）"""
+    with trace.span("concurrency.wait", cat="sleep"):
+        await _concurrency.acquire_async()
+    wait = _rate_limiter.reserve()
+    if wait > 0:
+        with trace.span("ratelimit.wait", cat="sleep", wait=round(wait, 3)):
+            await asyncio.sleep(wait)
+    start = time.perf_counter()
+    try:
+        result = await client.request_json("POST", _CHAT_URL, headers=_HEADERS, data=payload, timeout=timeout)
+    except Exception as e:
+        outcome = _classify(e)
+        YUNWU_REQUEST_SECONDS.observe(time.perf_counter() - start, outcome)
+        _concurrency.release(outcome)
+        raise
+    latency = time.perf_counter() - start
+    YUNWU_REQUEST_SECONDS.observe(latency, OK)
+    _concurrency.release(OK, latency)
+    return result
+
+
+def set_batch_policy(policy: str):
+    """设置多个批次同时处理时分配并发名额的策略（fair / sjf）"""
+    _concurrency.policy = policy if policy in POLICIES else FAIR
+
+
+def concurrency_stats() -> Dict:
+    """云雾API自适应并发控制器的当前状态"""
+    return _concurrency.stats()
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """生成失败后的重试等待：429 优先使用 Retry-After（不超过 YUNWU_BACKOFF_MAX），其余按带抖动的指数退避"""
+    if isinstance(error, HTTPError) and error.code == 429:
+        try:
+            retry_after = float(error.headers.get("retry-after"))
+        except (AttributeError, TypeError, ValueError):
+            retry_after = None
+        if retry_after is not None and not math.isnan(retry_after):
+            return min(max(0.0, retry_after), YUNWU_BACKOFF_MAX)
+    return min(random.uniform(1, 2) * 2 ** attempt, YUNWU_BACKOFF_MAX)
+
+
+def call_yunwu_api(prompt: str, system_prompt: str = None) -> str:
+    """调用云雾API生成内容"""
+    return _parse_completion(_post_chat(_chat_payload(prompt, system_prompt)))
+
+
+def call_yunwu_candidates(prompt: str, n: int = 1) -> List[str]:
+    """调用云雾API，一次请求返回最多 n 个候选结果"""
+    return _parse_candidates(_post_chat(_candidates_payload(prompt, n)), n)
+
+
+async def call_yunwu_candidates_async(client, prompt: str, n: int = 1) -> List[str]:
+    """调用云雾API，一次请求返回最多 n 个候选结果（异步版本，client 为 AsyncHTTPClient）"""
+    return _parse_candidates(await _post_chat_async(client, _candidates_payload(prompt, n)), n)
+
+
+def build_title_prompt(product: Dict) -> str:
+    """根据产品信息渲染标题生成提示词"""
+    return TITLE_GENERATION_PROMPT.format(
         original_title=product.get("original_title", "")[:500],
         bullets=product.get("bullets", "")[:1500],
         name_format=product.get("name_format", ""),
@@ -64,39 +222,213 @@ def generate_product_title(product: Dict) -> Optional[str]:
         size=product.get("size", "")
     )
 
+
+def _title_attempt(prompt: str, bullets: str = "",
+                   candidates: int = TITLE_CANDIDATES) -> Generator[Tuple[str, int], List[str], str]:
+    """单次生成尝试的流程，与IO无关：yield (提示词, 候选数)，接收候选标题列表，返回最终标题
+
+    同步和异步两种调用方式共用这一套校验与调整逻辑。
+    先在本地从候选中挑选合规标题（必要时本地修正长度），都不行才让模型重新调整。
+    """
+    titles = yield prompt, candidates
+
+    best = pick_best_title(titles, bullets)
+    if best:
+        return best
+
+    # 本地无法修正，用最接近合规的候选让模型重新调整
+    title = rank_titles(titles)[0]
+    title_len = len(title)
+    if title_len < TITLE_MIN_LENGTH:
+        adjust_prompt = f"这个标题太短了，只有{title_len}字符。请在保持原意的基础上扩展到100-110字符：\n{title}"
+    else:
+        adjust_prompt = f"这个标题太长了，有{title_len}字符。请精简到100-110字符，保留核心卖点：\n{title}"
+
+    titles = yield adjust_prompt, 1
+
+    best = pick_best_title(titles, bullets)
+    if best:
+        return best
+
+    # 如果还是不对，手动调整
+    title = rank_titles(titles)[0]
+    TITLE_FALLBACKS.inc("truncated" if len(title) > TITLE_MAX_LENGTH
+                        else "short" if len(title) < TITLE_MIN_LENGTH else "rule")
+    if len(title) > TITLE_MAX_LENGTH:
+        cut_pos = 107
+        while cut_pos > 0 and title[cut_pos] not in ' ,':
+            cut_pos -= 1
+        title = title[:cut_pos].strip(' ,')
+
+    return title
+
+
+def _cached_title(prompt: str) -> Optional[str]:
+    """查询标题缓存（忽略旧版本写入的不合规标题）"""
+    cache = get_title_cache()
+    title = cache.get(cache_key(prompt)) if cache else None
+    return title if title and not title_problems(title) else None
+
+
+def _remember_title(prompt: str, title: Optional[str]):
+    """把合规的标题写入缓存；兜底截断等不合规的标题不缓存，下次重新生成"""
+    cache = get_title_cache()
+    if cache and title and not title_problems(title):
+        cache.put(cache_key(prompt), title)
+
+
+def _run_attempt(prompt: str, bullets: str, call: Callable[[str, int], List[str]]) -> str:
+    """用同步调用函数驱动一次生成尝试"""
+    flow = _title_attempt(prompt, bullets)
+    request = next(flow)
+    first = True
+    while True:
+        start = time.perf_counter()
+        with trace.span("title.generate" if first else "title.adjust"):
+            response = call(*request)
+        if not first:
+            ADJUST_SECONDS.observe(time.perf_counter() - start)
+        first = False
+        try:
+            request = flow.send(response)
+        except StopIteration as stop:
+            return stop.value
+
+
+def generate_product_title(product: Dict) -> Optional[str]:
+    """使用大模型生成产品标题（先查缓存，输入未变化时不调用大模型）"""
+    prompt = build_title_prompt(product)
+    cached = _cached_title(prompt)
+    if cached:
+        return cached
+
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            title = call_yunwu_api(prompt)
-            title_len = len(title)
+            title = _run_attempt(prompt, product.get("bullets", ""), call_yunwu_candidates)
+            _remember_title(prompt, title)
+            return title
+        except Exception as e:
+            if attempt < max_retries - 1:
+                YUNWU_RETRIES.inc(_classify(e))
+                with trace.span("yunwu.backoff", cat="sleep", attempt=attempt + 1):
+                    time.sleep(_retry_delay(e, attempt))
+            else:
+                raise e
 
-            if 100 <= title_len <= 110:
-                return title
+    return None
 
-            # 如果长度不对，让模型重新调整
-            if title_len < 100:
-                adjust_prompt = f"这个标题太短了，只有{title_len}字符。请在保持原意的基础上扩展到100-110字符：\n{title}"
-            else:
-                adjust_prompt = f"这个标题太长了，有{title_len}字符。请精简到100-110字符，保留核心卖点：\n{title}"
 
-            title = call_yunwu_api(adjust_prompt)
-            title_len = len(title)
+def batch_limit(batch_size: int) -> int:
+    """合并请求实际可放入的产品数（受 max_tokens 预算限制）"""
+    return max(1, min(batch_size, TITLE_BATCH_MAX_TOKENS // TITLE_BATCH_TOKENS_PER_ITEM))
 
-            if 100 <= title_len <= 110:
-                return title
 
-            # 如果还是不对，手动调整
-            if title_len > 110:
-                cut_pos = 107
-                while cut_pos > 0 and title[cut_pos] not in ' ,':
-                    cut_pos -= 1
-                title = title[:cut_pos].strip(' ,')
+def _batch_ids(products: List[Dict]) -> List[str]:
+    """合并请求中每个产品的 id：优先用 ASIN，ASIN 缺失或重复时用序号"""
+    asins = [p.get("asin") for p in products]
+    return [
+        asin if asin and asins.count(asin) == 1 else f"#{i + 1}"
+        for i, asin in enumerate(asins)
+    ]
+
+
+def build_batch_prompt(products: List[Dict], ids: List[str]) -> str:
+    """把多个产品渲染进一个合并请求提示词"""
+    items = [
+        {
+            "id": item_id,
+            "original_title": p.get("original_title", "")[:500],
+            "bullets": p.get("bullets", "")[:1500],
+            "name_format": p.get("name_format", ""),
+            "weight": p.get("weight", ""),
+            "size": p.get("size", ""),
+        }
+        for item_id, p in zip(ids, products)
+    ]
+    return TITLE_BATCH_PROMPT.format(products=json.dumps(items, ensure_ascii=False))
+
+
+def _parse_batch_titles(content: str) -> Dict[str, str]:
+    """解析合并请求的输出，返回 {id: 标题}；格式不对的项直接忽略"""
+    match = _JSON_ARRAY.search(content)
+    if not match:
+        return {}
+    try:
+        items = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    titles = {}
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict) and isinstance(item.get("title"), str):
+            titles[str(item.get("id"))] = _clean_text(item["title"])
+    return titles
+
+
+def call_yunwu_batch(products: List[Dict], ids: List[str]) -> Dict[str, str]:
+    """一次请求生成多个产品的标题，返回 {id: 原始标题}"""
+    payload = _chat_payload(build_batch_prompt(products, ids),
+                            max_tokens=min(TITLE_BATCH_MAX_TOKENS, TITLE_BATCH_TOKENS_PER_ITEM * len(products)))
+    result = _post_chat(payload, timeout=120, weight=len(products))
+    return _parse_batch_titles(_parse_completion(result))
 
-            return title
 
+def generate_titles_batched(products: List[Dict]) -> List[Optional[str]]:
+    """合并请求生成一组产品的标题，返回与 products 一一对应的标题列表
+
+    先查缓存；未命中的产品放进一次请求，逐个在本地校验/修正。
+    合并请求失败、漏项或本地无法修正的产品返回 None，由调用方改走单产品流程。
+    """
+    prompts = [build_title_prompt(p) for p in products]
+    titles: List[Optional[str]] = [_cached_title(prompt) for prompt in prompts]
+    pending = [i for i, title in enumerate(titles) if not title]
+
+    if not pending:
+        return titles
+
+    ids = _batch_ids([products[i] for i in pending])
+    try:
+        raw = call_yunwu_batch([products[i] for i in pending], ids)
+    except Exception:
+        return titles
+    for i, item_id in zip(pending, ids):
+        if item_id in raw:
+            titles[i] = pick_best_title([raw[item_id]], products[i].get("bullets", ""))
+            # 缓存键与单产品流程一致，两种模式共用缓存
+            _remember_title(prompts[i], titles[i])
+    return titles
+
+
+async def generate_product_title_async(client, product: Dict) -> Optional[str]:
+    """使用大模型生成产品标题（异步版本，client 为 AsyncHTTPClient）"""
+    prompt = build_title_prompt(product)
+    cached = _cached_title(prompt)
+    if cached:
+        return cached
+
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            flow = _title_attempt(prompt, product.get("bullets", ""))
+            request = next(flow)
+            first = True
+            while True:
+                start = time.perf_counter()
+                with trace.span("title.generate" if first else "title.adjust"):
+                    response = await call_yunwu_candidates_async(client, *request)
+                if not first:
+                    ADJUST_SECONDS.observe(time.perf_counter() - start)
+                first = False
+                try:
+                    request = flow.send(response)
+                except StopIteration as stop:
+                    _remember_title(prompt, stop.value)
+                    return stop.value
         except Exception as e:
             if attempt < max_retries - 1:
-                time.sleep(2)
+                YUNWU_RETRIES.inc(_classify(e))
+                with trace.span("yunwu.backoff", cat="sleep", attempt=attempt + 1):
+                    await asyncio.sleep(_retry_delay(e, attempt))
             else:
                 raise e
 
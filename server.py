@@ -10,8 +10,8 @@
     # 自动监控模式（每60秒检查一次新触发的批次）
     python3 feishu_title_generator.py --watch
 
-    # 自定义检查间隔（秒）
-    python3 feishu_title_generator.py --watch --interval 30
+    # 自定义检查间隔（秒）；连续空闲时间隔逐步拉长到 --max-interval（默认600），有新批次后恢复
+    python3 feishu_title_generator.py --watch --interval 30 --max-interval 300
 
     # Webhook服务器模式（接收飞书自动化触发）
     python3 feishu_title_generator.py --webhook
@@ -19,6 +19,24 @@
     # 自定义Webhook端口（默认8080）
     python3 feishu_title_generator.py --webhook --port 9000
 
+    # Webhook 任务进入本地持久化队列，由 4 个工作线程处理（默认 2 个）
+    python3 feishu_title_generator.py --webhook --workers 4
+
+    # 自定义标题生成并发数（默认8，所有模式可用）
+    python3 feishu_title_generator.py --concurrency 16
+
+    # 使用 asyncio 流水线引擎（拉取/生成/写入三阶段重叠，所有模式可用）
+    python3 feishu_title_generator.py --engine async --concurrency 32
+
+    # 每 10 个产品合并为一次请求（thread 引擎，失败的产品自动改为单独生成）
+    python3 feishu_title_generator.py --batch-size 10
+
+    # 同时处理 4 个批次（共用云雾API并发上限，默认 3 个），批次间按剩余产品数最少优先分配（默认 fair 加权公平）
+    python3 feishu_title_generator.py --parallel 4 --policy sjf
+
+    # 为每个批次写出 Chrome trace 文件到 traces/（可在 https://ui.perfetto.dev 打开，也可设置 TRACE_DIR）
+    python3 feishu_title_generator.py --trace traces
+
 流程:
     1. 检查表3中 COZE RUN 被勾选且 COZE result 为空的批次（避免重复处理）
     2. 从表1获取该批次的产品数据
@@ -33,130 +51,46 @@ Webhook配置:
     - 请求体(JSON): {"batch": "{{批次号字段}}", "record_id": "{{record_id}}"}
 """
 
-import urllib.request
-import urllib.error
 import json
-import ssl
 import time
 import sys
 import threading
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from datetime import datetime
-from typing import List, Dict, Optional
-
-# ==================== 配置区域 ====================
-
-# 云雾API配置
-YUNWU_API_BASE = "https://yunwu.ai/v1"
-YUNWU_API_KEY = "sk-2hX6ze27mkjOWtpCbKeo9U056wR6qmN8DttWMRCvYyNluQ4C"
-MODEL_NAME = "gpt-5.1-2025-11-13"
-
-# 飞书配置
-FEISHU_APP_ID = "cli_a73bda7327399013"
-FEISHU_APP_SECRET = "IxStGQLRexU8XAKuu2uyAfmWQfHPVXlb"
-FEISHU_APP_TOKEN = "Xm6ubPCUZa2M7nsjalTczVW5nCf"
-
-# 表格ID
-TABLE_INPUT = "tblDgzsh7WQoCxZS"      # COZEINPUTD27-2 (表1: 产品数据采集)
-TABLE_OUTPUT = "tblECTD6VFMI2ofL"     # V1D27-2 (表2: 产品详情输出)
-TABLE_PROGRESS = "tblwDLoWyb6YlRZJ"   # Progress-D27-2 (表3: 批次进度)
-
-# SSL上下文（跳过验证，生产环境建议启用验证）
-SSL_CONTEXT = ssl.create_default_context()
-SSL_CONTEXT.check_hostname = False
-SSL_CONTEXT.verify_mode = ssl.CERT_NONE
-
-# ==================== 标题生成提示词 ====================
-
-TITLE_GENERATION_PROMPT = """你是一个专业的电商产品标题优化专家。请根据以下信息生成一个优化的英文产品标题。
-
-## 输入信息：
-- 原标题: {original_title}
-- 五点描述: {bullets}
-- Name Format: {name_format}
-- 产品重量: {weight}
-- 产品尺寸: {size}
-
-## 标题生成规则（必须严格遵守）：
-1. 使用 name format 的结构构建标题
-2. 标题总字符数（含空格）必须在 100-110 个字符之间（这是硬性要求！）
-3. 保留产品核心本质，突出独特卖点和优势
-4. 不包含任何品牌名（如 Nelko, Phomemo, NIIMBOT, TransOurDream, SUPVAN, JADENS 等）
-5. 保持英文，不翻译成中文
-6. 如果是单品，不添加 "1pack"
-7. 绝对不能使用以下词汇：battery, batteries, rechargeable
-
-## 输出要求：
-只输出优化后的标题，不要包含任何解释、引号或其他内容。
-确保字符数严格在 100-110 之间。
-
-现在请生成标题："""
-
-# ==================== HTTP 工具函数 ====================
-
-def http_request(url: str, method: str = "GET", headers: Dict = None, data: Dict = None, timeout: int = 60) -> Dict:
-    """发送HTTP请求"""
-    if headers is None:
-        headers = {}
-
-    body = None
-    if data:
-        body = json.dumps(data).encode('utf-8')
-        if 'Content-Type' not in headers:
-            headers['Content-Type'] = 'application/json'
-
-    req = urllib.request.Request(url, data=body, headers=headers, method=method)
-
-    try:
-        with urllib.request.urlopen(req, timeout=timeout, context=SSL_CONTEXT) as response:
-            return json.loads(response.read().decode('utf-8'))
-    except urllib.error.HTTPError as e:
-        error_body = e.read().decode('utf-8')
-        raise Exception(f"HTTP {e.code}: {error_body}")
+from typing import Callable, List, Dict, Optional, Tuple
+
+from lib.config import (
+    FEISHU_API_BASE, FEISHU_APP_TOKEN, TABLE_PROGRESS,
+    GENERATION_CONCURRENCY, TITLE_BATCH_SIZE, WEBHOOK_WORKERS, WATCH_MAX_INTERVAL,
+    BATCH_PARALLELISM, BATCH_POLICY,
+)
+from lib.http_client import get_client, format_stats
+from lib.feishu import (
+    http_request, get_feishu_token, get_triggered_batches, limiter_stats, count_products_by_batch, ProductStream
+)
+from lib.token_manager import get_token_manager
+from lib.engine import generate_titles, clamp_concurrency
+from lib.pipeline import run_pipeline
+from lib.cache import cache_stats
+from lib.yunwu import concurrency_stats, set_batch_policy
+from lib.concurrency import flow, POLICIES, FAIR
+from lib.scheduler import BatchScheduler
+from lib.progress import get_progress_reporter
+from lib.writer import StreamingWriter
+from lib.journal import resume_stream, record_generated, record_written, finish_batch, has_resume_state, item_key
+from lib.jobqueue import JobQueue, WorkerPool
+from lib.watch import ProgressWatcher
+from lib import metrics, trace
+
+# 运行参数（由命令行设置）
+_options = {"concurrency": GENERATION_CONCURRENCY, "engine": "thread", "batch_size": TITLE_BATCH_SIZE,
+            "parallel": BATCH_PARALLELISM, "policy": BATCH_POLICY}
 
 # ==================== 飞书 API 函数 ====================
 
-def get_feishu_token() -> str:
-    """获取飞书访问令牌"""
-    url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
-    data = {
-        "app_id": FEISHU_APP_ID,
-        "app_secret": FEISHU_APP_SECRET
-    }
-    result = http_request(url, method="POST", data=data)
-
-    if result.get("code") == 0:
-        return result["tenant_access_token"]
-    raise Exception(f"获取飞书token失败: {result}")
-
-def get_triggered_batches(token: str) -> List[Dict]:
-    """获取表3中 COZE RUN 被勾选且 COZE result 为空的批次（避免重复处理）"""
-    url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_PROGRESS}/records?page_size=100"
-    headers = {"Authorization": f"Bearer {token}"}
-
-    result = http_request(url, headers=headers)
-
-    batches = []
-    if result.get("code") == 0:
-        for item in result.get("data", {}).get("items", []):
-            fields = item.get("fields", {})
-            # 检查 COZE RUN 是否被勾选
-            coze_run = fields.get("COZE RUN")
-            # 检查 COZE result 是否为空（未处理）
-            coze_result = fields.get("COZE result")
-
-            if coze_run == True and (coze_result is None or coze_result == "" or coze_result.strip() == ""):
-                batch_num = fields.get("Batch#")
-                if batch_num:
-                    batches.append({
-                        "batch": batch_num,
-                        "record_id": item.get("record_id")
-                    })
-    return batches
-
 def update_batch_result(token: str, record_id: str, result_text: str) -> bool:
     """更新表3中批次的 COZE result 字段"""
-    url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_PROGRESS}/records/{record_id}"
+    url = f"{FEISHU_API_BASE}/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_PROGRESS}/records/{record_id}"
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
@@ -168,250 +102,231 @@ def update_batch_result(token: str, record_id: str, result_text: str) -> bool:
     }
 
     try:
-        result = http_request(url, method="PUT", headers=headers, data=data)
+        with trace.span("update_result"):
+            result = http_request(url, method="PUT", headers=headers, data=data)
         return result.get("code") == 0
     except Exception as e:
         print(f"    更新 COZE result 失败: {e}", flush=True)
         return False
 
-def get_products_by_batch(token: str, batch_num: str) -> List[Dict]:
-    """获取指定批次的所有产品"""
-    base_url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_INPUT}/records"
-    headers = {"Authorization": f"Bearer {token}"}
-
-    all_products = []
-    page_token = None
-
-    while True:
-        url = f"{base_url}?page_size=100"
-        if page_token:
-            url += f"&page_token={page_token}"
-
-        result = http_request(url, headers=headers)
-
-        if result.get("code") != 0:
-            print(f"    警告: API返回错误 {result}", flush=True)
-            break
-
-        for item in result.get("data", {}).get("items", []):
-            fields = item.get("fields", {})
-            # 检查批次号
-            if fields.get("Batch #") == batch_num:
-                # 提取ASIN
-                asin_field = fields.get("ASIN", {})
-                asin = asin_field.get("text", "") if isinstance(asin_field, dict) else str(asin_field)
-
-                product = {
-                    "record_id": item.get("record_id"),
-                    "asin": asin,
-                    "original_title": fields.get("商品标题", ""),
-                    "bullets": fields.get("产品卖点", ""),
-                    "name_format": fields.get("name format", ""),
-                    "weight": fields.get("重量_1", ""),
-                    "size": fields.get("体积_1", ""),
-                }
-                all_products.append(product)
-
-        # 检查是否有更多页
-        if not result.get("data", {}).get("has_more"):
-            break
-        page_token = result.get("data", {}).get("page_token")
-
-    return all_products
-
-def write_to_output_table(token: str, records: List[Dict]) -> int:
-    """批量写入产品标题到表2"""
-    url = f"https://open.feishu.cn/open-apis/bitable/v1/apps/{FEISHU_APP_TOKEN}/tables/{TABLE_OUTPUT}/records/batch_create"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-
-    success_count = 0
-
-    # 每次最多写入100条
-    for i in range(0, len(records), 100):
-        batch = records[i:i+100]
-        batch_data = {
-            "records": [
-                {
-                    "fields": {
-                        "ASIN": r["asin"],
-                        "Product_Name": r["product_name"]
-                    }
-                }
-                for r in batch
-            ]
-        }
-
-        try:
-            result = http_request(url, method="POST", headers=headers, data=batch_data)
-            if result.get("code") == 0:
-                success_count += len(batch)
-            else:
-                print(f"    写入失败: {result}", flush=True)
-        except Exception as e:
-            print(f"    写入异常: {e}", flush=True)
-
-        time.sleep(0.5)  # 避免请求过快
-
-    return success_count
-
-# ==================== 云雾 API 大模型调用 ====================
-
-def call_yunwu_api(prompt: str, system_prompt: str = None) -> str:
-    """调用云雾API生成内容"""
-    url = f"{YUNWU_API_BASE}/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {YUNWU_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
-    messages = []
-    if system_prompt:
-        messages.append({"role": "system", "content": system_prompt})
-    messages.append({"role": "user", "content": prompt})
-
-    payload = {
-        "model": MODEL_NAME,
-        "messages": messages,
-        "temperature": 0.7,
-        "max_tokens": 200
-    }
-
-    result = http_request(url, method="POST", headers=headers, data=payload, timeout=60)
+# ==================== 主流程 ====================
 
-    if "choices" in result and len(result["choices"]) > 0:
-        content = result["choices"][0]["message"]["content"]
-        # 清理可能的引号和空白
-        content = content.strip().strip('"').strip("'").strip()
-        return content
+def _log_outcome(outcome: Dict, total: Optional[int] = None, batch: Optional[str] = None):
+    """输出单个产品的生成结果（多个批次同时处理时带上批次号）"""
+    prefix = f"    [{outcome['index']:3d}/{total or '?'}] {outcome['asin']}..."
+    if batch:
+        prefix = f"    <{batch}>" + prefix[3:]
+    if outcome["title"]:
+        print(f"{prefix} ✓ [{len(outcome['title']):3d}字符] {outcome['latency']:.1f}s", flush=True)
     else:
-        raise Exception(f"API调用失败: {result}")
-
-def generate_product_title(product: Dict) -> Optional[str]:
-    """使用大模型生成产品标题"""
-    # 构建提示词
-    prompt = TITLE_GENERATION_PROMPT.format(
-        original_title=product.get("original_title", "")[:500],
-        bullets=product.get("bullets", "")[:1500],
-        name_format=product.get("name_format", ""),
-        weight=product.get("weight", ""),
-        size=product.get("size", "")
-    )
-
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            title = call_yunwu_api(prompt)
-            title_len = len(title)
-
-            # 验证标题长度
-            if 100 <= title_len <= 110:
-                return title
-
-            # 如果长度不对，让模型重新调整
-            if title_len < 100:
-                adjust_prompt = f"这个标题太短了，只有{title_len}字符。请在保持原意的基础上扩展到100-110字符：\n{title}"
-            else:
-                adjust_prompt = f"这个标题太长了，有{title_len}字符。请精简到100-110字符，保留核心卖点：\n{title}"
-
-            title = call_yunwu_api(adjust_prompt)
-            title_len = len(title)
-
-            if 100 <= title_len <= 110:
-                return title
+        print(f"{prefix} ✗ {outcome['error']}", flush=True)
+
+def _print_cache_stats():
+    """输出标题缓存命中情况"""
+    stats = cache_stats()
+    if stats:
+        print(f"    [缓存] 命中 {stats['hits']} (跳过的大模型调用) | 未命中 {stats['misses']} | "
+              f"命中率 {stats['hit_rate']:.0%}", flush=True)
+
+def _print_concurrency_stats():
+    """输出云雾API自适应并发上限"""
+    stats = concurrency_stats()
+    print(f"    [并发] 云雾API上限 {stats['limit']} (最近调整: {stats['reason']}) | "
+          f"限流 {stats['throttled']} | 过载 {stats['overloaded']} | 延迟突增 {stats['latency_spikes']}", flush=True)
+
+def _log_batch(batch_num: str) -> Optional[str]:
+    """多个批次同时处理时日志需要标明批次"""
+    return batch_num if _options["parallel"] > 1 else None
+
+def process_single_batch_async(token: str, batch_num: str, record_id: str) -> bool:
+    """用 asyncio 流水线处理单个批次（拉取、生成、写入三阶段重叠）"""
+    concurrency = _options["concurrency"]
+    print(f"\n[处理] 批次: {batch_num} (asyncio 流水线, 并发 {concurrency})", flush=True)
+    print("-" * 50, flush=True)
 
-            # 如果还是不对，手动调整
-            if title_len > 110:
-                # 截断到最后一个空格
-                cut_pos = 107
-                while cut_pos > 0 and title[cut_pos] not in ' ,':
-                    cut_pos -= 1
-                title = title[:cut_pos].strip(' ,')
+    # 流水线边拉取边生成，进度的总数需要先单独查询
+    reporter = get_progress_reporter()
+    if reporter.enabled:
+        try:
+            reporter.start(record_id, count_products_by_batch(token, batch_num))
+        except Exception:
+            pass
 
-            return title
+    def on_result(outcome: Dict):
+        _log_outcome(outcome, batch=_log_batch(batch_num))
+        reporter.advance(record_id)
 
-        except Exception as e:
-            print(f"        重试 {attempt + 1}/{max_retries}: {e}", flush=True)
-            time.sleep(2)
-
-    return None
+    started = time.perf_counter()
+    try:
+        with trace.span("pipeline", concurrency=concurrency):
+            summary = run_pipeline(token, batch_num, concurrency=concurrency, on_result=on_result)
+    except Exception as e:
+        print(f"    ✗ 处理失败: {e}", flush=True)
+        reporter.finish(record_id)
+        update_batch_result(token, record_id, f"失败: {str(e)[:50]}")
+        return False
+    reporter.finish(record_id)
+    metrics.record_batch(batch_num, summary["total"], time.perf_counter() - started)
+
+    print(f"    ✓ 产品 {summary['total']} | 生成 {summary['generated']} | 写入 {summary['written']}", flush=True)
+    for error in summary["write_errors"]:
+        print(f"    ✗ 写入失败: {error}", flush=True)
+    _print_cache_stats()
+    _print_concurrency_stats()
+
+    if summary["error"]:
+        # 拉取中途失败时 total 只是已取到的产品数，不能标记为已处理，否则该批次不会再被触发
+        print(f"    ✗ {summary['error']}", flush=True)
+        update_batch_result(token, record_id, f"失败: {summary['error'][:50]}")
+        return False
+    if summary["total"] == 0:
+        update_batch_result(token, record_id, "无产品数据")
+        return False
+    if summary["generated"] == 0:
+        update_batch_result(token, record_id, "生成失败")
+        return False
 
-# ==================== 主流程 ====================
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    result_text = f"已处理 {summary['written']}/{summary['total']} | {timestamp}"
+    if update_batch_result(token, record_id, result_text):
+        print(f"    ✓ 已标记批次为已处理", flush=True)
+    return True
 
 def process_single_batch(token: str, batch_num: str, record_id: str) -> bool:
-    """处理单个批次（供webhook调用）"""
+    """处理单个批次（供webhook调用）；开启追踪时为该批次写出 trace 文件"""
+    engine = _options["engine"]
+    if engine == "async" and has_resume_state(batch_num):
+        # asyncio 流水线不读写断点日志，直接处理会重复生成并覆盖上次的进度
+        print(f"    ⚠ 批次 {batch_num} 有未完成的断点日志，改用线程引擎从断点继续", flush=True)
+        engine = "thread"
+    with trace.trace_batch(batch_num, engine=engine) as recorder:
+        if engine == "async":
+            ok = process_single_batch_async(token, batch_num, record_id)
+        else:
+            ok = process_single_batch_thread(token, batch_num, record_id)
+    if recorder is not None and recorder.path:
+        print(f"    [追踪] {recorder.path}", flush=True)
+    return ok
+
+def process_single_batch_thread(token: str, batch_num: str, record_id: str) -> bool:
+    """用线程池处理单个批次（生成的同时在后台写入表2）"""
     print(f"\n[处理] 批次: {batch_num}", flush=True)
     print("-" * 50, flush=True)
+    started = time.perf_counter()
 
-    # 获取该批次的产品
+    # 逐页拉取该批次的产品：第一页返回即开始生成，后台同时预取下一页
     print(f"    获取产品数据...", flush=True)
+    products = ProductStream(token, batch_num)
     try:
-        products = get_products_by_batch(token, batch_num)
-        print(f"    ✓ 获取到 {len(products)} 个产品", flush=True)
+        with trace.span("fetch_products"):
+            product_count = products.total
+        print(f"    ✓ 共 {product_count} 个产品", flush=True)
     except Exception as e:
         print(f"    ✗ 获取产品失败: {e}", flush=True)
         update_batch_result(token, record_id, f"失败: {str(e)[:50]}")
         return False
 
-    if not products:
+    if not product_count:
         print("    没有找到该批次的产品", flush=True)
         update_batch_result(token, record_id, "无产品数据")
         return False
 
-    # 为每个产品生成标题
-    print(f"\n    生成产品标题...", flush=True)
-    results = []
-    for i, product in enumerate(products):
-        asin = product.get('asin', 'Unknown')
-        print(f"    [{i+1:3d}/{len(products)}] {asin}...", end=" ", flush=True)
+    # 按断点日志跳过上次已写入的产品，已生成未写入的直接写入
+    with trace.span("resume"):
+        plan, pending = resume_stream(batch_num, products)
+    total = max(0, product_count - plan["written"] - len(plan["generated"]))
+    if plan["written"] or plan["generated"]:
+        print(f"    ↻ 从断点继续: 已写入 {plan['written']} | 已生成待写入 {len(plan['generated'])} | "
+              f"待生成 {total}", flush=True)
+
+    # 并发生成标题（日志按输入顺序输出），每个标题生成后立即交给后台写入表2
+    concurrency = _options["concurrency"]
+    print(f"\n    生成产品标题并写入表2 (并发 {concurrency})...", flush=True)
+    writer = StreamingWriter(token, on_written=lambda records: record_written(batch_num, records))
+    for record in plan["generated"]:
+        writer.add(record["asin"], record["product_name"], record["item"])
+    # 处理中定时把进度写入表3
+    reporter = get_progress_reporter()
+    reporter.start(record_id, product_count, plan["written"] + len(plan["generated"]))
+    titled = []
+
+    def on_complete(outcome: Dict):
+        # 每个产品完成时立即记录并交给写入线程，不等排在前面的慢产品
+        reporter.advance(record_id)
+        if outcome["title"]:
+            titled.append(outcome["asin"])
+            record_generated(batch_num, item_key(outcome), outcome["title"])
+            writer.add(outcome["asin"], outcome["title"], item_key(outcome))
+
+    def on_result(outcome: Dict):
+        _log_outcome(outcome, total, _log_batch(batch_num))
+
+    fetch_error = None
+    try:
+        with trace.span("generate", products=total, concurrency=concurrency):
+            generate_titles(pending, concurrency=concurrency, batch_size=_options["batch_size"],
+                            on_result=on_result, on_complete=on_complete)
+    except Exception as e:
+        # 拉取中途失败：已取到的产品照常生成并写入，断点日志保留供下次继续
+        fetch_error = e
+    finally:
+        with trace.span("writer.close"):
+            success = plan["written"] + writer.close()
+        reporter.finish(record_id)
+    metrics.record_batch(batch_num, product_count, time.perf_counter() - started)
+    generated = plan["written"] + len(plan["generated"]) + len(titled)
+
+    if fetch_error is not None:
+        print(f"\n    ✗ 获取产品中断: {fetch_error}（已写入 {success}/{product_count}）", flush=True)
+        update_batch_result(token, record_id, f"失败: {str(fetch_error)[:50]}")
+        return False
 
-        try:
-            new_title = generate_product_title(product)
-            if new_title:
-                results.append({
-                    "asin": asin,
-                    "product_name": new_title
-                })
-                print(f"✓ [{len(new_title):3d}字符]", flush=True)
-            else:
-                print("✗ 生成失败", flush=True)
-        except Exception as e:
-            print(f"✗ 错误: {e}", flush=True)
+    if not generated:
+        print("\n    没有成功生成的标题", flush=True)
+        update_batch_result(token, record_id, "生成失败")
+        return False
 
-        time.sleep(1)  # 避免API限流
+    # 全部写入后清除断点日志，否则保留供下次继续
+    if success == product_count:
+        finish_batch(batch_num)
 
-    # 写入表2
-    if results:
-        print(f"\n[写入] 写入表2 Product_Name字段...", flush=True)
-        try:
-            success = write_to_output_table(token, results)
-            print(f"    ✓ 成功写入 {success}/{len(results)} 条记录", flush=True)
+    print(f"\n[写入] ✓ 成功写入 {success}/{generated} 条记录 ({writer.flushes} 次写入)", flush=True)
+    for error in writer.errors:
+        print(f"    ✗ 写入失败: {error}", flush=True)
+    if writer.unwritten:
+        print(f"    ✗ 重试后仍有 {len(writer.unwritten)} 条未写入（断点日志保留，下次处理该批次时写入）", flush=True)
+    print(f"    [连接] {format_stats(get_client().stats())}", flush=True)
+    _print_cache_stats()
+    _print_concurrency_stats()
 
-            # 更新批次状态为已处理
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            result_text = f"已处理 {success}/{len(products)} | {timestamp}"
-            if update_batch_result(token, record_id, result_text):
-                print(f"    ✓ 已标记批次为已处理", flush=True)
+    # 更新批次状态为已处理
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    result_text = f"已处理 {success}/{product_count} | {timestamp}"
+    if update_batch_result(token, record_id, result_text):
+        print(f"    ✓ 已标记批次为已处理", flush=True)
 
-            return True
+    return True
 
-        except Exception as e:
-            print(f"    ✗ 写入失败: {e}", flush=True)
-            update_batch_result(token, record_id, f"写入失败: {str(e)[:30]}")
-            return False
-    else:
-        print("\n    没有成功生成的标题", flush=True)
-        update_batch_result(token, record_id, "生成失败")
-        return False
+def _new_scheduler() -> BatchScheduler:
+    """创建批次调度器（sjf 策略下先查询各批次产品数决定开始顺序）"""
+    def size_of(batch_info: Dict) -> int:
+        return count_products_by_batch(get_feishu_token(), batch_info["batch"])
+
+    def process(batch_info: Dict) -> bool:
+        return process_single_batch(get_feishu_token(), batch_info["batch"], batch_info["record_id"])
+
+    return BatchScheduler(process, parallel=_options["parallel"], policy=_options["policy"], size_of=size_of)
 
-def process_batches(token: str) -> int:
-    """处理所有待处理的批次，返回处理的批次数"""
+def process_batches(token: str, find: Callable[[str], List[Dict]] = get_triggered_batches,
+                    scheduler: Optional[BatchScheduler] = None) -> int:
+    """处理所有待处理的批次，返回处理成功的批次数（find 用于查找触发的批次，监控模式传入增量检查）
+
+    传入 scheduler 时只把新批次加入调度器（不等待完成），返回新加入的批次数。
+    """
     # 检查触发的批次
     print("\n[检查] 检测新触发的批次 (COZE RUN=True 且 COZE result为空)...", flush=True)
     try:
-        batches = get_triggered_batches(token)
+        batches = find(token)
         if not batches:
             print("    没有需要处理的新批次", flush=True)
             return 0
@@ -420,34 +335,115 @@ def process_batches(token: str) -> int:
         print(f"    ✗ 检测失败: {e}", flush=True)
         return 0
 
-    processed_count = 0
-
-    # 处理每个批次
-    for batch_info in batches:
-        if process_single_batch(token, batch_info["batch"], batch_info["record_id"]):
-            processed_count += 1
+    if scheduler is not None:
+        added = scheduler.submit(batches)
+        if added < len(batches):
+            print(f"    {len(batches) - added} 个批次已在处理中", flush=True)
+        return added
 
-    return processed_count
+    # 同时处理多个批次，共用云雾API并发上限
+    scheduler = _new_scheduler()
+    if len(batches) > 1 and scheduler.parallel > 1:
+        print(f"    同时处理 {min(len(batches), scheduler.parallel)} 个批次 (策略 {scheduler.policy})", flush=True)
+    scheduler.submit(batches)
+    scheduler.wait()
+    return scheduler.stats()["succeeded"]
 
 # ==================== Webhook 服务器 ====================
 
-# 全局变量用于webhook服务器
-_webhook_token = None
-_webhook_token_time = 0
-
-def get_or_refresh_token() -> str:
-    """获取或刷新飞书token（带缓存）"""
-    global _webhook_token, _webhook_token_time
-    current_time = time.time()
+# Webhook 任务队列和工作线程（run_webhook 中创建）
+_job_queue: Optional[JobQueue] = None
+_worker_pool: Optional[WorkerPool] = None
+
+# Webhook 任务队列各状态的任务数（抓取 /metrics 时更新）
+_QUEUE_JOBS = metrics.gauge("webhook_jobs", "Webhook 任务队列中各状态的任务数", ["status"])
+
+def _collect_queue():
+    if _job_queue:
+        for status, count in _job_queue.stats().items():
+            _QUEUE_JOBS.set(count, status)
+        _QUEUE_JOBS.set(_worker_pool.stats()["busy"], "busy")
+
+# 进程内正在排队/处理的批次 {批次号: 状态}，同一批次的重复触发合并到已有任务
+_active_batches: Dict[str, Dict] = {}
+_active_lock = threading.Lock()
+
+def _register_batch(batch_num: str, record_id: Optional[str]) -> Tuple[Dict, bool]:
+    """登记一次触发，返回 (批次状态, 是否新建任务)"""
+    with _active_lock:
+        entry = _active_batches.get(batch_num)
+        if entry:
+            entry["triggers"] += 1
+            return dict(entry), False
+        # 队列按批次号去重，进程重启前遗留的同批次任务也不会重复加入
+        job_id = _job_queue.enqueue({"batch": batch_num, "record_id": record_id}, key=batch_num)
+        entry = {
+            "batch": batch_num,
+            "job_id": job_id,
+            "state": "queued",
+            "triggers": 1,
+            "queued_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "started_at": None,
+        }
+        _active_batches[batch_num] = entry
+        return dict(entry), True
+
+def _set_batch_state(batch_num: str, state: Optional[str]):
+    """更新批次状态，state 为 None 时移出登记表"""
+    with _active_lock:
+        if state is None:
+            _active_batches.pop(batch_num, None)
+            return
+        entry = _active_batches.setdefault(batch_num, {
+            "batch": batch_num, "job_id": None, "triggers": 0, "queued_at": None, "started_at": None,
+        })
+        entry["state"] = state
+        if state == "running":
+            entry["started_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def process_webhook_job(job: Dict):
+    """处理队列中的一个webhook任务（抛出异常时由队列按退避重试）"""
+    batch_num = job["batch"]
+    token = get_feishu_token()
+
+    # 如果没有record_id，需要从表3查找
+    record_id = job.get("record_id")
+    if not record_id:
+        print(f"[Webhook] 未提供record_id，从表3查找批次 {batch_num}...", flush=True)
+        for b in get_triggered_batches(token):
+            if b["batch"] == batch_num:
+                record_id = b["record_id"]
+                break
+
+        if not record_id:
+            print(f"[Webhook] ✗ 未找到批次 {batch_num} 的记录", flush=True)
+            return
 
-    # Token 有效期2小时，每1.5小时刷新一次
-    if _webhook_token is None or (current_time - _webhook_token_time) > 5400:
-        print("[Token] 获取/刷新飞书访问令牌...", flush=True)
-        _webhook_token = get_feishu_token()
-        _webhook_token_time = current_time
-        print("[Token] ✓ Token获取成功", flush=True)
+    # 处理批次（与其他工作线程中的批次公平分配云雾API并发名额）
+    with flow(batch_num):
+        ok = process_single_batch(token, batch_num, record_id)
+    if not ok:
+        # 交给队列按退避重试，超过最大次数后标记为 dead
+        raise RuntimeError(f"批次 {batch_num} 处理失败")
+    print(f"[Webhook] ✓ 批次 {batch_num} 处理完成", flush=True)
 
-    return _webhook_token
+def _handle_job(job: Dict):
+    _set_batch_state(job["batch"], "running")
+    try:
+        process_webhook_job(job)
+    except Exception as e:
+        print(f"[Webhook] ✗ 处理异常: {e}", flush=True)
+        raise
+
+def _job_done(job: Dict, status: str):
+    """队列状态更新后同步批次登记表"""
+    if status == "queued":
+        print(f"[Webhook] 批次 {job['batch']} 稍后重试", flush=True)
+        _set_batch_state(job["batch"], "retrying")
+    else:
+        if status == "dead":
+            print(f"[Webhook] ✗ 批次 {job['batch']} 重试次数已用完，放弃处理", flush=True)
+        _set_batch_state(job["batch"], None)
 
 class WebhookHandler(BaseHTTPRequestHandler):
     """处理飞书自动化发送的Webhook请求"""
@@ -458,11 +454,35 @@ class WebhookHandler(BaseHTTPRequestHandler):
 
     def do_GET(self):
         """处理GET请求（健康检查）"""
-        if self.path == "/health" or self.path == "/":
+        if self.path == "/status":
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            with _active_lock:
+                batches = [dict(entry) for entry in _active_batches.values()]
+            response = {"batches": batches, "queue": _job_queue.stats() if _job_queue else {}}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+        elif self.path == "/metrics":
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", metrics.CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == "/health" or self.path == "/":
             self.send_response(200)
             self.send_header("Content-Type", "application/json")
             self.end_headers()
-            response = {"status": "ok", "message": "Webhook服务器运行中"}
+            response = {
+                "status": "ok",
+                "message": "Webhook服务器运行中",
+                "http": get_client().stats(),
+                "cache": cache_stats(),
+                "token": get_token_manager().stats(),
+                "feishu_limits": limiter_stats(),
+                "yunwu": concurrency_stats(),
+                "queue": dict(_job_queue.stats(), **_worker_pool.stats()) if _worker_pool else {}
+            }
             self.wfile.write(json.dumps(response).encode('utf-8'))
         else:
             self.send_response(404)
@@ -503,45 +523,21 @@ class WebhookHandler(BaseHTTPRequestHandler):
                 print("[Webhook] 未提供批次号，跳过处理", flush=True)
                 return
 
-            # 立即返回响应（避免飞书超时）
+            # 写入任务队列后立即返回（避免飞书超时），由工作线程处理；
+            # 该批次已在排队或处理中时不再新建任务，返回已有任务的状态
+            entry, created = _register_batch(batch_num, record_id)
             self.send_response(200)
             self.send_header("Content-Type", "application/json")
             self.end_headers()
-            response = {"status": "accepted", "batch": batch_num, "message": "任务已接收，正在后台处理"}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
-
-            # 在后台线程处理批次
-            def process_in_background():
-                try:
-                    token = get_or_refresh_token()
-
-                    # 如果没有record_id，需要从表3查找
-                    actual_record_id = record_id
-                    if not actual_record_id:
-                        print(f"[Webhook] 未提供record_id，从表3查找批次 {batch_num}...", flush=True)
-                        batches = get_triggered_batches(token)
-                        for b in batches:
-                            if b["batch"] == batch_num:
-                                actual_record_id = b["record_id"]
-                                break
-
-                        if not actual_record_id:
-                            print(f"[Webhook] ✗ 未找到批次 {batch_num} 的记录", flush=True)
-                            return
-
-                    # 处理批次
-                    success = process_single_batch(token, batch_num, actual_record_id)
-                    if success:
-                        print(f"[Webhook] ✓ 批次 {batch_num} 处理完成", flush=True)
-                    else:
-                        print(f"[Webhook] ✗ 批次 {batch_num} 处理失败", flush=True)
-
-                except Exception as e:
-                    print(f"[Webhook] ✗ 处理异常: {e}", flush=True)
-
-            thread = threading.Thread(target=process_in_background)
-            thread.daemon = True
-            thread.start()
+            if created:
+                response = {"status": "accepted", "batch": batch_num, "job_id": entry["job_id"],
+                            "message": "任务已加入队列"}
+                print(f"[Webhook] 批次 {batch_num} 已加入队列 (任务 #{entry['job_id']})", flush=True)
+            else:
+                response = dict(entry, status="in_progress", message="该批次已在处理中，本次触发已合并")
+                print(f"[Webhook] 批次 {batch_num} 已在{entry['state']}，合并重复触发 (第 {entry['triggers']} 次)",
+                      flush=True)
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
 
         except Exception as e:
             print(f"[Webhook] ✗ 请求处理错误: {e}", flush=True)
@@ -551,8 +547,9 @@ class WebhookHandler(BaseHTTPRequestHandler):
             response = {"status": "error", "message": str(e)}
             self.wfile.write(json.dumps(response).encode('utf-8'))
 
-def run_webhook(port: int = 8080):
+def run_webhook(port: int = 8080, workers: int = WEBHOOK_WORKERS):
     """启动Webhook服务器"""
+    global _job_queue, _worker_pool
     print("=" * 70, flush=True)
     print("  飞书多维表格产品标题生成器", flush=True)
     print("  使用云雾API (gpt-5.1-2025-11-13)", flush=True)
@@ -560,19 +557,28 @@ def run_webhook(port: int = 8080):
     print("  提示: 按 Ctrl+C 停止", flush=True)
     print("=" * 70, flush=True)
 
-    # 预先获取token
+    # 预先获取token，之后由后台线程在过期前刷新
     print("\n[初始化] 获取飞书访问令牌...", flush=True)
     try:
-        get_or_refresh_token()
+        get_feishu_token()
     except Exception as e:
         print(f"    ✗ 失败: {e}", flush=True)
         print("    服务器仍将启动，token将在首次请求时获取", flush=True)
+    get_token_manager().start_background_refresh()
+
+    # 启动队列工作线程（重启前未完成的任务会在租约过期后重新处理）
+    _job_queue = JobQueue()
+    _worker_pool = WorkerPool(_job_queue, _handle_job, workers=workers, on_done=_job_done).start()
+    metrics.register_collector(_collect_queue)
+    print(f"\n[队列] {_job_queue.path} | 工作线程 {workers} | 待处理 {_job_queue.stats()}", flush=True)
 
     # 启动服务器
-    server = HTTPServer(('0.0.0.0', port), WebhookHandler)
+    server = ThreadingHTTPServer(('0.0.0.0', port), WebhookHandler)
+    server.daemon_threads = True
     print(f"\n[服务器] Webhook服务器已启动", flush=True)
     print(f"    地址: http://0.0.0.0:{port}", flush=True)
     print(f"    健康检查: GET http://localhost:{port}/health", flush=True)
+    print(f"    批次状态: GET http://localhost:{port}/status", flush=True)
     print(f"    Webhook端点: POST http://localhost:{port}/webhook", flush=True)
     print(f"\n[配置] 飞书多维表格自动化配置:", flush=True)
     print(f"    URL: http://你的服务器IP:{port}/webhook", flush=True)
@@ -584,6 +590,7 @@ def run_webhook(port: int = 8080):
         server.serve_forever()
     except KeyboardInterrupt:
         print("\n\n[停止] 用户中断，关闭服务器", flush=True)
+        _worker_pool.stop()
         server.shutdown()
 
 def run_once():
@@ -610,78 +617,93 @@ def run_once():
     print(f"  处理完成! 共处理 {processed} 个批次", flush=True)
     print("=" * 70, flush=True)
 
-def run_watch(interval: int = 60):
-    """监控模式：定时检查新触发的批次"""
+def run_watch(interval: int = 60, max_interval: float = WATCH_MAX_INTERVAL):
+    """监控模式：定时检查新触发的批次（增量查询，空闲时逐步拉长检查间隔）"""
+    watcher = ProgressWatcher(interval, max_interval=max_interval)
     print("=" * 70, flush=True)
     print("  飞书多维表格产品标题生成器", flush=True)
     print("  使用云雾API (gpt-5.1-2025-11-13)", flush=True)
-    print(f"  模式: 自动监控 (每 {interval} 秒检查一次)", flush=True)
+    print(f"  模式: 自动监控 (每 {interval} 秒检查一次，空闲时最长 {watcher.max_interval:.0f} 秒)", flush=True)
     print("  提示: 按 Ctrl+C 停止", flush=True)
     print("=" * 70, flush=True)
 
-    token = None
-    token_time = 0
+    # token 由后台线程在过期前刷新
+    get_token_manager().start_background_refresh()
+    # 批次在后台并行处理，处理期间继续检查新触发的批次
+    scheduler = _new_scheduler()
 
     while True:
         try:
-            current_time = time.time()
-
-            # Token 有效期2小时，每1.5小时刷新一次
-            if token is None or (current_time - token_time) > 5400:
-                print("\n[初始化] 获取/刷新飞书访问令牌...", flush=True)
-                try:
-                    token = get_feishu_token()
-                    token_time = current_time
-                    print(f"    ✓ Token获取成功", flush=True)
-                except Exception as e:
-                    print(f"    ✗ 失败: {e}", flush=True)
-                    time.sleep(interval)
-                    continue
+            try:
+                token = get_feishu_token()
+            except Exception as e:
+                print(f"\n[Token] ✗ 获取飞书访问令牌失败: {e}", flush=True)
+                time.sleep(watcher.interval)
+                continue
 
             # 处理批次
-            processed = process_batches(token)
+            added = process_batches(token, find=watcher.poll, scheduler=scheduler)
 
-            if processed > 0:
-                print(f"\n[完成] 本轮处理了 {processed} 个批次", flush=True)
+            if added > 0:
+                print(f"\n[调度] 本轮加入 {added} 个批次", flush=True)
+            active = scheduler.active()
+            if active:
+                print(f"[调度] 处理中/排队: {active}", flush=True)
 
             # 等待下一次检查
-            print(f"\n[等待] {interval}秒后再次检查...", flush=True)
-            time.sleep(interval)
+            print(f"\n[等待] {watcher.interval:.0f}秒后再次检查...", flush=True)
+            time.sleep(watcher.interval)
 
         except KeyboardInterrupt:
             print("\n\n[停止] 用户中断，退出监控模式", flush=True)
             break
         except Exception as e:
             print(f"\n[错误] {e}", flush=True)
-            print(f"[等待] {interval}秒后重试...", flush=True)
-            time.sleep(interval)
+            print(f"[等待] {watcher.interval:.0f}秒后重试...", flush=True)
+            time.sleep(watcher.interval)
+
+def _get_arg(args: List[str], name: str, default: int) -> int:
+    """读取形如 --name value 的整数参数，缺失或非法时返回默认值"""
+    if name in args:
+        idx = args.index(name)
+        if idx + 1 < len(args):
+            try:
+                return int(args[idx + 1])
+            except ValueError:
+                pass
+    return default
 
 def main():
     """主入口"""
     args = sys.argv[1:]
 
+    # 标题生成并发数（所有模式通用）
+    _options["concurrency"] = clamp_concurrency(_get_arg(args, "--concurrency", GENERATION_CONCURRENCY))
+    # 处理引擎: thread(线程池，默认) 或 async(asyncio 流水线)
+    if "--engine" in args and args.index("--engine") + 1 < len(args):
+        _options["engine"] = "async" if args[args.index("--engine") + 1] == "async" else "thread"
+    # 每次请求合并的产品数（仅 thread 引擎，1 表示不合并）
+    _options["batch_size"] = max(1, _get_arg(args, "--batch-size", TITLE_BATCH_SIZE))
+    # 同时处理的批次数和批次间分配并发名额的策略
+    _options["parallel"] = max(1, _get_arg(args, "--parallel", BATCH_PARALLELISM))
+    if "--policy" in args and args.index("--policy") + 1 < len(args):
+        _options["policy"] = args[args.index("--policy") + 1]
+    _options["policy"] = _options["policy"] if _options["policy"] in POLICIES else FAIR
+    set_batch_policy(_options["policy"])
+    # 批次追踪文件目录（覆盖 TRACE_DIR）
+    if "--trace" in args and args.index("--trace") + 1 < len(args):
+        trace.set_trace_dir(args[args.index("--trace") + 1])
+
     if "--webhook" in args:
         # Webhook服务器模式
-        port = 8080  # 默认端口
-        if "--port" in args:
-            idx = args.index("--port")
-            if idx + 1 < len(args):
-                try:
-                    port = int(args[idx + 1])
-                except ValueError:
-                    pass
-        run_webhook(port)
+        port = _get_arg(args, "--port", 8080)  # 默认端口
+        workers = max(1, _get_arg(args, "--workers", WEBHOOK_WORKERS))  # 队列工作线程数
+        run_webhook(port, workers)
     elif "--watch" in args or "-w" in args:
         # 监控模式
-        interval = 60  # 默认60秒
-        if "--interval" in args:
-            idx = args.index("--interval")
-            if idx + 1 < len(args):
-                try:
-                    interval = int(args[idx + 1])
-                except ValueError:
-                    pass
-        run_watch(interval)
+        interval = _get_arg(args, "--interval", 60)  # 默认60秒
+        max_interval = _get_arg(args, "--max-interval", int(WATCH_MAX_INTERVAL))  # 空闲时的最长间隔
+        run_watch(interval, max_interval)
     else:
         # 单次运行模式
         run_once()